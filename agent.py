@@ -2,18 +2,21 @@
 import os
 import json
 import re
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError, as_completed
 from typing import List, Dict, Any, Optional
 from datetime import datetime
 from dotenv import load_dotenv
 from llama_index.core.tools import FunctionTool, QueryEngineTool
 from llama_index.core.agent import ReActAgent
-from llama_index.core import Settings
-from llama_index.llms.gemini import Gemini
-from llama_index.embeddings.huggingface import HuggingFaceEmbedding
+from llama_index.core import QueryBundle, Settings
+from llama_index.core.schema import MetadataMode
 
 # Local Imports
 from retrieval import setup_query_engine
 import config
+import research_events
+from resources import get_embed_model, get_llm, llm_configured
 
 # Load environment variables
 load_dotenv()
@@ -138,6 +141,7 @@ def document_synthesis_search(query: str, query_engine) -> str:
     """
     Enhanced local document search that synthesizes information from multiple sources.
     """
+    research_events.emit("step", tool="document_synthesizer", input=query)
     try:
         # Get initial results
         response = query_engine.query(query)
@@ -166,10 +170,154 @@ def document_synthesis_search(query: str, query_engine) -> str:
     except Exception as e:
         return f"Error in document synthesis search: {str(e)}"
 
+def run_subtasks(subtasks: List[Dict[str, str]], fn, on_result=None) -> List[Dict[str, Any]]:
+    """
+    Runs fn(subtask_query) for every sub-task, fanning out up to SUBTASK_CONCURRENCY
+    at a time. Returns one {"result", "error"} entry per sub-task, in sub-task order.
+    on_result(index, outcome) is called from this thread as each sub-task finishes.
+    A cancelled job stops before its next sub-task starts.
+    """
+    outcomes = [{"result": None, "error": None} for _ in subtasks]
+    workers = max(1, min(config.SUBTASK_CONCURRENCY, len(subtasks)))
+    on_result = on_result or (lambda index, outcome: None)
+    
+    def run_one(query):
+        research_events.checkpoint()
+        return fn(query)
+    
+    if workers == 1:
+        for i, (outcome, subtask) in enumerate(zip(outcomes, subtasks)):
+            try:
+                outcome["result"] = run_one(subtask['query'])
+            except Exception as e:
+                outcome["error"] = str(e)
+            on_result(i, outcome)
+        return outcomes
+    
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="subtask")
+    try:
+        # Each sub-task runs in a copy of this context, so progress events reach the caller's sink
+        futures = {
+            executor.submit(contextvars.copy_context().run, run_one, subtask['query']): i
+            for i, subtask in enumerate(subtasks)
+        }
+        try:
+            for future in as_completed(futures, timeout=config.SUBTASK_TIMEOUT):
+                i = futures[future]
+                try:
+                    outcomes[i]["result"] = future.result()
+                except Exception as e:
+                    outcomes[i]["error"] = str(e)
+                on_result(i, outcomes[i])
+        except FutureTimeoutError:
+            for future, i in futures.items():
+                if not future.done():
+                    future.cancel()
+                    outcomes[i]["error"] = f"timed out after {config.SUBTASK_TIMEOUT:.0f}s"
+                    on_result(i, outcomes[i])
+    finally:
+        # Don't wait on stragglers that already timed out
+        executor.shutdown(wait=False, cancel_futures=True)
+    
+    return outcomes
+
+_SECTION_HEADING = re.compile(r"^#+\s*(?:Section\s+(\d+)|(Synthesis))\b[^\n]*$", re.MULTILINE | re.IGNORECASE)
+
+def merge_retrieved_nodes(result_lists: List[Optional[list]], max_sources: int = None) -> List[Dict[str, Any]]:
+    """
+    Merges the nodes retrieved for each sub-query, keeping one entry per node (or per
+    identical text) with the sub-queries it answers. Lists are interleaved rank by
+    rank, so every sub-query is represented when max_sources cuts the list.
+    """
+    max_sources = max_sources or config.SYNTHESIS_MAX_SOURCES
+    merged, by_text = {}, {}
+    depth = max((len(nodes) for nodes in result_lists if nodes), default=0)
+    for rank in range(depth):
+        for section, nodes in enumerate(result_lists):
+            if not nodes or rank >= len(nodes):
+                continue
+            n = nodes[rank]
+            text = n.node.get_content(metadata_mode=MetadataMode.NONE).strip()
+            key = by_text.setdefault(text, n.node.node_id)
+            entry = merged.get(key)
+            if entry is None:
+                if len(merged) >= max_sources:
+                    continue
+                merged[key] = entry = {"node": n, "text": text, "sections": []}
+            if section not in entry["sections"]:
+                entry["sections"].append(section)
+    return list(merged.values())
+
+def build_synthesis_prompt(query: str, subtasks: List[Dict[str, str]], sources: List[Dict[str, Any]]) -> str:
+    """One prompt that asks for every section of the report at once."""
+    prompt = f"You are writing a research report on: {query}\n\n"
+    prompt += "Sources (cite them as [S1], [S2], ...):\n\n"
+    for i, source in enumerate(sources, 1):
+        name = source["node"].node.metadata.get("file_name", "unknown")
+        sections = ", ".join(str(s + 1) for s in sorted(source["sections"]))
+        prompt += f"[S{i}] ({name}; retrieved for section {sections})\n{source['text']}\n\n"
+    prompt += "Answer each section below using only the sources. Start every answer with its heading exactly as written, "
+    prompt += "and say so if the sources do not cover a section.\n\n"
+    for i, subtask in enumerate(subtasks, 1):
+        prompt += f"## Section {i}: {subtask['query']}\n"
+    prompt += "## Synthesis\n(2-4 sentences connecting the sections)\n"
+    return prompt
+
+def parse_synthesis(text: str, count: int):
+    """Splits the structured answer into per-section findings and the closing synthesis."""
+    findings, synthesis = [None] * count, None
+    headings = list(_SECTION_HEADING.finditer(text))
+    for heading, following in zip(headings, headings[1:] + [None]):
+        body = text[heading.end():following.start() if following else len(text)].strip()
+        if heading.group(2):
+            synthesis = body
+        elif 1 <= int(heading.group(1)) <= count:
+            findings[int(heading.group(1)) - 1] = body
+    if not headings:
+        # Unstructured answer: keep it whole rather than losing it
+        synthesis = text.strip()
+    return findings, synthesis
+
+def single_synthesis_research(query: str, subtasks: List[Dict[str, str]], query_engine, llm, on_result=None,
+                              on_retrieved=None):
+    """
+    Retrieves context for every sub-query (no LLM calls), merges the nodes and answers
+    all sections with one LLM call. Returns run_subtasks-style outcomes holding the
+    findings text, and the closing synthesis. on_retrieved(index, outcome) is called
+    as each sub-query's retrieval finishes, before the LLM call.
+    """
+    retrievals = run_subtasks(subtasks, lambda q: query_engine.retrieve(QueryBundle(q)), on_result=on_retrieved)
+    sources = merge_retrieved_nodes([r["result"] for r in retrievals])
+    retrieved = sum(len(r["result"] or []) for r in retrievals)
+    print(f"Single synthesis: {len(subtasks)} sub-queries, {retrieved} retrieved node(s), {len(sources)} unique source(s).")
+
+    outcomes = [{"result": None, "error": r["error"]} for r in retrievals]
+    synthesis = None
+    if sources:
+        try:
+            answer = llm.complete(build_synthesis_prompt(query, subtasks, sources)).text
+            findings, synthesis = parse_synthesis(answer, len(subtasks))
+        except Exception as e:
+            findings = [None] * len(subtasks)
+            for outcome in outcomes:
+                outcome["error"] = outcome["error"] or f"synthesis failed: {e}"
+        for outcome, text in zip(outcomes, findings):
+            if outcome["error"] is None:
+                outcome["result"] = text or "See the research synthesis below."
+    else:
+        for outcome in outcomes:
+            outcome["error"] = outcome["error"] or "no relevant documents found"
+    for i, outcome in enumerate(outcomes):
+        if on_result:
+            on_result(i, outcome)
+    return outcomes, synthesis
+
 def deep_research_analysis(query: str, query_engine) -> str:
     """
     Performs deep research analysis by decomposing queries and synthesizing results.
+    In single_synthesis mode all sections are answered by one LLM call.
     """
+    research_events.emit("step", tool="deep_researcher", input=query)
     decomposer = QueryDecomposer()
     subtasks = decomposer.decompose_query(query)
     
@@ -182,43 +330,74 @@ def deep_research_analysis(query: str, query_engine) -> str:
         research_report += f"{i}. {step}\n"
     research_report += "\n"
     
+    research_events.emit("strategy", query=query, steps=decomposer.reasoning_steps, total=len(subtasks))
+    
+    def publish(index, outcome):
+        subtask = subtasks[index]
+        research_events.emit(
+            "subtask",
+            index=index + 1,
+            total=len(subtasks),
+            type=subtask['type'].replace('_', ' ').title(),
+            query=subtask['query'],
+            findings=outcome['result'] if outcome['error'] is None else None,
+            error=outcome['error'],
+        )
+    
+    def publish_retrieval(index, outcome):
+        research_events.emit(
+            "retrieved",
+            index=index + 1,
+            total=len(subtasks),
+            query=subtasks[index]['query'],
+            sources=len(outcome['result'] or []),
+            error=outcome['error'],
+        )
+    
+    synthesis = None
+    if config.DEEP_RESEARCH_MODE == "single_synthesis" and Settings.llm is not None:
+        outcomes, synthesis = single_synthesis_research(query, subtasks, query_engine, Settings.llm,
+                                                        on_result=publish, on_retrieved=publish_retrieval)
+    else:
+        # Run the sub-task queries concurrently; the report keeps sub-task order
+        outcomes = run_subtasks(subtasks, lambda q: query_engine.query(q).response, on_result=publish)
+    
     # Process each subtask
     research_report += "Detailed Analysis:\n\n"
-    for i, subtask in enumerate(subtasks, 1):
+    for i, (subtask, outcome) in enumerate(zip(subtasks, outcomes), 1):
         research_report += f"Sub-Analysis {i}: {subtask['type'].replace('_', ' ').title()}\n"
         research_report += f"Reasoning: {subtask['reasoning']}\n"
         research_report += f"Query: {subtask['query']}\n\n"
         
-        # Get results for this subtask
-        try:
-            result = query_engine.query(subtask['query'])
-            research_report += f"Findings:\n{result.response}\n\n"
-        except Exception as e:
-            research_report += f"Error processing sub-task: {str(e)}\n\n"
+        if outcome["error"] is None:
+            research_report += f"Findings:\n{outcome['result']}\n\n"
+        else:
+            research_report += f"Error processing sub-task: {outcome['error']}\n\n"
         
         research_report += "-" * 30 + "\n\n"
     
     # Add synthesis conclusion
     research_report += "Research Synthesis:\n"
+    if synthesis:
+        research_report += f"{synthesis}\n\n"
     research_report += f"Completed comprehensive analysis of '{query}' through {len(subtasks)} sub-analyses. "
     research_report += "This systematic approach ensures thorough coverage of the topic from multiple angles.\n"
     
     return research_report
 
-def setup_agent():
+def setup_research_tools():
     """
-    Sets up a ReAct Agent with Gemini LLM and enhanced research capabilities.
+    Configures Gemini and the query engine and builds the research tools agents share.
     """
     
     # Verify API key
-    api_key = os.getenv("GOOGLE_API_KEY")
-    if not api_key:
+    if not llm_configured():
         raise ValueError("GOOGLE_API_KEY not found in environment variables")
     
     # Configure Settings with Gemini
     if not hasattr(Settings, 'llm') or Settings.llm is None:
         try:
-            Settings.llm = Gemini(model=config.LLM_MODEL, api_key=api_key)
+            Settings.llm = get_llm()
             print("✅ Using Gemini LLM")
         except Exception as e:
             print(f"⚠️  Gemini not available: {e}")
@@ -226,7 +405,7 @@ def setup_agent():
             Settings.llm = None
     
     if not hasattr(Settings, 'embed_model') or Settings.embed_model is None:
-        Settings.embed_model = HuggingFaceEmbedding(model_name=config.EMBED_MODEL)
+        Settings.embed_model = get_embed_model()
         print("✅ Using local HuggingFace embeddings")
     
     print("Setting up local query engine...")
@@ -253,6 +432,7 @@ def setup_agent():
     # Create query refinement tool
     def query_refinement_suggestions(original_query: str) -> str:
         """Suggests follow-up questions and refinements for deeper exploration."""
+        research_events.emit("step", tool="query_refiner", input=original_query)
         suggestions = f"Follow-up Research Suggestions for: '{original_query}'\n\n"
         
         # Generate refinement suggestions based on query analysis
@@ -278,9 +458,13 @@ def setup_agent():
         description="Suggests follow-up questions and refinements to help users dig deeper into research topics. Use when users want to explore a topic more thoroughly."
     )
    
-    # Create the agent with enhanced tools
-    tools = [document_synthesis_tool, deep_research_tool, query_refinement_tool]
-    
+    return [document_synthesis_tool, deep_research_tool, query_refinement_tool]
+
+def create_agent(tools):
+    """
+    Creates a research agent over shared tools. Each agent keeps its own chat memory,
+    so concurrent conversations need one agent each.
+    """
     if Settings.llm is not None:
         agent = ReActAgent.from_tools(
             tools=tools,
@@ -312,6 +496,12 @@ def setup_agent():
    
     return agent
 
+def setup_agent():
+    """
+    Sets up a ReAct Agent with Gemini LLM and enhanced research capabilities.
+    """
+    return create_agent(setup_research_tools())
+
 class ResearchExporter:
     """Handles exporting research results in various formats."""
     
@@ -7,11 +7,14 @@ Converts the CLI application to a web API for Render deployment
 import os
 import json
 import logging
+import threading
 from datetime import datetime
-from flask import Flask, request, jsonify, render_template_string
+from flask import Flask, request, jsonify, g, render_template_string, Response, stream_with_context
 from flask_cors import CORS
 from dotenv import load_dotenv
 
+from startup import StartupTracker
+
 # Load environment variables
 load_dotenv()
 
@@ -24,8 +27,19 @@ CORS(app)
 
 # Global variables for agent and session
 agent = None
-research_session = None
+agent_mode = None  # 'full' or 'fallback'
+# Builds one agent per session in full mode; the stateless fallback agent is shared
+agent_factory = None
+# Serialises the shared agent for requests without a session
+agent_lock = threading.Lock()
+session_store = None
+job_manager = None
+job_manager_lock = threading.Lock()
+
+# Cookie carrying the browser's research session ID
+SESSION_COOKIE = 'research_session_id'
 exporter = None
+startup = StartupTracker(['settings', 'agent', 'exporter', 'query_embedding'])
 
 # HTML template for the web interface
 HTML_TEMPLATE = """
@@ -54,6 +68,11 @@ HTML_TEMPLATE = """
         .features { background: #f8f9fa; padding: 15px; border-radius: 5px; margin: 20px 0; }
         .features h3 { margin-top: 0; color: #495057; }
         .features ul { margin: 0; padding-left: 20px; }
+        .progress { margin-bottom: 20px; }
+        .step { color: #555; font-size: 14px; padding: 4px 0; }
+        .subtask { background: #f8f9fa; padding: 15px; border-radius: 5px; border-left: 4px solid #95a5a6; margin: 10px 0; white-space: pre-wrap; }
+        .subtask.complete { border-left-color: #27ae60; }
+        .subtask.failed { border-left-color: #e74c3c; }
     </style>
 </head>
 <body>
@@ -119,31 +138,97 @@ HTML_TEMPLATE = """
 
             setLoading(true);
             
+            const responseDiv = document.getElementById('response');
+            responseDiv.innerHTML = '<div id="progress" class="progress"><div class="loading">🧠 Analyzing and researching...</div></div>' +
+                '<div id="answer" class="response" style="display: none"></div>';
+            
             try {
-                const response = await fetch('/research', {
+                const response = await fetch('/research/stream', {
                     method: 'POST',
                     headers: { 'Content-Type': 'application/json' },
                     body: JSON.stringify({ query: query })
                 });
 
-                const data = await response.json();
-                const responseDiv = document.getElementById('response');
+                if (!response.ok) {
+                    const data = await response.json();
+                    throw new Error(data.error);
+                }
 
-                if (response.ok) {
-                    responseDiv.innerHTML = `<div class="response">${data.response}</div>`;
-                    showStatus('Research completed successfully!');
-                } else {
-                    responseDiv.innerHTML = `<div class="response error">Error: ${data.error}</div>`;
-                    showStatus('Research failed. Please try again.', 'error');
+                // Read Server-Sent Events off the response body as they arrive
+                const reader = response.body.getReader();
+                const decoder = new TextDecoder();
+                let buffer = '';
+                while (true) {
+                    const { value, done } = await reader.read();
+                    if (done) break;
+                    buffer += decoder.decode(value, { stream: true });
+                    let boundary;
+                    while ((boundary = buffer.indexOf('\\n\\n')) !== -1) {
+                        handleEvent(buffer.slice(0, boundary));
+                        buffer = buffer.slice(boundary + 2);
+                    }
                 }
             } catch (error) {
-                document.getElementById('response').innerHTML = `<div class="response error">Network error: ${error.message}</div>`;
-                showStatus('Network error occurred.', 'error');
+                document.getElementById('answer').style.display = 'block';
+                document.getElementById('answer').className = 'response error';
+                document.getElementById('answer').textContent = `Error: ${error.message}`;
+                showStatus('Research failed. Please try again.', 'error');
             } finally {
                 setLoading(false);
             }
         }
 
+        function handleEvent(message) {
+            let event = 'message', data = '';
+            for (const line of message.split('\\n')) {
+                if (line.startsWith('event: ')) event = line.slice(7);
+                else if (line.startsWith('data: ')) data += line.slice(6);
+            }
+            if (!data) return;  // keepalive comment
+            data = JSON.parse(data);
+
+            const progress = document.getElementById('progress');
+            const answer = document.getElementById('answer');
+            const addLine = (className, text) => {
+                const div = document.createElement('div');
+                div.className = className;
+                div.textContent = text;
+                progress.appendChild(div);
+                return div;
+            };
+
+            if (event === 'started') {
+                progress.innerHTML = '';
+                addLine('step', '🧠 Analyzing and researching...');
+            } else if (event === 'step') {
+                addLine('step', `🛠️ ${data.tool}: ${data.input}`);
+            } else if (event === 'strategy') {
+                addLine('step', `🧭 Research strategy: ${data.total} sub-analyses`);
+                // Placeholders keep sub-analyses in order even when they finish out of order
+                for (let i = 1; i <= data.total; i++) {
+                    addLine('subtask', `Sub-Analysis ${i}: pending...`).id = `subtask-${i}`;
+                }
+            } else if (event === 'retrieved') {
+                const card = document.getElementById(`subtask-${data.index}`) || addLine('subtask', '');
+                card.textContent = `Sub-Analysis ${data.index}: ` + (data.error ? 'retrieval failed, waiting for synthesis...'
+                    : `${data.sources} source(s) retrieved, waiting for synthesis...`);
+            } else if (event === 'subtask') {
+                const card = document.getElementById(`subtask-${data.index}`) || addLine('subtask', '');
+                card.className = data.error ? 'subtask failed' : 'subtask complete';
+                card.textContent = `Sub-Analysis ${data.index}: ${data.type}\\nQuery: ${data.query}\\n\\n` +
+                    (data.error ? `Error: ${data.error}` : data.findings);
+            } else if (event === 'token') {
+                answer.style.display = 'block';
+                answer.textContent += data.text;
+            } else if (event === 'done') {
+                answer.style.display = 'block';
+                answer.textContent = data.response;
+                showStatus('Research completed successfully!');
+            } else if (event === 'error') {
+                throw new Error(data.error);
+            }
+        }
+
         async function exportSession() {
             try {
                 const response = await fetch('/export', { method: 'POST' });
@@ -183,6 +268,10 @@ HTML_TEMPLATE = """
                 
                 if (response.ok && data.status === 'healthy') {
                     showStatus('System ready! You can start asking research questions.', 'success');
+                } else if (data.status === 'initializing') {
+                    const fallback = data.details.serving === 'fallback' ? ' Answers come from the fallback agent until then.' : '';
+                    showStatus(`Warming up (${data.startup.progress} stages done).${fallback}`, 'error');
+                    setTimeout(checkSystemStatus, 3000);
                 } else {
                     showStatus(`System status: ${data.message}. ${data.details ? 'Check diagnostics for details.' : ''}`, 'error');
                 }
@@ -197,14 +286,14 @@ HTML_TEMPLATE = """
 
 def initialize_agent():
     """Initialize the research agent and related components"""
-    global agent, research_session, exporter
+    global agent, agent_mode, agent_factory, session_store, exporter
     
     try:
         logger.info("Starting agent initialization...")
         
         # Check environment variables first
-        api_key = os.getenv("GOOGLE_API_KEY")
-        if not api_key:
+        from resources import llm_configured
+        if not llm_configured():
             logger.error("GOOGLE_API_KEY not found in environment variables")
             return initialize_fallback_agent()
         
@@ -216,34 +305,48 @@ def initialize_agent():
             os.makedirs('./storage', exist_ok=True)
             
         # Check if knowledge base exists
-        if not os.path.exists('./storage/docstore.json'):
+        from sqlite_docstore import docstore_exists
+        if not docstore_exists():
             logger.warning("Knowledge base not found. Using fallback mode.")
             return initialize_fallback_agent()
         
         # Import and initialize settings
-        logger.info("Initializing settings...")
-        from main import initialize_settings
-        initialize_settings()
-        logger.info("✅ Settings initialized")
+        with startup.stage('settings'):
+            logger.info("Initializing settings...")
+            from main import initialize_settings
+            initialize_settings()
+            logger.info("✅ Settings initialized")
         
-        # Import agent components
-        logger.info("Importing agent components...")
-        from agent import setup_agent, ResearchExporter, create_research_session
-        import config
-        logger.info("✅ Agent components imported")
+        # Setup agent: loads the embedding model, Qdrant, the docstore and the retrievers
+        with startup.stage('agent'):
+            logger.info("Importing agent components...")
+            from agent import setup_research_tools, create_agent, ResearchExporter, create_research_session
+            from sessions import SessionStore
+            import config
+            logger.info("✅ Agent components imported")
+            
+            logger.info("Setting up agent...")
+            tools = setup_research_tools()
+            full_agent = create_agent(tools)
+            logger.info("✅ Agent setup complete")
         
-        # Setup agent and session
-        logger.info("Setting up agent...")
-        agent = setup_agent()
-        logger.info("✅ Agent setup complete")
+        with startup.stage('exporter'):
+            logger.info("Setting up exporter...")
+            full_exporter = ResearchExporter(config.RESEARCH_OUTPUT_DIR)
+            logger.info("✅ Exporter setup complete")
         
-        logger.info("Creating research session...")
-        research_session = create_research_session()
-        logger.info("✅ Research session created")
+        with startup.stage('query_embedding'):
+            _warm_query_embedding()
         
-        logger.info("Setting up exporter...")
-        exporter = ResearchExporter(config.RESEARCH_OUTPUT_DIR)
-        logger.info("✅ Exporter setup complete")
+        # Swap in the full agent; sessions started on the fallback agent are kept
+        if session_store is None:
+            session_store = SessionStore(create_research_session)
+        else:
+            session_store.factory = create_research_session
+        exporter = full_exporter
+        agent = full_agent
+        agent_factory = lambda: create_agent(tools)
+        agent_mode = 'full'
         
         logger.info("✅ Deep Research Agent initialized successfully")
         return True
@@ -258,16 +361,21 @@ def initialize_agent():
 
 def initialize_fallback_agent():
     """Initialize fallback agent when main agent fails"""
-    global agent, research_session, exporter
+    global agent, agent_mode, agent_factory, session_store, exporter
     
     try:
         logger.info("Initializing fallback agent...")
-        from fallback_agent import FallbackAgent, create_fallback_session, FallbackExporter
-        import config
-        
-        agent = FallbackAgent()
-        research_session = create_fallback_session()
-        exporter = FallbackExporter(config.RESEARCH_OUTPUT_DIR)
+        with startup.stage('fallback_agent'):
+            from fallback_agent import FallbackAgent, create_fallback_session, FallbackExporter
+            from sessions import SessionStore
+            import config
+            
+            if session_store is None:
+                session_store = SessionStore(create_fallback_session)
+            exporter = FallbackExporter(config.RESEARCH_OUTPUT_DIR)
+            agent = FallbackAgent()
+            agent_factory = None
+            agent_mode = 'fallback'
         
         logger.info("✅ Fallback agent initialized successfully")
         return True
@@ -276,6 +384,33 @@ def initialize_fallback_agent():
         logger.error(f"Failed to initialize fallback agent: {e}")
         return False
 
+def _warm_query_embedding():
+    """Embeds a dummy query so the first real request doesn't pay for lazy model setup"""
+    from llama_index.core import Settings
+    embed_model = Settings.embed_model
+    # Bypass the embedding cache, which would answer without touching the model
+    embed_model = getattr(embed_model, 'inner', embed_model)
+    embed_model.get_query_embedding("warm-up query")
+    logger.info("✅ Query embedding warmed up")
+
+def warm_up():
+    """Runs all startup stages and records the outcome for /health and /ready"""
+    ready = initialize_agent() and agent_mode == 'full'
+    startup.complete(ready)
+    if not ready:
+        logger.warning("Agent initialization failed. Some features may not be available.")
+    return ready
+
+def start_background_warm_up():
+    """Starts warm-up in a daemon thread so the port opens immediately"""
+    import config
+    if config.SERVE_FALLBACK_DURING_WARMUP:
+        # Answer from the fallback agent until the full agent is ready
+        initialize_fallback_agent()
+    thread = threading.Thread(target=warm_up, name="warm-up", daemon=True)
+    thread.start()
+    return thread
+
 @app.route('/')
 def index():
     """Serve the main web interface"""
@@ -283,28 +418,38 @@ def index():
 
 @app.route('/health')
 def health():
-    """Health check endpoint for Render"""
-    if agent is None:
-        return jsonify({
-            'status': 'initializing', 
-            'message': 'Agent is starting up',
-            'details': {
-                'agent_ready': False,
-                'api_key_present': bool(os.getenv("GOOGLE_API_KEY")),
-                'storage_exists': os.path.exists('./storage'),
-                'docstore_exists': os.path.exists('./storage/docstore.json')
-            }
-        }), 503
+    """Liveness check for Render: answers as soon as the port is open, with warm-up progress"""
+    if agent_mode == 'full':
+        status, message = 'healthy', 'Deep Research Agent is running'
+    elif startup.finished:
+        status, message = 'degraded', 'Running in fallback mode'
+    else:
+        status, message = 'initializing', 'Agent is warming up'
     return jsonify({
-        'status': 'healthy', 
-        'message': 'Deep Research Agent is running',
+        'status': status,
+        'message': message,
         'details': {
-            'agent_ready': True,
-            'session_active': research_session is not None,
-            'exporter_ready': exporter is not None
-        }
+            'agent_ready': agent_mode == 'full',
+            'serving': agent_mode,
+            'session_active': session_store is not None,
+            'exporter_ready': exporter is not None,
+            'api_key_present': bool(os.getenv("GOOGLE_API_KEY")),
+            'storage_exists': os.path.exists('./storage'),
+            'docstore_exists': _docstore_exists()
+        },
+        'startup': startup.report()
     })
 
+@app.route('/ready')
+def ready():
+    """Readiness check: 200 once warm-up has finished and an agent is serving"""
+    is_ready = startup.finished and agent is not None
+    return jsonify({
+        'ready': is_ready,
+        'serving': agent_mode,
+        'startup': startup.report()
+    }), 200 if is_ready else 503
+
 @app.route('/debug')
 def debug():
     """Debug endpoint to check system status"""
@@ -316,21 +461,60 @@ def debug():
         },
         'filesystem': {
             'storage_exists': os.path.exists('./storage'),
-            'docstore_exists': os.path.exists('./storage/docstore.json'),
+            'docstore_exists': _docstore_exists(),
             'data_exists': os.path.exists('./data'),
             'current_directory': os.getcwd()
         },
         'agent_status': {
             'agent_initialized': agent is not None,
-            'session_active': research_session is not None,
+            'session_active': session_store is not None,
             'exporter_ready': exporter is not None
-        }
+        },
+        'sessions': session_store.stats() if session_store else None,
+        'resources': _resource_stats(),
+        'semantic_cache': _semantic_cache_stats(),
+        'llm_cache': _llm_cache_stats(),
+        'context_packing': _context_packing_stats()
     })
 
+def _docstore_exists():
+    """Whether ingestion has written a docstore, JSON or SQLite"""
+    from sqlite_docstore import docstore_exists
+    return docstore_exists()
+
+def _resource_stats():
+    """Load time and memory of the shared models and clients"""
+    from resources import resource_stats
+    return resource_stats()
+
+def _semantic_cache_stats():
+    """Hit/miss counters of the semantic answer cache, if it has been loaded."""
+    try:
+        from semantic_cache import cache_stats
+        return cache_stats()
+    except ImportError:
+        return None
+
+def _llm_cache_stats():
+    """Hit rate and size of the persistent LLM completion cache, if it has been opened."""
+    try:
+        from llm_cache import llm_cache_stats
+        return llm_cache_stats()
+    except ImportError:
+        return None
+
+def _context_packing_stats():
+    """Prompt tokens saved by context packing across the queries served so far."""
+    try:
+        from context_packing import packing_stats
+        return packing_stats()
+    except ImportError:
+        return None
+
 @app.route('/research', methods=['POST'])
 def research():
     """Process research queries"""
-    global agent, research_session
+    global agent
     
     if agent is None:
         return jsonify({'error': 'Agent not initialized. Please wait for startup to complete.'}), 503
@@ -346,17 +530,13 @@ def research():
         logger.info(f"Processing query: {query[:100]}...")
         start_time = datetime.now()
         
-        response = agent.chat(query)
+        session = _current_session()
+        session_agent, lock = _session_agent(session)
+        with lock:
+            response = session_agent.chat(query)
         
         # Log the interaction
-        if research_session:
-            research_session['queries'].append(query)
-            research_session['responses'].append(str(response))
-            research_session['reasoning_steps'].append({
-                'timestamp': datetime.now().isoformat(),
-                'query': query,
-                'processing_time': str(datetime.now() - start_time)
-            })
+        _log_interaction(session, query, str(response), start_time)
         
         return jsonify({
             'response': str(response),
@@ -368,16 +548,196 @@ def research():
         logger.error(f"Error processing query: {e}")
         return jsonify({'error': f'Error processing research query: {str(e)}'}), 500
 
+def _current_session():
+    """The calling client's research session, from the X-Session-ID header or session cookie"""
+    if session_store is None:
+        return None
+    session_id = request.headers.get('X-Session-ID') or request.cookies.get(SESSION_COOKIE)
+    session = session_store.get_or_create(session_id)
+    g.session_id = session.session_id
+    return session
+
+@app.after_request
+def _attach_session_id(response):
+    """Hands new session IDs back to the client"""
+    session_id = g.get('session_id')
+    if session_id:
+        response.headers['X-Session-ID'] = session_id
+        if request.cookies.get(SESSION_COOKIE) != session_id:
+            response.set_cookie(SESSION_COOKIE, session_id, httponly=True, samesite='Lax')
+    return response
+
+def _log_interaction(session, query, response, start_time):
+    """Records a finished query in the client's research session"""
+    if session is not None:
+        session.add_turn(query, response, {
+            'timestamp': datetime.now().isoformat(),
+            'query': query,
+            'processing_time': str(datetime.now() - start_time)
+        })
+
+def _session_agent(session):
+    """
+    The agent answering for a session and the lock serialising its turns. Each session
+    gets its own agent, so concurrent clients never interleave their chat memories.
+    """
+    if session is None or agent_factory is None:
+        return agent, agent_lock
+    factory = agent_factory
+    with session.lock:
+        # Rebuilt once the full agent replaces the fallback agent
+        if session.agent is None or session.agent[0] is not factory:
+            session.agent = (factory, factory())
+        return session.agent[1], session.agent_lock
+
+def _stream_agent_response(query, session=None):
+    """Yields the agent's answer in chunks, token by token when the agent supports streaming"""
+    session_agent, lock = _session_agent(session)
+    with lock:
+        if hasattr(session_agent, 'stream_chat'):
+            streaming_response = session_agent.stream_chat(query)
+            yield from getattr(streaming_response, 'response_gen', streaming_response)
+        else:
+            yield str(session_agent.chat(query))
+
+@app.route('/research/stream', methods=['POST'])
+def research_stream():
+    """Process research queries, streaming progress as Server-Sent Events"""
+    if agent is None:
+        return jsonify({'error': 'Agent not initialized. Please wait for startup to complete.'}), 503
+    
+    data = request.get_json(silent=True) or {}
+    query = data.get('query', '').strip()
+    if not query:
+        return jsonify({'error': 'Query is required'}), 400
+    
+    from research_events import EventSink, bind_sink, format_sse
+    sink = EventSink()
+    session = _current_session()
+    
+    def run():
+        with bind_sink(sink):
+            start_time = datetime.now()
+            try:
+                logger.info(f"Streaming query: {query[:100]}...")
+                chunks = []
+                for chunk in _stream_agent_response(query, session):
+                    chunks.append(chunk)
+                    sink.emit('token', {'text': chunk})
+                response = ''.join(chunks)
+                
+                # Log the interaction
+                _log_interaction(session, query, response, start_time)
+                
+                sink.emit('done', {
+                    'response': response,
+                    'query': query,
+                    'timestamp': datetime.now().isoformat()
+                })
+            except Exception as e:
+                logger.error(f"Error processing streamed query: {e}")
+                sink.emit('error', {'error': f'Error processing research query: {str(e)}'})
+            finally:
+                sink.close()
+    
+    threading.Thread(target=run, name="research-stream", daemon=True).start()
+    
+    def generate():
+        yield format_sse('started', {'query': query})
+        for item in sink.events():
+            if item is None:
+                # Comment line keeps proxies from closing an idle connection
+                yield ": keepalive\n\n"
+            else:
+                yield format_sse(*item)
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+def _run_research_job(query, session=None):
+    """Runs one queued research job; token events double as cancellation points"""
+    from research_events import emit
+    start_time = datetime.now()
+    logger.info(f"Running research job: {query[:100]}...")
+    chunks = []
+    for chunk in _stream_agent_response(query, session):
+        chunks.append(chunk)
+        emit('token', text=chunk)
+    response = ''.join(chunks)
+    _log_interaction(session, query, response, start_time)
+    return response
+
+def _get_job_manager():
+    """Creates the research job queue on first use"""
+    global job_manager
+    with job_manager_lock:
+        if job_manager is None:
+            from jobs import JobManager
+            job_manager = JobManager(_run_research_job)
+        return job_manager
+
+@app.route('/jobs', methods=['POST'])
+def submit_job():
+    """Queue a research query and return its job ID immediately"""
+    if agent is None:
+        return jsonify({'error': 'Agent not initialized. Please wait for startup to complete.'}), 503
+    
+    data = request.get_json(silent=True) or {}
+    query = data.get('query', '').strip()
+    if not query:
+        return jsonify({'error': 'Query is required'}), 400
+    
+    import config
+    from jobs import QueueFullError
+    try:
+        job = _get_job_manager().submit(query, session=_current_session())
+    except QueueFullError as e:
+        logger.warning(f"Rejected research job: {e}")
+        response = jsonify({'error': f'{e}. Please retry later.'})
+        response.headers['Retry-After'] = str(config.JOB_RETRY_AFTER)
+        return response, 429
+    
+    logger.info(f"Queued research job {job.id}: {query[:100]}...")
+    return jsonify({
+        'job_id': job.id,
+        'status': job.status,
+        'status_url': f'/jobs/{job.id}'
+    }), 202
+
+@app.route('/jobs', methods=['GET'])
+def list_jobs():
+    """Job queue depth and per-status counts"""
+    return jsonify(_get_job_manager().stats())
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """Poll a research job's status, progress and result"""
+    job = _get_job_manager().get(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown or expired job'}), 404
+    return jsonify(job.to_dict())
+
+@app.route('/jobs/<job_id>', methods=['DELETE'])
+def cancel_job(job_id):
+    """Cancel a queued or running research job"""
+    job = _get_job_manager().cancel(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown or expired job'}), 404
+    return jsonify(job.to_dict())
+
 @app.route('/export', methods=['POST'])
 def export_session():
     """Export current research session"""
-    global exporter, research_session
+    global exporter
     
-    if not exporter or not research_session:
+    if not exporter or not session_store:
         return jsonify({'error': 'Export functionality not available'}), 503
     
     try:
-        export_path = exporter.export_to_json(research_session)
+        export_path = exporter.export_to_json(_current_session().to_dict())
         filename = os.path.basename(export_path)
         
         return jsonify({
@@ -395,7 +755,7 @@ def status():
     """Get current application status"""
     return jsonify({
         'agent_ready': agent is not None,
-        'session_active': research_session is not None,
+        'session_active': session_store is not None,
         'exporter_ready': exporter is not None,
         'timestamp': datetime.now().isoformat()
     })
@@ -408,10 +768,12 @@ if __name__ == '__main__':
     if not os.path.exists('./storage'):
         logger.warning("Storage directory not found. Make sure to run data ingestion first.")
     
-    # Initialize agent
-    init_success = initialize_agent()
-    if not init_success:
-        logger.warning("Agent initialization failed. Some features may not be available.")
+    # Initialize agent; in background mode the port opens while models load
+    import config
+    if config.STARTUP_MODE == 'background':
+        start_background_warm_up()
+    else:
+        warm_up()
     
     # Get port from environment (Render sets PORT environment variable)
     port = int(os.environ.get('PORT', 5000))
@@ -0,0 +1,367 @@
+# /academic-rag-agent/benchmark.py
+"""
+Offline benchmarks of the ingestion and retrieval hot paths on a synthetic corpus.
+
+Each corpus size is built and queried in fresh subprocesses, in its own working
+directory, with a hashed bag-of-words embedding model and llama_index's MockLLM,
+so no model downloads or API keys are needed. Ingestion starts from parsed
+markdown; PDF parsing needs the PyMuPDF and Nougat models and is not covered.
+Results are written as JSON; pass --compare with an earlier result file to flag
+regressions.
+
+    python benchmark.py --sizes 20,80,320 --output bench.json
+    python benchmark.py --compare bench.json
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import hashlib
+import argparse
+import platform
+import tempfile
+import subprocess
+from datetime import datetime
+from typing import Any, Dict, List
+
+import numpy as np
+
+_TOPICS = [
+    "electromagnetic induction", "maxwell equations", "wave propagation", "signal processing",
+    "fourier transform", "neural networks", "gradient descent", "convex optimization",
+    "graph theory", "dynamic programming", "thermodynamics", "entropy", "quantum tunneling",
+    "semiconductor physics", "control systems", "feedback loops", "smart homes", "sensor networks",
+    "cryptography", "public key infrastructure", "compiler design", "operating systems",
+    "distributed consensus", "database indexing", "information retrieval", "language models",
+    "protein folding", "gene expression", "climate modelling", "fluid dynamics",
+]
+_VERBS = ["depends on", "is constrained by", "improves", "is measured against", "reduces", "explains",
+          "is approximated by", "interacts with", "is derived from", "limits"]
+_QUALIFIERS = ["under steady-state conditions", "in the high-frequency limit", "for large datasets",
+               "in practical deployments", "according to recent studies", "when noise is present",
+               "at room temperature", "in the asymptotic regime"]
+
+# Settings every worker runs with: offline models, no caches that would hide the work
+_WORKER_ENV = {
+    "LLM_TYPE": "mock",
+    "EMBED_MODEL": "benchmark-hash-embedding",
+    "EMBED_WORKERS": "1",
+    "ENABLE_EMBEDDING_CACHE": "False",
+    "ENABLE_SEMANTIC_CACHE": "False",
+    "ENABLE_LLM_CACHE": "False",
+}
+
+# Metrics compared by --compare: path into a size's results, and whether higher is better
+_TRACKED_METRICS = {
+    "parse docs/sec": (("ingestion", "parse", "docs_per_sec"), True),
+    "chunk nodes/sec": (("ingestion", "chunk", "nodes_per_sec"), True),
+    "embed nodes/sec": (("ingestion", "embed", "nodes_per_sec"), True),
+    "build nodes/sec": (("ingestion", "build_index", "nodes_per_sec"), True),
+    "index load s": (("index_load_seconds",), False),
+    "retrieval p50 ms": (("retrieval", "p50_ms"), False),
+    "retrieval p95 ms": (("retrieval", "p95_ms"), False),
+    "retrieval p99 ms": (("retrieval", "p99_ms"), False),
+    "deep research p50 ms": (("deep_research", "p50_ms"), False),
+}
+
+def generate_corpus(num_docs: int, sentences_per_doc: int, seed: int = 0) -> Dict[str, str]:
+    """Deterministic markdown documents, each focused on a few topics, keyed by file stem."""
+    rng = random.Random(seed)
+    corpus = {}
+    for i in range(num_docs):
+        topics = rng.sample(_TOPICS, 3)
+        lines = [f"# Notes on {topics[0]}", ""]
+        for s in range(sentences_per_doc):
+            if s and s % 8 == 0:
+                lines += ["", f"## {rng.choice(topics).title()}", ""]
+            subject, obj = rng.choice(topics), rng.choice(_TOPICS)
+            lines.append(f"The behaviour of {subject} {rng.choice(_VERBS)} {obj} {rng.choice(_QUALIFIERS)}.")
+        corpus[f"doc_{i:05d}"] = "\n".join(lines) + "\n"
+    return corpus
+
+def generate_queries(count: int, seed: int = 1) -> List[str]:
+    rng = random.Random(seed)
+    return [f"How does {a} relate to {b}?" for a, b in (rng.sample(_TOPICS, 2) for _ in range(count))]
+
+def generate_research_queries(count: int, seed: int = 2) -> List[str]:
+    rng = random.Random(seed)
+    return [f"Compare {a} and {b}" for a, b in (rng.sample(_TOPICS, 2) for _ in range(count))]
+
+def latency_summary(latencies_ms: List[float]) -> Dict[str, float]:
+    values = np.asarray(latencies_ms)
+    return {
+        "count": len(latencies_ms),
+        "mean_ms": round(float(values.mean()), 3),
+        "p50_ms": round(float(np.percentile(values, 50)), 3),
+        "p95_ms": round(float(np.percentile(values, 95)), 3),
+        "p99_ms": round(float(np.percentile(values, 99)), 3),
+        "max_ms": round(float(values.max()), 3),
+    }
+
+def _throughput(count: int, seconds: float, unit: str) -> Dict[str, float]:
+    return {"seconds": round(seconds, 3), f"{unit}_per_sec": round(count / seconds, 1) if seconds > 0 else 0.0}
+
+def _hash_embedding_class():
+    from llama_index.core.base.embeddings.base import BaseEmbedding
+
+    class HashEmbedding(BaseEmbedding):
+        """Deterministic hashed bag-of-words embedding; similar texts get similar vectors."""
+
+        dim: int = 384
+
+        @classmethod
+        def class_name(cls) -> str:
+            return "HashEmbedding"
+
+        def _embed(self, text: str) -> List[float]:
+            vector = np.zeros(self.dim, dtype=np.float32)
+            for word in text.lower().split():
+                digest = hashlib.blake2b(word.strip(".,?!:;#").encode("utf-8"), digest_size=8).digest()
+                bucket = int.from_bytes(digest[:4], "little") % self.dim
+                vector[bucket] += 1.0 if digest[4] & 1 else -1.0
+            norm = np.linalg.norm(vector)
+            return (vector / norm if norm else vector).tolist()
+
+        def _get_text_embedding(self, text: str) -> List[float]:
+            return self._embed(text)
+
+        def _get_query_embedding(self, query: str) -> List[float]:
+            return self._embed(query)
+
+        async def _aget_query_embedding(self, query: str) -> List[float]:
+            return self._embed(query)
+
+    return HashEmbedding
+
+def _offline_embed_model():
+    from resources import get_embed_model, get_resource
+    get_resource("embed_model", _hash_embedding_class())
+    return get_embed_model()
+
+def run_ingestion(args) -> Dict[str, Any]:
+    """Writes the corpus and times each ingestion stage, then a full index build."""
+    import config
+    embed_model = _offline_embed_model()
+
+    from llama_index.core import SimpleDirectoryReader
+    from embedding_pipeline import embed_nodes
+    from ingestion import build_and_persist_index, build_nodes, plan_ingestion, setup_paths
+    from sentence_windows import OffsetWindowNodeParser
+
+    setup_paths()
+    os.makedirs(config.PDF_DIRECTORY, exist_ok=True)
+    corpus = generate_corpus(args.size, args.sentences, args.seed)
+    markdown_paths = []
+    for stem, text in corpus.items():
+        # Ingestion plans by PDF; the placeholder stands in for the already-parsed source
+        with open(os.path.join(config.PDF_DIRECTORY, f"{stem}.pdf"), 'w', encoding='utf-8') as f:
+            f.write(f"%PDF-1.4 synthetic {stem}\n")
+        path = os.path.join(config.MARKDOWN_DIR, f"{stem}.mmd")
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(text)
+        markdown_paths.append(path)
+    corpus_mb = sum(len(t.encode("utf-8")) for t in corpus.values()) / (1024 * 1024)
+
+    # --- Ingestion stages, measured separately ---
+    start = time.perf_counter()
+    documents = SimpleDirectoryReader(input_files=markdown_paths, filename_as_id=True).load_data()
+    parse = _throughput(len(documents), time.perf_counter() - start, "docs")
+    parse["mb_per_sec"] = round(corpus_mb / parse["seconds"], 2) if parse["seconds"] > 0 else 0.0
+
+    start = time.perf_counter()
+    nodes = build_nodes(documents, OffsetWindowNodeParser(window_size=config.SENTENCE_WINDOW_SIZE))
+    chunk = _throughput(len(nodes), time.perf_counter() - start, "nodes")
+
+    stats = embed_nodes(nodes, embed_model, verbose=False)
+    embed = _throughput(stats["nodes"], stats["seconds"], "nodes")
+
+    # --- Full incremental ingestion: split, embed, upsert, BM25 and persist ---
+    start = time.perf_counter()
+    build_and_persist_index(plan_ingestion())
+    build = _throughput(len(nodes), time.perf_counter() - start, "nodes")
+    return {
+        "docs": args.size,
+        "sentences_per_doc": args.sentences,
+        "nodes": len(nodes),
+        "corpus_mb": round(corpus_mb, 3),
+        "ingestion": {"parse": parse, "chunk": chunk, "embed": embed, "build_index": build},
+    }
+
+def run_queries(args) -> Dict[str, Any]:
+    """Times a cold index load, retrieval and deep research over the index built by run_ingestion."""
+    _offline_embed_model()
+
+    from llama_index.core import QueryBundle
+    from agent import deep_research_analysis
+    from retrieval import setup_query_engine
+
+    # --- Cold index load ---
+    start = time.perf_counter()
+    query_engine = setup_query_engine()
+    index_load_seconds = round(time.perf_counter() - start, 3)
+
+    # --- Retrieval latency, without synthesis ---
+    queries = generate_queries(args.warmup + args.queries, args.seed + 1)
+    for query in queries[:args.warmup]:
+        query_engine.retrieve(QueryBundle(query))
+    latencies = []
+    for query in queries[args.warmup:]:
+        start = time.perf_counter()
+        query_engine.retrieve(QueryBundle(query))
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    # --- Deep research end to end, with the mock LLM ---
+    research_latencies = []
+    for query in generate_research_queries(args.research_runs, args.seed + 2):
+        start = time.perf_counter()
+        deep_research_analysis(query, query_engine)
+        research_latencies.append((time.perf_counter() - start) * 1000)
+
+    return {
+        "index_load_seconds": index_load_seconds,
+        "retrieval": latency_summary(latencies),
+        "deep_research": latency_summary(research_latencies) if research_latencies else None,
+    }
+
+def _run_worker(args, size: int, workdir: str) -> Dict[str, Any]:
+    """
+    Runs one size in fresh processes, one for ingestion and one for queries, so the
+    index load starts without open clients or warm caches.
+    """
+    # An index left by an earlier run would turn the build into a no-op update
+    if os.path.exists(workdir):
+        shutil.rmtree(workdir)
+    os.makedirs(workdir)
+    env = {**os.environ, **_WORKER_ENV, "RERANKER_TYPE": args.reranker,
+           "STORAGE_DIR": "./storage", "PDF_DIRECTORY": "./data", "RESEARCH_OUTPUT_DIR": "./research_outputs"}
+    result = {}
+    for phase in ("ingest", "query"):
+        result_path = os.path.join(workdir, f"{phase}.json")
+        log_path = os.path.join(workdir, f"{phase}.log")
+        command = [sys.executable, os.path.abspath(__file__), "--worker", phase, "--size", str(size),
+                   "--sentences", str(args.sentences), "--queries", str(args.queries), "--warmup", str(args.warmup),
+                   "--research-runs", str(args.research_runs), "--seed", str(args.seed), "--result", result_path]
+        with open(log_path, 'w', encoding='utf-8') as log:
+            completed = subprocess.run(command, cwd=workdir, env=env, stdout=log, stderr=subprocess.STDOUT)
+        if completed.returncode != 0 or not os.path.exists(result_path):
+            raise RuntimeError(f"Benchmark {phase} phase of {size} document(s) failed; see {log_path}")
+        with open(result_path, 'r', encoding='utf-8') as f:
+            result.update(json.load(f))
+    return result
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+def _metric(result: Dict[str, Any], path) -> float:
+    for key in path:
+        result = (result or {}).get(key)
+    return result
+
+def compare_results(baseline: Dict[str, Any], current: Dict[str, Any], tolerance: float) -> List[str]:
+    """Prints current vs baseline per size. Returns the metrics worse than tolerance allows."""
+    regressions = []
+    baseline_sizes = {r["docs"]: r for r in baseline["sizes"]}
+    for result in current["sizes"]:
+        before = baseline_sizes.get(result["docs"])
+        if before is None:
+            continue
+        print(f"\n{result['docs']} docs{'':<16}{'baseline':>12}{'current':>12}{'change':>10}")
+        for name, (path, higher_is_better) in _TRACKED_METRICS.items():
+            old, new = _metric(before, path), _metric(result, path)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            worse = -change if higher_is_better else change
+            flag = "  ⚠️" if worse > tolerance else ""
+            print(f"{name:<26}{old:>12.3f}{new:>12.3f}{change:>+10.1%}{flag}")
+            if worse > tolerance:
+                regressions.append(f"{result['docs']} docs: {name} {change:+.1%}")
+    return regressions
+
+def print_summary(report: Dict[str, Any]):
+    print(f"\n📊 Offline benchmark ({report['config']['vector_backend']} backend, commit {report['git_commit']})")
+    print(f"{'docs':>6}{'nodes':>8}{'embed n/s':>11}{'build n/s':>11}{'load s':>8}"
+          f"{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'research p50':>14}")
+    for r in report["sizes"]:
+        research = r["deep_research"]["p50_ms"] if r["deep_research"] else 0.0
+        print(f"{r['docs']:>6}{r['nodes']:>8}{r['ingestion']['embed']['nodes_per_sec']:>11.1f}"
+              f"{r['ingestion']['build_index']['nodes_per_sec']:>11.1f}{r['index_load_seconds']:>8.2f}"
+              f"{r['retrieval']['p50_ms']:>9.2f}{r['retrieval']['p95_ms']:>9.2f}{r['retrieval']['p99_ms']:>9.2f}"
+              f"{research:>14.1f}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline ingestion and retrieval benchmarks on a synthetic corpus.")
+    parser.add_argument("--sizes", default="20,80,320", help="comma-separated corpus sizes in documents")
+    parser.add_argument("--sentences", type=int, default=40, help="sentences per document")
+    parser.add_argument("--queries", type=int, default=200, help="timed retrieval queries per size")
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--research-runs", type=int, default=5, help="deep research runs per size; 0 to skip")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--reranker", default="none", help="RERANKER_TYPE for the run; models must be cached locally")
+    parser.add_argument("--workdir", help="where corpora and indexes are built; default a temporary directory")
+    parser.add_argument("--output", help="result JSON path; default benchmark_results/<timestamp>.json")
+    parser.add_argument("--compare", help="earlier result JSON to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="relative slowdown reported as a regression")
+    parser.add_argument("--worker", choices=["ingest", "query"], help=argparse.SUPPRESS)
+    parser.add_argument("--size", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--result", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        result = run_ingestion(args) if args.worker == "ingest" else run_queries(args)
+        with open(args.result, 'w', encoding='utf-8') as f:
+            json.dump(result, f, indent=2)
+        return
+
+    import config
+    sizes = [int(s) for s in args.sizes.split(",") if s.strip()]
+    workdir = args.workdir or tempfile.mkdtemp(prefix="rag-benchmark-")
+    report = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "git_commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "config": {
+            "vector_backend": config.VECTOR_BACKEND,
+            "docstore_backend": config.DOCSTORE_BACKEND,
+            "reranker": args.reranker,
+            "enable_bm25": config.ENABLE_BM25,
+            "context_packing": config.ENABLE_CONTEXT_PACKING,
+            "deep_research_mode": config.DEEP_RESEARCH_MODE,
+            "sentence_splitter": config.SENTENCE_SPLITTER,
+            "sentences_per_doc": args.sentences,
+            "queries": args.queries,
+            "seed": args.seed,
+        },
+        "sizes": [],
+    }
+    for size in sizes:
+        print(f"⏱️  Benchmarking {size} document(s)...")
+        report["sizes"].append(_run_worker(args, size, os.path.join(workdir, f"corpus_{size}")))
+    print_summary(report)
+
+    output = args.output or os.path.join("benchmark_results", datetime.now().strftime("%Y%m%d-%H%M%S") + ".json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f"\n✅ Results written to {output} (indexes in {workdir})")
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            regressions = compare_results(json.load(f), report, args.tolerance)
+        if regressions:
+            print(f"\n❌ {len(regressions)} regression(s) beyond {args.tolerance:.0%}:")
+            for regression in regressions:
+                print(f"   {regression}")
+            sys.exit(1)
+        print(f"\n✅ No regressions beyond {args.tolerance:.0%}.")
+
+if __name__ == "__main__":
+    main()
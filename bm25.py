@@ -0,0 +1,272 @@
+# /academic-rag-agent/bm25.py
+import os
+import re
+import json
+import shutil
+from array import array
+from collections import Counter
+from typing import Iterable, List, Tuple
+
+import numpy as np
+from llama_index.core import QueryBundle
+from llama_index.core.retrievers import BaseRetriever
+from llama_index.core.schema import ImageNode, MetadataMode, NodeWithScore
+
+import config
+
+_TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+_STOPWORDS = frozenset("""
+a an and are as at be but by for from has have if in into is it its of on or
+such that the their then there these they this to was were what when where
+which while who why will with how
+""".split())
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased alphanumeric tokens. Numbers and short acronyms are kept."""
+    return [t for t in _TOKEN_PATTERN.findall(text.lower()) if t not in _STOPWORDS]
+
+class BM25Index:
+    """
+    Okapi BM25 keyword index stored as flat postings arrays.
+
+    Postings for term t are doc_ids[offsets[t]:offsets[t+1]] with matching
+    term frequencies in tfs. All arrays are saved as .npy files and memory-mapped
+    on load, so startup cost does not depend on corpus size beyond the vocabulary.
+    """
+
+    def __init__(self, vocab: List[str], node_ids: List[str], offsets, doc_ids, tfs,
+                 doc_lens, k1: float = 1.5, b: float = 0.75):
+        self.vocab = {term: i for i, term in enumerate(vocab)}
+        self.node_ids = node_ids
+        self.offsets = offsets
+        self.doc_ids = doc_ids
+        self.tfs = tfs
+        self.doc_lens = doc_lens
+        self.k1 = k1
+        self.b = b
+
+        num_docs = len(node_ids)
+        avgdl = float(np.mean(doc_lens)) if num_docs else 0.0
+        doc_freqs = np.diff(offsets).astype(np.float32)
+        self.idf = np.log1p((num_docs - doc_freqs + 0.5) / (doc_freqs + 0.5)).astype(np.float32)
+        # Per-document length normalisation, precomputed once
+        self._norm = (k1 * (1 - b + b * np.asarray(doc_lens, dtype=np.float32) / max(avgdl, 1e-9))
+                      ).astype(np.float32)
+
+    @classmethod
+    def from_texts(cls, items: Iterable[Tuple[str, str]], k1: float = 1.5, b: float = 0.75) -> "BM25Index":
+        """Builds the index from (node_id, text) pairs."""
+        vocab, node_ids, doc_lens = {}, [], []
+        term_ids, posting_docs, posting_tfs = [], [], []
+        for node_id, text in items:
+            counts = Counter(tokenize(text))
+            if not counts:
+                continue
+            doc = len(node_ids)
+            node_ids.append(node_id)
+            doc_lens.append(sum(counts.values()))
+            for term, tf in counts.items():
+                term_ids.append(vocab.setdefault(term, len(vocab)))
+                posting_docs.append(doc)
+                posting_tfs.append(tf)
+
+        term_ids = np.asarray(term_ids, dtype=np.int32)
+        order = np.argsort(term_ids, kind="stable")  # keeps postings sorted by doc
+        offsets = np.zeros(len(vocab) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(term_ids, minlength=len(vocab)), out=offsets[1:])
+
+        return cls(
+            vocab=list(vocab),
+            node_ids=node_ids,
+            offsets=offsets,
+            doc_ids=np.asarray(posting_docs, dtype=np.int32)[order],
+            tfs=np.minimum(np.asarray(posting_tfs, dtype=np.int64), np.iinfo(np.uint16).max)
+                  .astype(np.uint16)[order],
+            doc_lens=np.asarray(doc_lens, dtype=np.int32),
+            k1=k1,
+            b=b,
+        )
+
+    @classmethod
+    def from_docstore(cls, docstore) -> "BM25Index":
+        """Builds the index over every text node in a docstore."""
+        return cls.from_texts(_docstore_texts(docstore))
+
+    @classmethod
+    def build(cls, items: Iterable[Tuple[str, str]], persist_dir: str = None, k1: float = 1.5,
+              b: float = 0.75, block_postings: int = None) -> "BM25Index":
+        """
+        Builds and persists the index from (node_id, text) pairs in bounded memory.
+        Postings are spilled to disk in blocks of block_postings sorted by term, then
+        merged straight into memory-mapped output arrays. Gives the same index as
+        from_texts(items).persist(persist_dir).
+        """
+        persist_dir = persist_dir or config.BM25_DIR
+        block_postings = block_postings or config.BM25_BLOCK_POSTINGS
+        build_dir = persist_dir.rstrip(os.sep) + ".build"
+        shutil.rmtree(build_dir, ignore_errors=True)
+        os.makedirs(build_dir)
+
+        vocab, node_ids, doc_lens, blocks = {}, [], array("i"), []
+        term_ids, posting_docs, posting_tfs = array("i"), array("i"), array("i")
+
+        def spill():
+            # Sorting by term keeps each term's postings in doc order within the block
+            terms = np.array(term_ids, dtype=np.int32)
+            order = np.argsort(terms, kind="stable")
+            path = os.path.join(build_dir, f"block{len(blocks)}.npz")
+            np.savez(path, terms=terms[order], docs=np.array(posting_docs, dtype=np.int32)[order],
+                     tfs=np.array(posting_tfs, dtype=np.int32)[order])
+            blocks.append(path)
+            del term_ids[:], posting_docs[:], posting_tfs[:]
+
+        for node_id, text in items:
+            counts = Counter(tokenize(text))
+            if not counts:
+                continue
+            doc = len(node_ids)
+            node_ids.append(node_id)
+            doc_lens.append(sum(counts.values()))
+            for term, tf in counts.items():
+                term_ids.append(vocab.setdefault(term, len(vocab)))
+                posting_docs.append(doc)
+                posting_tfs.append(tf)
+            if len(term_ids) >= block_postings:
+                spill()
+        if len(term_ids):
+            spill()
+
+        # Blocks cover increasing doc ranges, so block order is doc order within each term
+        counts = [np.bincount(np.load(path)["terms"], minlength=len(vocab)) for path in blocks]
+        offsets = np.zeros(len(vocab) + 1, dtype=np.int64)
+        np.cumsum(np.sum(counts, axis=0, dtype=np.int64) if counts else offsets[1:], out=offsets[1:])
+        total = int(offsets[-1])
+        doc_ids = np.lib.format.open_memmap(os.path.join(build_dir, "doc_ids.npy"), mode="w+",
+                                            dtype=np.int32, shape=(total,))
+        tfs = np.lib.format.open_memmap(os.path.join(build_dir, "tfs.npy"), mode="w+",
+                                        dtype=np.uint16, shape=(total,))
+        cursor = offsets[:-1].copy()
+        for path, block_counts in zip(blocks, counts):
+            with np.load(path) as block:
+                terms = block["terms"]
+                block_offsets = np.zeros(len(vocab), dtype=np.int64)
+                np.cumsum(block_counts[:-1], out=block_offsets[1:])
+                dest = cursor[terms] + np.arange(len(terms)) - block_offsets[terms]
+                doc_ids[dest] = block["docs"]
+                tfs[dest] = np.minimum(block["tfs"], np.iinfo(np.uint16).max)
+            cursor += block_counts
+            os.remove(path)
+        doc_ids.flush()
+        tfs.flush()
+        del doc_ids, tfs
+
+        np.save(os.path.join(build_dir, "offsets.npy"), offsets)
+        np.save(os.path.join(build_dir, "doc_lens.npy"), np.array(doc_lens, dtype=np.int32))
+        _write_terms(build_dir, k1, b, list(vocab), node_ids)
+        _publish(build_dir, persist_dir)
+        return cls.load(persist_dir)
+
+    @classmethod
+    def build_from_docstore(cls, docstore, persist_dir: str = None) -> "BM25Index":
+        """Builds and persists the index over every text node in a docstore, in bounded memory."""
+        return cls.build(_docstore_texts(docstore), persist_dir)
+
+    def __len__(self) -> int:
+        return len(self.node_ids)
+
+    def search(self, query: str, top_k: int) -> List[Tuple[str, float]]:
+        """Returns up to top_k (node_id, score) pairs, best first."""
+        term_ids = {self.vocab[t] for t in tokenize(query) if t in self.vocab}
+        if not term_ids or not self.node_ids:
+            return []
+
+        scores = np.zeros(len(self.node_ids), dtype=np.float32)
+        for t in term_ids:
+            start, end = self.offsets[t], self.offsets[t + 1]
+            docs = self.doc_ids[start:end]
+            tf = self.tfs[start:end].astype(np.float32)
+            # Each doc appears once per term, so fancy-index accumulation is safe
+            scores[docs] += self.idf[t] * tf * (self.k1 + 1) / (tf + self._norm[docs])
+
+        candidates = np.flatnonzero(scores)
+        if len(candidates) > top_k:
+            candidates = candidates[np.argpartition(-scores[candidates], top_k - 1)[:top_k]]
+        candidates = candidates[np.argsort(-scores[candidates], kind="stable")]
+        return [(self.node_ids[i], float(scores[i])) for i in candidates]
+
+    def persist(self, persist_dir: str = None):
+        """Writes the index as .npy arrays plus JSON vocabulary and node ids."""
+        persist_dir = persist_dir or config.BM25_DIR
+        build_dir = persist_dir.rstrip(os.sep) + ".build"
+        shutil.rmtree(build_dir, ignore_errors=True)
+        os.makedirs(build_dir)
+        np.save(os.path.join(build_dir, "offsets.npy"), self.offsets)
+        np.save(os.path.join(build_dir, "doc_ids.npy"), self.doc_ids)
+        np.save(os.path.join(build_dir, "tfs.npy"), self.tfs)
+        np.save(os.path.join(build_dir, "doc_lens.npy"), self.doc_lens)
+        _write_terms(build_dir, self.k1, self.b, sorted(self.vocab, key=self.vocab.get), self.node_ids)
+        _publish(build_dir, persist_dir)
+
+    @classmethod
+    def exists(cls, persist_dir: str = None) -> bool:
+        return os.path.exists(os.path.join(persist_dir or config.BM25_DIR, "terms.json"))
+
+    @classmethod
+    def load(cls, persist_dir: str = None) -> "BM25Index":
+        """Loads a persisted index with the postings arrays memory-mapped."""
+        persist_dir = persist_dir or config.BM25_DIR
+        with open(os.path.join(persist_dir, "terms.json"), 'r', encoding='utf-8') as f:
+            terms = json.load(f)
+        load = lambda name: np.load(os.path.join(persist_dir, name), mmap_mode='r')
+        return cls(
+            vocab=terms["vocab"],
+            node_ids=terms["node_ids"],
+            offsets=load("offsets.npy"),
+            doc_ids=load("doc_ids.npy"),
+            tfs=load("tfs.npy"),
+            doc_lens=load("doc_lens.npy"),
+            k1=terms["k1"],
+            b=terms["b"],
+        )
+
+def _docstore_texts(docstore) -> Iterable[Tuple[str, str]]:
+    """(node_id, text) of every text node in a docstore."""
+    # Disk-backed docstores stream their nodes instead of materialising .docs
+    nodes = docstore.iter_nodes() if hasattr(docstore, "iter_nodes") else docstore.docs.values()
+    return (
+        (node.node_id, node.get_content(metadata_mode=MetadataMode.NONE))
+        for node in nodes
+        if not isinstance(node, ImageNode)
+    )
+
+def _write_terms(directory: str, k1: float, b: float, vocab: List[str], node_ids: List[str]):
+    with open(os.path.join(directory, "terms.json"), 'w', encoding='utf-8') as f:
+        json.dump({"k1": k1, "b": b, "vocab": vocab, "node_ids": node_ids}, f, ensure_ascii=False)
+
+def _publish(build_dir: str, persist_dir: str):
+    """
+    Moves freshly written index files into persist_dir. Each file is replaced, not
+    rewritten, so processes that memory-mapped the previous index keep reading it.
+    """
+    os.makedirs(persist_dir, exist_ok=True)
+    # terms.json goes last: BM25Index.exists() is true only once the arrays are in place
+    for name in ("offsets.npy", "doc_ids.npy", "tfs.npy", "doc_lens.npy", "terms.json"):
+        os.replace(os.path.join(build_dir, name), os.path.join(persist_dir, name))
+    shutil.rmtree(build_dir, ignore_errors=True)
+
+class BM25Retriever(BaseRetriever):
+    """Keyword retriever over a BM25Index, resolving hits through the docstore."""
+
+    def __init__(self, index: BM25Index, docstore, similarity_top_k: int = None):
+        self._index = index
+        self._docstore = docstore
+        self._similarity_top_k = similarity_top_k or config.BM25_TOP_K
+        super().__init__()
+
+    def _retrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        results = []
+        for node_id, score in self._index.search(query_bundle.query_str, self._similarity_top_k):
+            node = self._docstore.get_node(node_id, raise_error=False)
+            if node is not None:
+                results.append(NodeWithScore(node=node, score=score))
+        return results
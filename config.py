@@ -7,27 +7,120 @@ PDF_DIRECTORY = os.getenv("PDF_DIRECTORY", "./data")
 STORAGE_DIR = os.getenv("STORAGE_DIR", "./storage")
 MARKDOWN_DIR = os.path.join("./output", "parsed_markdown")
 IMAGE_DIR = os.path.join("./output", "extracted_images")
+PARSE_CHECKPOINT_DIR = os.path.join("./output", "parse_checkpoints")
 QDRANT_PATH = os.path.join(STORAGE_DIR, "qdrant_db")
 DOCSTORE_PATH = os.path.join(STORAGE_DIR, "docstore.json")
+DOCSTORE_SQLITE_PATH = os.path.join(STORAGE_DIR, "docstore.sqlite")
+DOCSTORE_BACKEND = os.getenv("DOCSTORE_BACKEND", "sqlite")  # Options: "sqlite", "json"
+INDEX_VERSION_PATH = os.path.join(STORAGE_DIR, "index_version.json")
+MANIFEST_PATH = os.path.join(STORAGE_DIR, "ingestion_manifest.json")
+BM25_DIR = os.path.join(STORAGE_DIR, "bm25")
+DOC_TEXT_STORE_PATH = os.path.join(STORAGE_DIR, "doc_texts.sqlite")
 
 # --- Model Configuration ---
 # Gemini LLM Configuration
 LLM_MODEL = os.getenv("LLM_MODEL", "gemini-2.5-flash")  # or "gemini-pro"
-LLM_TYPE = os.getenv("LLM_TYPE", "gemini")  # Options: "gemini", "ollama", "huggingface", "none"
+LLM_TYPE = os.getenv("LLM_TYPE", "gemini")  # Options: "gemini", "ollama", "huggingface", "mock" (offline stand-in), "none"
 EMBED_MODEL = os.getenv("EMBED_MODEL", "BAAI/bge-small-en-v1.5")  # Local embedding model
-RERANKER_MODEL = os.getenv("RERANKER_MODEL", "colbert-ir/colbertv2.0")
+RERANKER_TYPE = os.getenv("RERANKER_TYPE", "late_interaction")  # Options: "late_interaction", "cross_encoder", "none"
+RERANKER_MODEL = os.getenv("RERANKER_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")  # used by "cross_encoder"
 
 # --- Deep Research Configuration ---
 MAX_REASONING_STEPS = int(os.getenv("MAX_REASONING_STEPS", "10"))
 ENABLE_QUERY_DECOMPOSITION = os.getenv("ENABLE_QUERY_DECOMPOSITION", "True").lower() == "true"
 ENABLE_MULTI_SOURCE_SYNTHESIS = os.getenv("ENABLE_MULTI_SOURCE_SYNTHESIS", "True").lower() == "true"
 RESEARCH_OUTPUT_DIR = os.getenv("RESEARCH_OUTPUT_DIR", "./research_outputs")
+SUBTASK_CONCURRENCY = int(os.getenv("SUBTASK_CONCURRENCY", "4"))  # 1 = run sub-tasks sequentially
+SUBTASK_TIMEOUT = float(os.getenv("SUBTASK_TIMEOUT", "120"))  # seconds for the whole fan-out
+DEEP_RESEARCH_MODE = os.getenv("DEEP_RESEARCH_MODE", "per_subtask")  # Options: "per_subtask" (concurrent sub-task queries), "single_synthesis" (one LLM call)
+SYNTHESIS_MAX_SOURCES = int(os.getenv("SYNTHESIS_MAX_SOURCES", "20"))  # unique nodes passed to the single synthesis call
+ENABLE_CONTEXT_PACKING = os.getenv("ENABLE_CONTEXT_PACKING", "True").lower() == "true"  # merge overlapping windows, drop duplicates
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000"))  # prompt tokens of retrieved context per query
+CONTEXT_DEDUP_THRESHOLD = float(os.getenv("CONTEXT_DEDUP_THRESHOLD", "0.8"))  # share of word trigrams already packed
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))  # research jobs running at once
+JOB_MAX_PENDING = int(os.getenv("JOB_MAX_PENDING", "10"))  # queued + running jobs before new ones get 429
+JOB_RESULT_TTL = float(os.getenv("JOB_RESULT_TTL", "3600"))  # seconds finished job results are kept
+JOB_RETRY_AFTER = int(os.getenv("JOB_RETRY_AFTER", "30"))  # Retry-After seconds sent with 429
+SESSION_MAX_SESSIONS = int(os.getenv("SESSION_MAX_SESSIONS", "1000"))  # least recently used sessions are evicted beyond this
+SESSION_IDLE_TTL = float(os.getenv("SESSION_IDLE_TTL", "3600"))  # seconds before an idle session is evicted
+SESSION_MAX_TURNS = int(os.getenv("SESSION_MAX_TURNS", "20"))  # turns per session kept in memory; older ones spill to disk
+SESSION_SPILL_DIR = os.path.join(RESEARCH_OUTPUT_DIR, "sessions")
+
+# --- Web App Startup Configuration ---
+STARTUP_MODE = os.getenv("STARTUP_MODE", "background")  # Options: "background", "blocking"
+SERVE_FALLBACK_DURING_WARMUP = os.getenv("SERVE_FALLBACK_DURING_WARMUP", "True").lower() == "true"
 
 # --- Retrieval and Reranking Configuration ---
 VECTOR_TOP_K = int(os.getenv("VECTOR_TOP_K", "10"))
+RETRIEVAL_COLLECTIONS = os.getenv("RETRIEVAL_COLLECTIONS", "text_collection,image_collection")  # name[:top_k[:timeout_s]], comma-separated
+COLLECTION_TIMEOUT = float(os.getenv("COLLECTION_TIMEOUT", "5"))  # seconds per collection search when not set per collection
+ENABLE_BM25 = os.getenv("ENABLE_BM25", "True").lower() == "true"
 BM25_TOP_K = int(os.getenv("BM25_TOP_K", "10"))
+BM25_BLOCK_POSTINGS = int(os.getenv("BM25_BLOCK_POSTINGS", "2000000"))  # postings held in memory before a block is spilled to disk
 RERANKER_TOP_N = int(os.getenv("RERANKER_TOP_N", "5"))
+RERANKER_LATENCY_BUDGET_MS = float(os.getenv("RERANKER_LATENCY_BUDGET_MS", "250"))
+TOKEN_VECTORS_DIR = os.path.join(STORAGE_DIR, "token_vectors")
+HYBRID_FUSION_MODE = os.getenv("HYBRID_FUSION_MODE", "rrf")  # Options: "rrf", "weighted"
+HYBRID_VECTOR_WEIGHT = float(os.getenv("HYBRID_VECTOR_WEIGHT", "0.5"))  # BM25 gets 1 - weight
+HYBRID_TOP_K = int(os.getenv("HYBRID_TOP_K", "10"))  # nodes kept after fusion
+RRF_K = int(os.getenv("RRF_K", "60"))
+RETRIEVAL_WORKERS = int(os.getenv("RETRIEVAL_WORKERS", "8"))
+
+# --- Vector Store Configuration ---
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "qdrant")  # Options: "qdrant", "numpy" (in-process, small corpora)
+NUMPY_VECTOR_DIR = os.path.join(STORAGE_DIR, "numpy_vectors")
+NUMPY_VECTOR_INT8 = os.getenv("NUMPY_VECTOR_INT8", "False").lower() == "true"  # scan an int8 copy, rescore with float32
+NUMPY_VECTOR_OVERSAMPLING = float(os.getenv("NUMPY_VECTOR_OVERSAMPLING", "4.0"))  # int8 candidates rescored per result
+NUMPY_VECTOR_FLUSH_ROWS = int(os.getenv("NUMPY_VECTOR_FLUSH_ROWS", "50000"))  # buffered rows written out during ingestion; 0 = only at the end
+
+# --- Qdrant Storage Configuration ---
+QDRANT_URL = os.getenv("QDRANT_URL")  # Qdrant server; unset = embedded Qdrant at QDRANT_PATH (exact search only)
+QDRANT_QUANTIZATION = os.getenv("QDRANT_QUANTIZATION", "none")  # Options: "none", "scalar", "binary"
+QDRANT_QUANTIZED_ALWAYS_RAM = os.getenv("QDRANT_QUANTIZED_ALWAYS_RAM", "True").lower() == "true"
+QDRANT_ON_DISK = os.getenv("QDRANT_ON_DISK", "False").lower() == "true"  # original vectors memory-mapped from disk
+QDRANT_HNSW_M = int(os.getenv("QDRANT_HNSW_M", "16"))
+QDRANT_HNSW_EF_CONSTRUCT = int(os.getenv("QDRANT_HNSW_EF_CONSTRUCT", "100"))
+QDRANT_HNSW_ON_DISK = os.getenv("QDRANT_HNSW_ON_DISK", "False").lower() == "true"
+QDRANT_HNSW_EF = int(os.getenv("QDRANT_HNSW_EF", "0"))  # search-time ef; 0 = server default
+QDRANT_OVERSAMPLING = float(os.getenv("QDRANT_OVERSAMPLING", "2.0"))  # quantized candidates fetched per result
+QDRANT_RESCORE = os.getenv("QDRANT_RESCORE", "True").lower() == "true"  # re-rank candidates with original vectors
+
+# --- Semantic Cache Configuration ---
+ENABLE_SEMANTIC_CACHE = os.getenv("ENABLE_SEMANTIC_CACHE", "True").lower() == "true"
+SEMANTIC_CACHE_DIR = os.path.join(STORAGE_DIR, "semantic_cache")
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.92"))  # cosine similarity
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "500"))
+SEMANTIC_CACHE_TTL = float(os.getenv("SEMANTIC_CACHE_TTL", "86400"))  # seconds
+ENABLE_LLM_CACHE = os.getenv("ENABLE_LLM_CACHE", "True").lower() == "true"
+LLM_CACHE_PATH = os.path.join(STORAGE_DIR, "llm_cache.sqlite")
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "5000"))
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", "604800"))  # seconds; 0 = never expire
+
+# --- Ingestion Embedding Configuration ---
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "64"))
+EMBED_WORKERS = int(os.getenv("EMBED_WORKERS", "0"))  # 0 = one process per CPU core
+EMBED_PARALLEL_MIN_NODES = int(os.getenv("EMBED_PARALLEL_MIN_NODES", "2000"))  # below this, embed in-process
+QDRANT_UPSERT_BATCH_SIZE = int(os.getenv("QDRANT_UPSERT_BATCH_SIZE", "256"))
+INGEST_BATCH_NODES = int(os.getenv("INGEST_BATCH_NODES", "512"))  # nodes embedded and upserted per step
+INGEST_QUEUE_BATCHES = int(os.getenv("INGEST_QUEUE_BATCHES", "4"))  # batches read ahead of the embedder
+INGEST_MEMORY_LIMIT_MB = float(os.getenv("INGEST_MEMORY_LIMIT_MB", "0"))  # pause reading above this RSS; 0 = no limit
+
+# --- PDF Parsing Configuration ---
+PARSE_WORKERS = int(os.getenv("PARSE_WORKERS", "2"))  # PDFs parsed at once; 0 = one per CPU core
+PARSE_PAGE_TIMEOUT = float(os.getenv("PARSE_PAGE_TIMEOUT", "120"))  # seconds per page before a PDF is given up
+PARSE_ROUTING = os.getenv("PARSE_ROUTING", "auto")  # Options: "auto" (per page), "nougat", "pymupdf"
+PARSE_MIN_TEXT_CHARS = int(os.getenv("PARSE_MIN_TEXT_CHARS", "200"))  # fewer text-layer chars -> Nougat
+PARSE_SCANNED_IMAGE_COVERAGE = float(os.getenv("PARSE_SCANNED_IMAGE_COVERAGE", "0.8"))  # image share of page -> Nougat
+
+# --- Embedding Cache Configuration ---
+ENABLE_EMBEDDING_CACHE = os.getenv("ENABLE_EMBEDDING_CACHE", "True").lower() == "true"
+EMBEDDING_CACHE_DIR = os.path.join(STORAGE_DIR, "embedding_cache")
+EMBEDDING_CACHE_DTYPE = os.getenv("EMBEDDING_CACHE_DTYPE", "float32")  # Options: "float32", "float16"
+QUERY_EMBEDDING_CACHE_SIZE = int(os.getenv("QUERY_EMBEDDING_CACHE_SIZE", "1024"))  # query embeddings kept in memory; never written to disk
 
 # --- Chunk Configuration ---
+SENTENCE_WINDOW_SIZE = int(os.getenv("SENTENCE_WINDOW_SIZE", "3"))  # sentences on each side of a node's sentence
+SENTENCE_SPLITTER = os.getenv("SENTENCE_SPLITTER", "regex")  # Options: "regex", "punkt" (NLTK, slower)
+DOC_TEXT_CACHE_SIZE = int(os.getenv("DOC_TEXT_CACHE_SIZE", "64"))  # document texts kept in memory for window lookups
 CHUNK_SIZE = 512
 CHUNK_OVERLAP = 50
\ No newline at end of file
@@ -0,0 +1,187 @@
+# /academic-rag-agent/context_packing.py
+import re
+import threading
+from typing import Any, Callable, Dict, List, Optional
+
+from llama_index.core import Settings
+from llama_index.core.bridge.pydantic import PrivateAttr
+from llama_index.core.postprocessor.types import BaseNodePostprocessor
+from llama_index.core.schema import MetadataMode, NodeWithScore, QueryBundle
+
+import config
+from sentence_windows import (
+    WINDOW_END_KEY, WINDOW_START_KEY, DocumentTextStore, get_document_text_store, resolve_window,
+)
+
+_WORD = re.compile(r"\w+")
+_SHINGLE_SIZE = 3
+
+_totals = {"queries": 0, "tokens_before": 0, "tokens_after": 0, "nodes_before": 0, "chunks_after": 0}
+_totals_lock = threading.Lock()
+
+def _shingles(text: str) -> set:
+    words = _WORD.findall(text.lower())
+    if len(words) < _SHINGLE_SIZE:
+        return {tuple(words)} if words else set()
+    return {tuple(words[i:i + _SHINGLE_SIZE]) for i in range(len(words) - _SHINGLE_SIZE + 1)}
+
+def is_near_duplicate(shingles: set, kept: List[set], threshold: float) -> bool:
+    """Whether at least threshold of the text's word trigrams already appear in one kept chunk."""
+    if not shingles:
+        return False
+    return any(len(shingles & other) / len(shingles) >= threshold for other in kept)
+
+class _Chunk:
+    """One or more retrieved nodes whose windows cover a single span of a document."""
+
+    def __init__(self, node: NodeWithScore, start: Optional[int] = None, end: Optional[int] = None):
+        self.members = [node]
+        self.start, self.end = start, end
+
+    @property
+    def best(self) -> NodeWithScore:
+        return max(self.members, key=lambda n: n.score or 0.0)
+
+    @property
+    def score(self) -> float:
+        return self.best.score or 0.0
+
+def merge_windows(nodes: List[NodeWithScore]) -> List[_Chunk]:
+    """
+    Groups the nodes into chunks: offset windows of the same document that overlap or
+    touch become one chunk spanning all of them; any other node is a chunk of its own.
+    """
+    chunks, spans_by_doc = [], {}
+    for n in nodes:
+        metadata = n.node.metadata
+        if WINDOW_START_KEY in metadata and n.node.ref_doc_id:
+            spans_by_doc.setdefault(n.node.ref_doc_id, []).append(n)
+        else:
+            chunks.append(_Chunk(n))
+    for doc_nodes in spans_by_doc.values():
+        doc_nodes.sort(key=lambda n: n.node.metadata[WINDOW_START_KEY])
+        current = None
+        for n in doc_nodes:
+            start, end = n.node.metadata[WINDOW_START_KEY], n.node.metadata[WINDOW_END_KEY]
+            # Sentence spans tile the text, so adjacent windows share an offset
+            if current is not None and start <= current.end:
+                current.members.append(n)
+                current.end = max(current.end, end)
+            else:
+                current = _Chunk(n, start, end)
+                chunks.append(current)
+    return chunks
+
+class ContextPacker(BaseNodePostprocessor):
+    """
+    Resolves sentence windows like WindowResolver, then packs them for synthesis:
+    overlapping or adjacent windows of a document are merged, near-duplicate text is
+    dropped and chunks are added by relevance until the token budget is spent.
+    A chunk that doesn't fit falls back to its best node's own window, then sentence.
+    """
+
+    token_budget: int = 3000
+    dedup_threshold: float = 0.8
+
+    _text_store: DocumentTextStore = PrivateAttr()
+    _tokenizer: Callable[[str], List] = PrivateAttr()
+    _last_report: Optional[Dict[str, Any]] = PrivateAttr(default=None)
+
+    def __init__(self, token_budget: int = None, dedup_threshold: float = None,
+                 text_store: Optional[DocumentTextStore] = None, tokenizer: Callable[[str], List] = None,
+                 **kwargs: Any):
+        super().__init__(
+            token_budget=token_budget or config.CONTEXT_TOKEN_BUDGET,
+            dedup_threshold=config.CONTEXT_DEDUP_THRESHOLD if dedup_threshold is None else dedup_threshold,
+            **kwargs,
+        )
+        self._text_store = text_store or get_document_text_store()
+        self._tokenizer = tokenizer or Settings.tokenizer
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "ContextPacker"
+
+    @property
+    def last_report(self) -> Optional[Dict[str, Any]]:
+        return self._last_report
+
+    def _tokens(self, n: NodeWithScore) -> int:
+        return len(self._tokenizer(n.node.get_content(metadata_mode=MetadataMode.LLM)))
+
+    def _with_window(self, n: NodeWithScore) -> Optional[NodeWithScore]:
+        """A copy of n holding its resolved window, or None if it has no window."""
+        window = resolve_window(n.node, self._text_store)
+        if window is None:
+            return None
+        node = n.node.model_copy()
+        node.set_content(window)
+        return NodeWithScore(node=node, score=n.score)
+
+    def _candidates(self, chunk: _Chunk) -> List[NodeWithScore]:
+        """Versions of the chunk from widest to narrowest."""
+        best = chunk.best
+        candidates = []
+        if len(chunk.members) > 1:
+            text = self._text_store.get_text(best.node.ref_doc_id)
+            if text is not None:
+                node = best.node.model_copy()
+                node.metadata = {**best.node.metadata, WINDOW_START_KEY: chunk.start, WINDOW_END_KEY: chunk.end}
+                node.set_content(text[chunk.start:chunk.end])
+                candidates.append(NodeWithScore(node=node, score=chunk.score))
+        window = self._with_window(best)
+        if window is not None:
+            candidates.append(window)
+        candidates.append(NodeWithScore(node=best.node.model_copy(), score=chunk.score))
+        return candidates
+
+    def _postprocess_nodes(self, nodes: List[NodeWithScore],
+                           query_bundle: Optional[QueryBundle] = None) -> List[NodeWithScore]:
+        if not nodes:
+            return nodes
+        # What WindowResolver alone would have sent
+        tokens_before = sum(self._tokens(self._with_window(n) or n) for n in nodes)
+
+        chunks = sorted(merge_windows(nodes), key=lambda c: c.score, reverse=True)
+        packed, kept_shingles, used, duplicates = [], [], 0, 0
+        for chunk in chunks:
+            for candidate in self._candidates(chunk):
+                shingles = _shingles(candidate.node.get_content())
+                if is_near_duplicate(shingles, kept_shingles, self.dedup_threshold):
+                    duplicates += 1
+                    break
+                tokens = self._tokens(candidate)
+                if used + tokens <= self.token_budget:
+                    packed.append(candidate)
+                    kept_shingles.append(shingles)
+                    used += tokens
+                    break
+        if not packed:
+            # Never leave synthesis without context: keep the best sentence over budget
+            packed.append(self._candidates(chunks[0])[-1])
+            used = self._tokens(packed[0])
+
+        report = {
+            "nodes_before": len(nodes),
+            "chunks_after": len(packed),
+            "near_duplicates": duplicates,
+            "tokens_before": tokens_before,
+            "tokens_after": used,
+            "tokens_saved": tokens_before - used,
+        }
+        self._last_report = report
+        with _totals_lock:
+            _totals["queries"] += 1
+            for key in ("tokens_before", "tokens_after", "nodes_before", "chunks_after"):
+                _totals[key] += report[key]
+        print(f"📦 Packed {len(nodes)} node(s) into {len(packed)} chunk(s): "
+              f"{tokens_before} → {used} prompt tokens ({report['tokens_saved']} saved, budget {self.token_budget})")
+        return packed
+
+def packing_stats() -> Dict[str, Any]:
+    """Totals over every query packed in this process."""
+    with _totals_lock:
+        stats = dict(_totals)
+    stats["tokens_saved"] = stats["tokens_before"] - stats["tokens_after"]
+    stats["avg_tokens_saved"] = round(stats["tokens_saved"] / stats["queries"], 1) if stats["queries"] else 0.0
+    return stats
@@ -0,0 +1,214 @@
+# /academic-rag-agent/embedding_cache.py
+import os
+import re
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+import numpy as np
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.bridge.pydantic import PrivateAttr
+
+import config
+
+try:
+    import fcntl
+except ImportError:  # Windows: only in-process locking
+    fcntl = None
+
+_KEY_BYTES = 16
+
+def embedding_key(text: str, kind: str = "text") -> bytes:
+    """Content address of a text. Queries and documents are embedded differently, so kind is part of the key."""
+    return hashlib.blake2b(f"{kind}\0{text}".encode("utf-8"), digest_size=_KEY_BYTES).digest()
+
+class EmbeddingCache:
+    """
+    Append-only on-disk embedding cache for one embedding model.
+
+    vectors.bin holds the embeddings as a row-major float32/float16 matrix and is
+    memory-mapped, so lookups return views without copying. keys.bin holds the
+    16-byte content hash of each row in the same order and acts as the offset index.
+    Appends take an exclusive file lock, so ingestion and the web app can share it.
+    """
+
+    def __init__(self, model_name: str = None, cache_dir: str = None, dtype: str = None):
+        self.model_name = model_name or config.EMBED_MODEL
+        safe_name = re.sub(r"[^A-Za-z0-9_.-]+", "_", self.model_name)
+        self.cache_dir = os.path.join(cache_dir or config.EMBEDDING_CACHE_DIR, safe_name)
+        self._keys_path = os.path.join(self.cache_dir, "keys.bin")
+        self._vectors_path = os.path.join(self.cache_dir, "vectors.bin")
+        self._meta_path = os.path.join(self.cache_dir, "meta.json")
+        self._lock_path = os.path.join(self.cache_dir, ".lock")
+
+        self._lock = threading.Lock()
+        self._rows: Dict[bytes, int] = {}
+        self._vectors = None
+        self.dim = None
+        self.dtype = np.dtype(dtype or config.EMBEDDING_CACHE_DTYPE)
+        self.hits = 0
+        self.misses = 0
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._refresh()
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def _read_meta(self):
+        """Takes dim and dtype from meta.json, which the first writer creates."""
+        if os.path.exists(self._meta_path):
+            with open(self._meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            self.dim = meta["dim"]
+            self.dtype = np.dtype(meta["dtype"])
+
+    def _refresh(self):
+        """Picks up rows appended since the last read, possibly by another process."""
+        if self.dim is None:
+            # Opened before anything was written; another process may have written since
+            self._read_meta()
+        if self.dim is None or not os.path.exists(self._keys_path):
+            return
+        row_bytes = self.dim * self.dtype.itemsize
+        # Rows are only valid once both their key and their vector are on disk
+        count = min(os.path.getsize(self._keys_path) // _KEY_BYTES,
+                    os.path.getsize(self._vectors_path) // row_bytes if os.path.exists(self._vectors_path) else 0)
+        known = len(self._rows)
+        if count <= known:
+            return
+        with open(self._keys_path, 'rb') as f:
+            f.seek(known * _KEY_BYTES)
+            data = f.read((count - known) * _KEY_BYTES)
+        for i in range(count - known):
+            self._rows.setdefault(data[i * _KEY_BYTES:(i + 1) * _KEY_BYTES], known + i)
+        self._vectors = np.memmap(self._vectors_path, dtype=self.dtype, mode='r', shape=(count, self.dim))
+
+    def get_many(self, keys: List[bytes]) -> List[Optional[np.ndarray]]:
+        """Cached rows for each key (views into the memory map), None for misses."""
+        with self._lock:
+            if any(k not in self._rows for k in keys):
+                self._refresh()
+            rows = [self._rows.get(k) for k in keys]
+            vectors = self._vectors
+            found = sum(r is not None for r in rows)
+            self.hits += found
+            self.misses += len(rows) - found
+        return [vectors[r] if r is not None else None for r in rows]
+
+    def put_many(self, keys: List[bytes], embeddings: List[List[float]]):
+        """Appends new embeddings. Keys that are already cached are skipped."""
+        if not keys:
+            return
+        matrix = np.asarray(embeddings, dtype=self.dtype)
+        with self._lock, open(self._lock_path, 'a') as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            if self.dim is None:
+                self.dim = int(matrix.shape[1])
+                with open(self._meta_path, 'w', encoding='utf-8') as f:
+                    json.dump({"model_name": self.model_name, "dim": self.dim, "dtype": self.dtype.name}, f)
+            self._refresh()
+
+            new, seen = [], set()
+            for i, k in enumerate(keys):
+                if k not in self._rows and k not in seen:
+                    new.append(i)
+                    seen.add(k)
+            if not new:
+                return
+
+            count = len(self._rows)
+            with open(self._vectors_path, 'ab') as f:
+                # Drop vectors left behind by an append that crashed before writing its keys
+                f.truncate(count * self.dim * self.dtype.itemsize)
+                f.write(matrix[new].tobytes())
+            with open(self._keys_path, 'ab') as f:
+                f.truncate(count * _KEY_BYTES)
+                f.write(b"".join(keys[i] for i in new))
+            self._refresh()
+
+    def stats(self) -> Dict[str, int]:
+        return {"entries": len(self._rows), "hits": self.hits, "misses": self.misses}
+
+_caches: Dict[str, EmbeddingCache] = {}
+_caches_lock = threading.Lock()
+
+def get_embedding_cache(model_name: str = None) -> EmbeddingCache:
+    """Process-wide cache instance for an embedding model."""
+    model_name = model_name or config.EMBED_MODEL
+    with _caches_lock:
+        if model_name not in _caches:
+            _caches[model_name] = EmbeddingCache(model_name)
+        return _caches[model_name]
+
+class CachedEmbedding(BaseEmbedding):
+    """
+    Embedding model wrapper that serves text embeddings from an EmbeddingCache.
+    User queries are unbounded, so their embeddings are only kept in a small
+    in-memory LRU and never appended to the on-disk cache.
+    """
+
+    _inner: BaseEmbedding = PrivateAttr()
+    _cache: EmbeddingCache = PrivateAttr()
+    _query_cache: "OrderedDict[bytes, List[float]]" = PrivateAttr()
+    _query_cache_size: int = PrivateAttr()
+    _query_lock: threading.Lock = PrivateAttr()
+
+    def __init__(self, inner: BaseEmbedding, cache: EmbeddingCache = None, query_cache_size: int = None, **kwargs):
+        super().__init__(model_name=inner.model_name, embed_batch_size=inner.embed_batch_size, **kwargs)
+        self._inner = inner
+        # An empty cache is falsy (__len__), so test for None explicitly
+        self._cache = cache if cache is not None else get_embedding_cache(inner.model_name)
+        self._query_cache = OrderedDict()
+        self._query_cache_size = config.QUERY_EMBEDDING_CACHE_SIZE if query_cache_size is None else query_cache_size
+        self._query_lock = threading.Lock()
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "CachedEmbedding"
+
+    @property
+    def inner(self) -> BaseEmbedding:
+        return self._inner
+
+    @property
+    def cache(self) -> EmbeddingCache:
+        return self._cache
+
+    def _get_query_embedding(self, query: str) -> List[float]:
+        key = embedding_key(query, kind="query")
+        with self._query_lock:
+            if key in self._query_cache:
+                self._query_cache.move_to_end(key)
+                return self._query_cache[key]
+        embedding = self._inner._get_query_embedding(query)
+        if self._query_cache_size:
+            with self._query_lock:
+                self._query_cache[key] = embedding
+                while len(self._query_cache) > self._query_cache_size:
+                    self._query_cache.popitem(last=False)
+        return embedding
+
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        return self._get_query_embedding(query)
+
+    def _get_text_embedding(self, text: str) -> List[float]:
+        return self._get_text_embeddings([text])[0]
+
+    async def _aget_text_embedding(self, text: str) -> List[float]:
+        return self._get_text_embedding(text)
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        keys = [embedding_key(t) for t in texts]
+        cached = self._cache.get_many(keys)
+        misses = [i for i, c in enumerate(cached) if c is None]
+        results = [c.tolist() if c is not None else None for c in cached]
+        if misses:
+            embeddings = self._inner._get_text_embeddings([texts[i] for i in misses])
+            self._cache.put_many([keys[i] for i in misses], embeddings)
+            for i, embedding in zip(misses, embeddings):
+                results[i] = embedding
+        return results
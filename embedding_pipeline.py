@@ -0,0 +1,197 @@
+# /academic-rag-agent/embedding_pipeline.py
+import os
+import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from llama_index.core.schema import BaseNode, MetadataMode
+
+import config
+from embedding_cache import embedding_key, get_embedding_cache
+
+# Embedding model of the current worker process, created once by _init_worker
+_worker_model = None
+
+# HuggingFaceEmbedding settings that change the vectors, copied into worker processes
+_WORKER_MODEL_FIELDS = ("max_length", "normalize", "query_instruction", "text_instruction", "cache_folder")
+
+def _init_worker(model_name: str, model_kwargs: Dict[str, Any], batch_size: int, threads: int):
+    """Loads one HuggingFaceEmbedding per worker process."""
+    global _worker_model
+    try:
+        import torch
+        # Keep workers from oversubscribing the cores between them
+        torch.set_num_threads(threads)
+    except ImportError:
+        pass
+    from llama_index.embeddings.huggingface import HuggingFaceEmbedding
+    _worker_model = HuggingFaceEmbedding(model_name=model_name, embed_batch_size=batch_size, **model_kwargs)
+
+def worker_model_spec(embed_model) -> Optional[Tuple[str, Dict[str, Any]]]:
+    """
+    (model name, settings) to rebuild embed_model in worker processes, or None if it
+    isn't a HuggingFaceEmbedding; such models are only ever run in-process.
+    """
+    # CachedEmbedding embeds texts with the model it wraps
+    model = getattr(embed_model, "inner", embed_model)
+    try:
+        from llama_index.embeddings.huggingface import HuggingFaceEmbedding
+    except ImportError:
+        return None
+    if not isinstance(model, HuggingFaceEmbedding):
+        return None
+    kwargs = {field: getattr(model, field) for field in _WORKER_MODEL_FIELDS if getattr(model, field, None) is not None}
+    return model.model_name, kwargs
+
+def _embed_batch(texts: List[str]) -> List[List[float]]:
+    return _worker_model.get_text_embedding_batch(texts)
+
+def resolve_workers(workers: int = None) -> int:
+    """EMBED_WORKERS <= 0 means one worker per CPU core."""
+    workers = config.EMBED_WORKERS if workers is None else workers
+    return workers if workers > 0 else (os.cpu_count() or 1)
+
+def effective_workers(num_texts: int, batch_size: int = None, workers: int = None) -> int:
+    """Number of worker processes embed_texts will actually use for num_texts."""
+    batch_size = batch_size or config.EMBED_BATCH_SIZE
+    num_batches = -(-num_texts // batch_size)
+    # Spawning workers costs one model load each; only worth it for real workloads
+    if num_texts < config.EMBED_PARALLEL_MIN_NODES:
+        return 1
+    return max(1, min(resolve_workers(workers), num_batches))
+
+def embed_texts(texts: List[str], embed_model, batch_size: int = None, workers: int = None) -> List[List[float]]:
+    """
+    Embeds texts in batches of batch_size, sharding batches across a process pool.
+    Small inputs, a single worker, or a model workers can't rebuild are embedded
+    in-process with embed_model.
+    """
+    batch_size = batch_size or config.EMBED_BATCH_SIZE
+    spec = worker_model_spec(embed_model)
+    workers = effective_workers(len(texts), batch_size, workers) if spec else 1
+    batches = [texts[i:i + batch_size] for i in range(0, len(texts), batch_size)]
+
+    if workers <= 1:
+        embeddings = []
+        for batch in batches:
+            embeddings.extend(embed_model.get_text_embedding_batch(batch))
+        return embeddings
+
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    embeddings = []
+    # spawn avoids forking a parent that already has torch threads running
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker,
+        initargs=(*spec, batch_size, threads),
+    ) as executor:
+        for batch_embeddings in executor.map(_embed_batch, batches):
+            embeddings.extend(batch_embeddings)
+    return embeddings
+
+class EmbeddingPool:
+    """
+    Embeds a stream of text batches with one long-lived worker pool. Embeds in-process
+    until EMBED_PARALLEL_MIN_NODES texts have been seen, then starts the pool once, so
+    streaming ingestion doesn't pay a model load per batch.
+    """
+
+    def __init__(self, embed_model, batch_size: int = None, workers: int = None):
+        self.embed_model = embed_model
+        self.batch_size = batch_size or config.EMBED_BATCH_SIZE
+        self._spec = worker_model_spec(embed_model)
+        self.workers = resolve_workers(workers) if self._spec else 1
+        self.seen = 0
+        self._executor = None
+
+    @property
+    def active_workers(self) -> int:
+        return self.workers if self._executor is not None else 1
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        self.seen += len(texts)
+        if self._executor is None and self.workers > 1 and self.seen >= config.EMBED_PARALLEL_MIN_NODES:
+            threads = max(1, (os.cpu_count() or 1) // self.workers)
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(*self._spec, self.batch_size, threads),
+            )
+        batches = [texts[i:i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+        embeddings = []
+        if self._executor is None:
+            for batch in batches:
+                embeddings.extend(self.embed_model.get_text_embedding_batch(batch))
+        else:
+            for batch_embeddings in self._executor.map(_embed_batch, batches):
+                embeddings.extend(batch_embeddings)
+        return embeddings
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def embed_nodes(nodes: Sequence[BaseNode], embed_model, batch_size: int = None,
+                workers: int = None, cache=None, pool: EmbeddingPool = None,
+                verbose: bool = True) -> Dict[str, Any]:
+    """
+    Sets node.embedding on every node that doesn't have one yet, taking
+    embeddings from the embedding cache where possible. With a pool, misses are
+    embedded by its long-lived workers.
+    Returns throughput stats for sizing ingestion machines.
+    """
+    if cache is None and config.ENABLE_EMBEDDING_CACHE:
+        cache = get_embedding_cache(embed_model.model_name)
+
+    start = time.perf_counter()
+    pending = [n for n in nodes if n.embedding is None]
+    texts = [n.get_content(metadata_mode=MetadataMode.EMBED) for n in pending]
+
+    cache_hits = 0
+    if cache is not None:
+        keys = [embedding_key(t) for t in texts]
+        misses = []
+        for i, (node, cached) in enumerate(zip(pending, cache.get_many(keys))):
+            if cached is None:
+                misses.append(i)
+            else:
+                node.embedding = cached.tolist()
+        cache_hits = len(pending) - len(misses)
+    else:
+        misses = list(range(len(pending)))
+
+    if pool is not None:
+        embeddings = pool.embed([texts[i] for i in misses]) if misses else []
+        workers = pool.active_workers
+    else:
+        workers = effective_workers(len(misses), batch_size, workers) if worker_model_spec(embed_model) else 1
+        embeddings = embed_texts([texts[i] for i in misses], embed_model, batch_size, workers)
+    for i, embedding in zip(misses, embeddings):
+        pending[i].embedding = embedding
+    if cache is not None:
+        cache.put_many([keys[i] for i in misses], embeddings)
+    elapsed = time.perf_counter() - start
+
+    stats = {
+        "nodes": len(pending),
+        "cache_hits": cache_hits,
+        "seconds": round(elapsed, 3),
+        "nodes_per_sec": round(len(pending) / elapsed, 1) if elapsed > 0 else 0.0,
+        "workers": workers,
+        "batch_size": batch_size or config.EMBED_BATCH_SIZE,
+    }
+    if pending and verbose:
+        print(f"Embedded {stats['nodes']} node(s) in {stats['seconds']}s "
+              f"({stats['nodes_per_sec']} nodes/sec, {cache_hits} from cache, "
+              f"{workers} worker(s), batch size {stats['batch_size']}).")
+    return stats
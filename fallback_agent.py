@@ -7,8 +7,21 @@ Provides basic functionality without requiring a knowledge base
 import os
 from datetime import datetime
 from llama_index.core import Settings
-from llama_index.llms.gemini import Gemini
-import config
+from resources import get_llm, llm_configured
+
+FALLBACK_HEADER = """🤖 **Fallback Mode Response**
+
+"""
+
+FALLBACK_FOOTER = """
+
+---
+⚠️ **Note**: The system is running in fallback mode. For full research capabilities with document analysis, please ensure:
+1. Your data files are uploaded and processed
+2. The knowledge base is properly initialized
+3. All dependencies are correctly installed
+
+You can check system status at `/debug` endpoint."""
 
 class FallbackAgent:
     """Simple fallback agent that works without a knowledge base"""
@@ -21,46 +34,57 @@ class FallbackAgent:
     def _setup_llm(self):
         """Setup just the LLM without requiring a knowledge base"""
         try:
-            api_key = os.getenv("GOOGLE_API_KEY")
-            if api_key:
-                self.llm = Gemini(model=config.LLM_MODEL, api_key=api_key)
+            if llm_configured():
+                self.llm = get_llm()
                 Settings.llm = self.llm
                 self.initialized = True
         except Exception as e:
             print(f"Failed to initialize fallback LLM: {e}")
     
-    def chat(self, message: str) -> str:
-        """Handle chat without knowledge base"""
+    def _build_prompt(self, message: str) -> str:
+        return f"""You are a helpful research assistant. The user asked: "{message}"
+
+Please provide a helpful response. Note that you don't have access to the local document collection at the moment, but you can still provide general information and guidance.
+
+User question: {message}"""
+    
+    def _unavailable_message(self):
         if not self.initialized:
             return "❌ The research agent is not fully initialized. Please check the system logs and ensure your GOOGLE_API_KEY is set correctly."
+        if not self.llm:
+            return "❌ Language model not available. Please check your GOOGLE_API_KEY configuration."
+        return None
+    
+    def chat(self, message: str) -> str:
+        """Handle chat without knowledge base"""
+        unavailable = self._unavailable_message()
+        if unavailable:
+            return unavailable
         
         try:
-            if not self.llm:
-                return "❌ Language model not available. Please check your GOOGLE_API_KEY configuration."
-            
             # Simple response without knowledge base
-            prompt = f"""You are a helpful research assistant. The user asked: "{message}"
-
-Please provide a helpful response. Note that you don't have access to the local document collection at the moment, but you can still provide general information and guidance.
-
-User question: {message}"""
-            
-            response = self.llm.complete(prompt)
+            response = self.llm.complete(self._build_prompt(message))
             
-            return f"""🤖 **Fallback Mode Response**
-
-{response.text}
-
----
-⚠️ **Note**: The system is running in fallback mode. For full research capabilities with document analysis, please ensure:
-1. Your data files are uploaded and processed
-2. The knowledge base is properly initialized
-3. All dependencies are correctly installed
-
-You can check system status at `/debug` endpoint."""
+            return FALLBACK_HEADER + response.text + FALLBACK_FOOTER
             
         except Exception as e:
             return f"❌ Error generating response: {str(e)}"
+    
+    def stream_chat(self, message: str):
+        """Like chat(), but yields the response in chunks as the LLM produces tokens"""
+        unavailable = self._unavailable_message()
+        if unavailable:
+            yield unavailable
+            return
+        
+        try:
+            yield FALLBACK_HEADER
+            for chunk in self.llm.stream_complete(self._build_prompt(message)):
+                if chunk.delta:
+                    yield chunk.delta
+            yield FALLBACK_FOOTER
+        except Exception as e:
+            yield f"❌ Error generating response: {str(e)}"
 
 def create_fallback_session():
     """Create a basic research session for fallback mode"""
@@ -1,9 +1,10 @@
 # /academic-rag-agent/ingestion.py
 
 import os
-import subprocess
+import time
+import queue
+import threading
 from pathlib import Path
-import qdrant_client
 from dotenv import load_dotenv
 import json
 
@@ -13,17 +14,25 @@ from llama_index.core import (
     StorageContext,
     VectorStoreIndex,
     Settings,
+    load_index_from_storage,
 )
-from llama_index.core.node_parser import SentenceWindowNodeParser
-from llama_index.core.storage.docstore import SimpleDocumentStore
-from llama_index.vector_stores.qdrant import QdrantVectorStore
+from llama_index.core.node_parser import SentenceSplitter
+from llama_index.core.schema import ImageDocument, ImageNode
 # from llama_index.llms.gemini import Gemini  # Removed: module does not exist
 from llama_index.llms.openai import OpenAI
-from llama_index.embeddings.huggingface import HuggingFaceEmbedding
 
 # Utility and Configuration Imports
-import pymupdf4llm
 import config
+from semantic_cache import write_index_version
+from bm25 import BM25Index
+from embedding_pipeline import EmbeddingPool, embed_nodes
+from reranker import TokenVectorStore, get_sentence_transformer, precompute_token_vectors
+from resources import get_embed_model, get_qdrant_client, rss_mb
+from pdf_parsing import clear_checkpoint, file_sha256, parse_pdfs
+from sqlite_docstore import docstore_exists, docstore_node_ids, load_docstore
+from sentence_windows import NODE_FORMAT, OffsetWindowNodeParser, get_document_text_store
+from qdrant_tuning import apply_collection_config, collection_options
+from vector_backends import NumpyVectorStore, build_vector_store, collection_exists
 
 # Load environment variables
 load_dotenv()
@@ -35,92 +44,381 @@ def setup_paths():
     os.makedirs(config.STORAGE_DIR, exist_ok=True)
     print("Directories are set up.")
 
-def parse_documents():
+def load_manifest() -> dict:
+    """Loads the per-PDF content-hash manifest from the previous ingestion run."""
+    if os.path.exists(config.MANIFEST_PATH):
+        try:
+            with open(config.MANIFEST_PATH, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except json.JSONDecodeError:
+            print("Ingestion manifest is corrupted. Re-ingesting everything.")
+    # No manifest means the existing index (if any) can't be updated incrementally
+    return {"embed_model": None, "files": {}}
+
+def save_manifest(manifest: dict):
+    """Atomically writes the ingestion manifest."""
+    tmp_path = config.MANIFEST_PATH + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, config.MANIFEST_PATH)
+
+def plan_ingestion(manifest: dict = None) -> dict:
+    """
+    Compares the PDFs on disk with the manifest.
+    Returns the PDFs that are new or changed, and the names of PDFs that were removed.
     """
-    Parses all PDFs using Nougat for text and PyMuPDF4LLM for images.
+    manifest = manifest or load_manifest()
+    previous = manifest.get("files", {})
+    full_rebuild = True
+    if not manifest.get("embed_model"):
+        print("No ingestion manifest found. Building the index from scratch.")
+    elif manifest["embed_model"] != config.EMBED_MODEL:
+        print(f"Embedding model changed to {config.EMBED_MODEL}. Re-ingesting everything.")
+    elif manifest.get("node_format") != NODE_FORMAT:
+        print("Node format changed. Re-ingesting everything so sentence windows are stored as offsets.")
+    else:
+        full_rebuild = False
+    if full_rebuild:
+        previous = {}
+
+    changed, current = [], {}
+    for pdf_path in sorted(Path(config.PDF_DIRECTORY).glob("*.pdf")):
+        stat = pdf_path.stat()
+        known = previous.get(pdf_path.name)
+        # Skip re-hashing when size and mtime are unchanged
+        if known and known.get("sha256") and known.get("size") == stat.st_size \
+                and known.get("mtime_ns") == stat.st_mtime_ns:
+            sha = known["sha256"]
+        else:
+            sha = file_sha256(pdf_path)
+        current[pdf_path.name] = {"sha256": sha, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+        if not known or known.get("sha256") != sha:
+            changed.append(pdf_path)
+
+    deleted = [name for name in previous if name not in current]
+    print(f"Ingestion plan: {len(changed)} new/changed, {len(deleted)} removed, "
+          f"{len(current) - len(changed)} unchanged PDF(s).")
+    return {
+        "manifest": manifest,
+        "full_rebuild": full_rebuild,
+        "changed": changed,
+        "deleted": deleted,
+        "current": current,
+    }
+
+def _outputs_for_pdf(pdf_name: str) -> list:
+    """Parsed markdown and extracted images produced for one PDF."""
+    outputs = []
+    markdown_path = Path(config.MARKDOWN_DIR) / f"{Path(pdf_name).stem}.mmd"
+    if markdown_path.exists():
+        outputs.append(markdown_path)
+    # PyMuPDF4LLM names images "<pdf file name>-<page>-<index>.<ext>"
+    outputs.extend(sorted(Path(config.IMAGE_DIR).glob(f"{pdf_name}-*")))
+    return outputs
+
+def _remove_outputs_for_pdf(pdf_name: str):
+    for path in _outputs_for_pdf(pdf_name):
+        path.unlink()
+    clear_checkpoint(pdf_name)
+
+def parse_documents(pdf_files: list = None, hashes: dict = None):
     """
-    pdf_files = list(Path(config.PDF_DIRECTORY).glob("*.pdf"))
+    Parses PDFs one per worker process: text-layer pages with PyMuPDF4LLM, scanned
+    pages with Nougat, images with PyMuPDF4LLM. Only the given PDFs are parsed; by
+    default every PDF in PDF_DIRECTORY. PDFs completed by an interrupted earlier run are skipped.
+    """
+    if pdf_files is None:
+        pdf_files = list(Path(config.PDF_DIRECTORY).glob("*.pdf"))
     if not pdf_files:
-        print(f"No PDF files found in {config.PDF_DIRECTORY}. Aborting.")
-        return
+        print("No new or changed PDF files to parse.")
+        return None
 
     print(f"Found {len(pdf_files)} PDF(s) to process.")
+    return parse_pdfs(pdf_files, hashes, before_parse=lambda p: _remove_outputs_for_pdf(p.name))
 
-    # --- 1. Semantic Parsing with Nougat ---
-    print("Starting Nougat to parse semantic structure...")
-    command = ["nougat", str(config.PDF_DIRECTORY), "-o", config.MARKDOWN_DIR]
-    subprocess.run(command, check=True)
-    print("Nougat processing complete.")
+def build_nodes(documents: list, node_parser) -> list:
+    """Splits text documents into sentence window nodes; images keep one node each."""
+    text_docs = [d for d in documents if not isinstance(d, ImageDocument)]
+    image_docs = [d for d in documents if isinstance(d, ImageDocument)]
+    nodes = node_parser.get_nodes_from_documents(text_docs)
+    nodes += SentenceSplitter().get_nodes_from_documents(image_docs)
+    return nodes
 
-    # --- 2. Image Extraction with PyMuPDF4LLM ---
-    print("Starting PyMuPDF4LLM to extract images...")
+def iter_node_batches(pdf_files: list, node_parser, batch_size: int = None):
+    """
+    Reads and splits one PDF at a time, yielding its nodes in batches of at most
+    batch_size. Each batch carries the PDF's documents and first/last flags, so
+    only one PDF's documents are held at once.
+    """
+    batch_size = batch_size or config.INGEST_BATCH_NODES
     for pdf_path in pdf_files:
-        pymupdf4llm.to_markdown(str(pdf_path), write_images=True, image_path=config.IMAGE_DIR)
-    print("Image extraction complete.")
+        outputs = _outputs_for_pdf(pdf_path.name)
+        if not any(p.suffix == ".mmd" for p in outputs):
+            print(f"⚠️  No parsed markdown for {pdf_path.name}; it will be retried next run.")
+            continue
+        documents = SimpleDirectoryReader(input_files=[str(p) for p in outputs], filename_as_id=True).load_data()
+        nodes = build_nodes(documents, node_parser)
+        print(f"Parsed {pdf_path.name}: {len(documents)} document(s), {len(nodes)} node(s).")
+        starts = range(0, len(nodes), batch_size) if nodes else [0]
+        for start in starts:
+            yield {
+                "pdf_path": pdf_path,
+                "documents": documents,
+                "nodes": nodes[start:start + batch_size],
+                "first": start == 0,
+                "last": start + batch_size >= len(nodes),
+            }
+
+_DONE = object()
+
+def bounded_prefetch(items, max_batches: int, memory_limit_mb: float = 0):
+    """
+    Runs the items generator in a background thread, at most max_batches ahead of
+    the consumer. While resident memory is above memory_limit_mb (0 = no limit), the
+    producer waits for the consumer to drain the queue before reading more.
+    """
+    buffer = queue.Queue(maxsize=max(1, max_batches))
+    stop = threading.Event()
+
+    def over_limit():
+        if not memory_limit_mb:
+            return False
+        rss = rss_mb()
+        return rss is not None and rss > memory_limit_mb
+
+    def produce():
+        try:
+            for item in items:
+                warned = False
+                while over_limit() and not buffer.empty() and not stop.is_set():
+                    if not warned:
+                        print(f"⏸️  Memory above {memory_limit_mb:.0f} MB; waiting for the embedder to catch up.")
+                        warned = True
+                    time.sleep(0.05)
+                while not stop.is_set():
+                    try:
+                        buffer.put(item, timeout=0.1)
+                        break
+                    except queue.Full:
+                        continue
+                if stop.is_set():
+                    return
+            buffer.put(_DONE)
+        except BaseException as e:
+            buffer.put(e)
+
+    producer = threading.Thread(target=produce, name="ingestion-reader", daemon=True)
+    producer.start()
+    try:
+        while True:
+            item = buffer.get()
+            if item is _DONE:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        stop.set()
+        producer.join(timeout=5)
+
+def upsert_nodes(nodes: list, vector_store, docstore):
+    """
+    Adds embedded nodes to a vector store, and to the docstore without their embeddings
+    so BM25 hits and vector IDs resolve to nodes. Unlike VectorStoreIndex.insert_nodes,
+    nothing is recorded per node in the index struct.
+    """
+    if not nodes:
+        return
+    vector_store.add(nodes)
+    stored = []
+    for node in nodes:
+        node = node.model_copy()
+        node.embedding = None
+        stored.append(node)
+    docstore.add_documents(stored, allow_update=True)
 
-def build_and_persist_index():
+def build_and_persist_index(plan: dict = None):
     """
-    Builds a multimodal index from parsed documents and persists it to disk.
+    Incrementally updates the multimodal index from parsed documents and persists it to disk.
+    Only documents of new or changed PDFs are embedded; nodes of removed or changed
+    PDFs are deleted from Qdrant and the docstore first.
     """
+    plan = plan or plan_ingestion()
+    manifest = plan["manifest"]
+    if not plan["changed"] and not plan["deleted"] and not plan["full_rebuild"]:
+        print("Index is up to date. Nothing to ingest.")
+        return
+
     print("Starting to build and persist the index...")
     
     # Configure models explicitly
     llm = OpenAI(model=config.LLM_MODEL, api_key=os.getenv("OPENAI_API_KEY"))
     # llm = Gemini(model=config.LLM_MODEL, api_key=os.getenv("GOOGLE_API_KEY"))  # Removed: Gemini not available
-    embed_model = HuggingFaceEmbedding(model_name=config.EMBED_MODEL)
+    embed_model = get_embed_model()
     print(f"Using LLM: {config.LLM_MODEL}")
     print(f"Using embedding model: {config.EMBED_MODEL}")
     
     # Set global settings
     Settings.llm = llm
     Settings.embed_model = embed_model
-    
-    text_docs = SimpleDirectoryReader(config.MARKDOWN_DIR, filename_as_id=True).load_data()
-    image_docs = SimpleDirectoryReader(config.IMAGE_DIR, filename_as_id=True).load_data()
-    print(f"Loaded {len(text_docs)} text documents and {len(image_docs)} images.")
 
-    docstore = SimpleDocumentStore()
-    if os.path.exists(config.DOCSTORE_PATH):
+    if plan["full_rebuild"]:
+        docstore = load_docstore(fresh=True)
+        print("Created a new document store for a full rebuild.")
+    elif docstore_exists():
         try:
-            docstore = SimpleDocumentStore.from_persist_path(config.DOCSTORE_PATH)
+            docstore = load_docstore()
             print("Loaded existing document store.")
         except json.JSONDecodeError:
             print("Docstore file is corrupted or empty. Creating a new one.")
-            pass
+            docstore = load_docstore(fresh=True)
     else:
+        docstore = load_docstore(fresh=True)
         print("Created a new document store.")
 
-    node_parser = SentenceWindowNodeParser.from_defaults(
-        window_size=3,
-        window_metadata_key="window",
-        original_text_metadata_key="original_text",
-    )
+    # Windows are stored as offsets into the document text, which is kept once per document
+    node_parser = OffsetWindowNodeParser(window_size=config.SENTENCE_WINDOW_SIZE)
+    doc_texts = get_document_text_store()
+    if plan["full_rebuild"]:
+        doc_texts.clear()
     
-    client = qdrant_client.QdrantClient(path=config.QDRANT_PATH)
-    text_store = QdrantVectorStore(client=client, collection_name="text_collection")
-    image_store = QdrantVectorStore(client=client, collection_name="image_collection")
+    collections = ("text_collection", "image_collection")
+    store_options = {}
+    if config.VECTOR_BACKEND == "numpy":
+        if plan["full_rebuild"]:
+            for collection in collections:
+                NumpyVectorStore(collection).clear()
+    else:
+        client = get_qdrant_client()
+        if plan["full_rebuild"]:
+            # Vectors from another embedding model can't be mixed with new ones
+            for collection in collections:
+                if client.collection_exists(collection):
+                    client.delete_collection(collection)
+        # Quantization, on-disk vectors and HNSW settings apply to new collections and are
+        # pushed to existing ones
+        if all(client.collection_exists(c) for c in collections):
+            for collection in collections:
+                apply_collection_config(client, collection)
+        else:
+            store_options = collection_options(len(embed_model.get_text_embedding("vector size probe")))
+        store_options["batch_size"] = config.QDRANT_UPSERT_BATCH_SIZE
+    text_store = build_vector_store("text_collection", **store_options)
+    image_store = build_vector_store("image_collection", **store_options)
     
+    index_store_path = os.path.join(config.STORAGE_DIR, "index_store.json")
+    has_index = os.path.exists(index_store_path) and not plan["full_rebuild"]
     storage_context = StorageContext.from_defaults(
         vector_store=text_store,
         image_store=image_store,
-        docstore=docstore
+        docstore=docstore,
+        persist_dir=config.STORAGE_DIR if has_index else None,
     )
+    # The index struct stays empty: nodes are written to the vector stores and the docstore
+    # directly, so index_store.json doesn't grow with the corpus
+    if has_index:
+        index = load_index_from_storage(storage_context, embed_model=embed_model)
+        if index.index_struct.nodes_dict:
+            # Written by an earlier version that mapped every node in the index struct
+            index.index_struct.nodes_dict.clear()
+            index.index_struct.doc_id_dict.clear()
+            storage_context.index_store.add_index_struct(index.index_struct)
+        print("Loaded existing index for incremental update.")
+    else:
+        index = VectorStoreIndex(nodes=[], storage_context=storage_context, embed_model=embed_model)
+
+    def delete_document(doc_id: str):
+        text_store.delete(doc_id)
+        if collection_exists("image_collection"):
+            image_store.delete(doc_id)
+        docstore.delete_ref_doc(doc_id, raise_error=False)
+        doc_texts.delete(doc_id)
+
+    # --- Drop nodes of removed and changed PDFs ---
+    previous = {} if plan["full_rebuild"] else manifest.get("files", {})
+    stale = plan["deleted"] + [p.name for p in plan["changed"] if p.name in previous]
+    for pdf_name in stale:
+        for doc_id in previous[pdf_name].get("doc_ids", []):
+            delete_document(doc_id)
+        if pdf_name in plan["deleted"]:
+            _remove_outputs_for_pdf(pdf_name)
+    if stale:
+        print(f"Removed nodes of {len(stale)} removed/changed PDF(s).")
 
-    # Explicitly pass the embedding model to ensure it's used
-    print("Building index with explicit embedding model...")
-    index = VectorStoreIndex.from_documents(
-        text_docs + image_docs,
-        storage_context=storage_context,
-        node_parser=node_parser,
-        embed_model=embed_model,  # Explicitly pass the embedding model
-        show_progress=True,
+    # --- Stream documents of new and changed PDFs through split -> embed -> upsert ---
+    files = {
+        name: {**plan["current"][name], "doc_ids": info.get("doc_ids", [])}
+        for name, info in previous.items()
+        if name not in stale and name in plan["current"]
+    }
+    token_store = None
+    if config.RERANKER_TYPE == "late_interaction":
+        token_store = TokenVectorStore(config.TOKEN_VECTORS_DIR)
+        if token_store.stale:
+            print("Token vectors were computed with another embedding model. Recomputing them.")
+            token_store.reset()
+        token_model = get_sentence_transformer(embed_model)
+
+    totals = {"nodes": 0, "cache_hits": 0, "embed_seconds": 0.0, "upsert_seconds": 0.0}
+    batches = bounded_prefetch(
+        iter_node_batches(plan["changed"], node_parser),
+        max_batches=config.INGEST_QUEUE_BATCHES,
+        memory_limit_mb=config.INGEST_MEMORY_LIMIT_MB,
     )
-    
+    with EmbeddingPool(embed_model) as pool:
+        for batch in batches:
+            pdf_path, documents, nodes = batch["pdf_path"], batch["documents"], batch["nodes"]
+            if batch["first"]:
+                # Nodes left by an interrupted run would otherwise be duplicated
+                for doc in documents:
+                    if docstore.get_ref_doc_info(doc.doc_id) is not None:
+                        delete_document(doc.doc_id)
+                doc_texts.put_documents([d for d in documents if not isinstance(d, ImageDocument)])
+            stats = embed_nodes(nodes, embed_model, pool=pool, verbose=False)
+            totals["nodes"] += stats["nodes"]
+            totals["cache_hits"] += stats["cache_hits"]
+            totals["embed_seconds"] += stats["seconds"]
+
+            upsert_start = time.perf_counter()
+            # Nodes already carry embeddings, so this only upserts into the vector stores and docstore
+            upsert_nodes([n for n in nodes if not isinstance(n, ImageNode)], text_store, docstore)
+            upsert_nodes([n for n in nodes if isinstance(n, ImageNode)], image_store, docstore)
+            totals["upsert_seconds"] += time.perf_counter() - upsert_start
+            if token_store is not None:
+                precompute_token_vectors(nodes, token_store, token_model, save=False, verbose=False)
+
+            if batch["last"]:
+                for doc in documents:
+                    docstore.set_document_hash(doc.doc_id, doc.hash)
+                files[pdf_path.name] = {**plan["current"][pdf_path.name], "doc_ids": [d.doc_id for d in documents]}
+        workers = pool.active_workers
+    if totals["nodes"]:
+        print(f"Embedded {totals['nodes']} node(s) in {totals['embed_seconds']:.2f}s "
+              f"({totals['nodes'] / max(totals['embed_seconds'], 1e-9):.1f} nodes/sec, "
+              f"{totals['cache_hits']} from cache, {workers} worker(s)).")
+        print(f"Upserted {totals['nodes']} node(s) in {totals['upsert_seconds']:.2f}s "
+              f"({totals['nodes'] / max(totals['upsert_seconds'], 1e-9):.1f} nodes/sec).")
+
+    # --- Rebuild the BM25 keyword index over the updated docstore ---
+    # Postings are spilled to disk in blocks, so memory stays flat as the corpus grows
+    bm25_index = BM25Index.build_from_docstore(docstore, config.BM25_DIR)
+    print(f"BM25 index built over {len(bm25_index)} text node(s).")
+
+    # --- Drop token vectors of removed nodes; new ones were added per batch ---
+    if token_store is not None:
+        # BM25 skips nodes without keyword tokens, so its postings can't tell which nodes still exist
+        token_store.prune(docstore_node_ids(docstore))
+        token_store.save()
+
     index.storage_context.persist(persist_dir=config.STORAGE_DIR)
+    # Bumping the version invalidates answers cached against the previous index
+    write_index_version()
+    save_manifest({"embed_model": config.EMBED_MODEL, "node_format": NODE_FORMAT, "files": files})
     print(f"Index and document store have been persisted to {config.STORAGE_DIR}")
 
 if __name__ == "__main__":
     setup_paths()
-    parse_documents()
-    build_and_persist_index()
+    plan = plan_ingestion()
+    parse_documents(plan["changed"], {name: info["sha256"] for name, info in plan["current"].items()})
+    build_and_persist_index(plan)
     print("Ingestion process complete.")
\ No newline at end of file
@@ -0,0 +1,177 @@
+# /academic-rag-agent/jobs.py
+import time
+import uuid
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+import config
+from research_events import bind_sink
+
+class QueueFullError(Exception):
+    """Raised when the job queue is at JOB_MAX_PENDING."""
+
+class JobCancelled(BaseException):
+    """
+    Raised inside a job's thread at the next progress event or checkpoint after it was
+    cancelled. Not an Exception, so agent tool error handling can't swallow it.
+    """
+
+class Job:
+    """One research request and its status, progress and result."""
+
+    def __init__(self, query: str, runner_kwargs: Dict[str, Any] = None):
+        self.id = uuid.uuid4().hex
+        self.query = query
+        self.runner_kwargs = runner_kwargs or {}
+        self.status = "queued"  # queued -> running [-> cancelling] -> succeeded | failed | cancelled
+        self.progress: Dict[str, Any] = {"stage": "queued", "completed_subtasks": 0, "total_subtasks": None}
+        self.result: Optional[str] = None
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.cancel_requested = threading.Event()
+        self.future = None
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("succeeded", "failed", "cancelled")
+
+    def checkpoint(self):
+        """The job's cancellation point, reached on every progress event and before each sub-task."""
+        if self.cancel_requested.is_set():
+            raise JobCancelled(f"Job {self.id} was cancelled")
+
+    def emit(self, event: str, data: Dict[str, Any]):
+        """Progress sink for research_events."""
+        self.checkpoint()
+        if event == "step":
+            self.progress["stage"] = f"{data.get('tool')}: {data.get('input')}"
+        elif event == "strategy":
+            self.progress["total_subtasks"] = data.get("total")
+            self.progress["pending_subtasks"] = data.get("total")
+        elif event == "retrieved":
+            self.progress["stage"] = f"Sub-Analysis {data.get('index')} of {data.get('total')} retrieved"
+        elif event == "subtask":
+            self.progress["completed_subtasks"] += 1
+            self.progress["pending_subtasks"] = max(0, (self.progress.get("total_subtasks") or 0)
+                                                    - self.progress["completed_subtasks"])
+            self.progress["last_completed_subtask"] = data.get("query")
+            self.progress["stage"] = f"Sub-Analysis {data.get('index')} of {data.get('total')} finished"
+        elif event == "token":
+            self.progress["stage"] = "writing answer"
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.id,
+            "query": self.query,
+            "status": self.status,
+            "progress": dict(self.progress),
+            "result": self.result,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+class JobManager:
+    """
+    Bounded worker pool for long research requests. Submissions beyond
+    max_pending queued or running jobs are rejected with QueueFullError.
+    Finished jobs are kept for result_ttl seconds.
+    """
+
+    def __init__(self, runner: Callable[..., str], workers: int = None,
+                 max_pending: int = None, result_ttl: float = None):
+        self._runner = runner
+        self._workers = workers or config.JOB_WORKERS
+        self.max_pending = max_pending or config.JOB_MAX_PENDING
+        self.result_ttl = config.JOB_RESULT_TTL if result_ttl is None else result_ttl
+        self._executor = ThreadPoolExecutor(max_workers=self._workers, thread_name_prefix="research-job")
+        self._jobs: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+
+    def _purge(self):
+        """Drops finished jobs past their TTL. Caller holds the lock."""
+        cutoff = time.time() - self.result_ttl
+        expired = [job_id for job_id, job in self._jobs.items()
+                   if job.finished and job.finished_at is not None and job.finished_at < cutoff]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    def pending_count(self) -> int:
+        with self._lock:
+            return sum(not job.finished for job in self._jobs.values())
+
+    def submit(self, query: str, **runner_kwargs) -> Job:
+        """Queues runner(query, **runner_kwargs)."""
+        job = Job(query, runner_kwargs)
+        with self._lock:
+            self._purge()
+            if sum(not j.finished for j in self._jobs.values()) >= self.max_pending:
+                raise QueueFullError(f"Job queue is full ({self.max_pending} pending)")
+            self._jobs[job.id] = job
+            job.future = self._executor.submit(self._run, job)
+        return job
+
+    def _run(self, job: Job):
+        try:
+            if job.cancel_requested.is_set():
+                return
+            job.status = "running"
+            job.started_at = time.time()
+            job.progress["stage"] = "started"
+            with bind_sink(job):
+                result = self._runner(job.query, **job.runner_kwargs)
+            if job.cancel_requested.is_set():
+                return
+            job.result = result
+            job.status = "succeeded"
+            job.progress["stage"] = "done"
+        except JobCancelled:
+            pass
+        except Exception as e:
+            if not job.cancel_requested.is_set():
+                job.error = str(e)
+                job.status = "failed"
+                job.progress["stage"] = "failed"
+        finally:
+            # Only the worker finishes a cancelled job, so it counts as pending until its thread is free
+            if job.cancel_requested.is_set() or job.status == "running":
+                job.status = "cancelled"
+                job.progress["stage"] = "cancelled"
+            job.finished_at = time.time()
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            self._purge()
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id: str) -> Optional[Job]:
+        """
+        Cancels a job. Queued jobs never start and are cancelled at once; running
+        jobs are "cancelling" until they stop at their next progress event, and
+        still count toward max_pending until then. Their result is discarded.
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.finished:
+                return job
+            job.cancel_requested.set()
+            if job.future is not None and job.future.cancel():
+                job.status = "cancelled"
+                job.progress["stage"] = "cancelled"
+                job.finished_at = time.time()
+            else:
+                job.status = "cancelling"
+                job.progress["stage"] = "cancelling"
+            return job
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            self._purge()
+            counts: Dict[str, int] = {}
+            for job in self._jobs.values():
+                counts[job.status] = counts.get(job.status, 0) + 1
+            return {"workers": self._workers, "max_pending": self.max_pending, "jobs": counts}
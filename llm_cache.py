@@ -0,0 +1,276 @@
+# /academic-rag-agent/llm_cache.py
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from typing import Any, Dict, Optional, Sequence
+
+from llama_index.core.base.llms.types import (
+    ChatMessage,
+    ChatResponse,
+    ChatResponseAsyncGen,
+    ChatResponseGen,
+    CompletionResponse,
+    CompletionResponseAsyncGen,
+    CompletionResponseGen,
+    LLMMetadata,
+    MessageRole,
+)
+from llama_index.core.bridge.pydantic import PrivateAttr
+from llama_index.core.llms.llm import LLM
+
+import config
+
+class LLMCompletionCache:
+    """
+    Completions stored in SQLite, keyed by a hash of model, prompt and parameters.
+    Entries expire after ttl seconds; beyond max_entries the least recently used go.
+    """
+
+    def __init__(self, path: str = None, max_entries: int = None, ttl: float = None):
+        self.path = path or config.LLM_CACHE_PATH
+        self.max_entries = config.LLM_CACHE_MAX_ENTRIES if max_entries is None else max_entries
+        self.ttl = config.LLM_CACHE_TTL if ttl is None else ttl
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS completions ("
+            "key TEXT PRIMARY KEY, model TEXT NOT NULL, text TEXT NOT NULL, "
+            "created_at REAL NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS completions_last_access ON completions (last_access)")
+        self._conn.commit()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(model: str, kind: str, prompt: Any, params: Dict[str, Any]) -> str:
+        payload = json.dumps({"model": model, "kind": kind, "prompt": prompt, "params": params},
+                             sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT text, created_at FROM completions WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None and self.ttl and now - row[1] > self.ttl:
+                self._conn.execute("DELETE FROM completions WHERE key = ?", (key,))
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE completions SET last_access = ? WHERE key = ?", (now, key))
+            self.hits += 1
+            return row[0]
+
+    def put(self, key: str, model: str, text: str):
+        if not text:
+            return
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO completions (key, model, text, created_at, last_access) VALUES (?, ?, ?, ?, ?)",
+                (key, model, text, now, now),
+            )
+            count = self._conn.execute("SELECT COUNT(*) FROM completions").fetchone()[0]
+            if count > self.max_entries:
+                cursor = self._conn.execute(
+                    "DELETE FROM completions WHERE key IN "
+                    "(SELECT key FROM completions ORDER BY last_access LIMIT ?)",
+                    (count - self.max_entries,),
+                )
+                self.evictions += cursor.rowcount
+
+    def clear(self):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM completions")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM completions").fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            "entries": entries,
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "evictions": self.evictions,
+        }
+
+def _messages_key(messages: Sequence[ChatMessage]):
+    return [(m.role.value, m.content) for m in messages]
+
+class CachedLLM(LLM):
+    """
+    Wraps an LLM so repeated identical completions and chats are answered from an
+    LLMCompletionCache. Streaming calls replay a cached answer as a single chunk.
+    """
+
+    _llm: LLM = PrivateAttr()
+    _cache: LLMCompletionCache = PrivateAttr()
+
+    def __init__(self, llm: LLM, cache: LLMCompletionCache, **kwargs: Any):
+        super().__init__(callback_manager=llm.callback_manager, **kwargs)
+        self._llm = llm
+        self._cache = cache
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "CachedLLM"
+
+    @property
+    def inner(self) -> LLM:
+        return self._llm
+
+    @property
+    def cache(self) -> LLMCompletionCache:
+        return self._cache
+
+    @property
+    def metadata(self) -> LLMMetadata:
+        return self._llm.metadata
+
+    def _model(self) -> str:
+        return self._llm.metadata.model_name or self._llm.class_name()
+
+    def _params(self, kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        # Sampling settings live on the wrapped LLM; per-call kwargs can override them
+        return {
+            "temperature": getattr(self._llm, "temperature", None),
+            "max_tokens": getattr(self._llm, "max_tokens", None),
+            **kwargs,
+        }
+
+    def _complete_key(self, prompt: str, formatted: bool, kwargs: Dict[str, Any]) -> str:
+        return self._cache.make_key(self._model(), "complete", [prompt, formatted], self._params(kwargs))
+
+    def _chat_key(self, messages: Sequence[ChatMessage], kwargs: Dict[str, Any]) -> str:
+        return self._cache.make_key(self._model(), "chat", _messages_key(messages), self._params(kwargs))
+
+    @staticmethod
+    def _completion(text: str) -> CompletionResponse:
+        return CompletionResponse(text=text, delta=text, additional_kwargs={"llm_cache_hit": True})
+
+    @staticmethod
+    def _chat_response(text: str) -> ChatResponse:
+        return ChatResponse(message=ChatMessage(role=MessageRole.ASSISTANT, content=text), delta=text,
+                            additional_kwargs={"llm_cache_hit": True})
+
+    def complete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponse:
+        key = self._complete_key(prompt, formatted, kwargs)
+        cached = self._cache.get(key)
+        if cached is not None:
+            return self._completion(cached)
+        response = self._llm.complete(prompt, formatted=formatted, **kwargs)
+        self._cache.put(key, self._model(), response.text)
+        return response
+
+    def chat(self, messages: Sequence[ChatMessage], **kwargs: Any) -> ChatResponse:
+        key = self._chat_key(messages, kwargs)
+        cached = self._cache.get(key)
+        if cached is not None:
+            return self._chat_response(cached)
+        response = self._llm.chat(messages, **kwargs)
+        self._cache.put(key, self._model(), response.message.content or "")
+        return response
+
+    def stream_complete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponseGen:
+        key = self._complete_key(prompt, formatted, kwargs)
+        cached = self._cache.get(key)
+        if cached is not None:
+            return iter([self._completion(cached)])
+
+        def gen() -> CompletionResponseGen:
+            text = ""
+            for chunk in self._llm.stream_complete(prompt, formatted=formatted, **kwargs):
+                text = chunk.text
+                yield chunk
+            # Only complete streams are cached
+            self._cache.put(key, self._model(), text)
+        return gen()
+
+    def stream_chat(self, messages: Sequence[ChatMessage], **kwargs: Any) -> ChatResponseGen:
+        key = self._chat_key(messages, kwargs)
+        cached = self._cache.get(key)
+        if cached is not None:
+            return iter([self._chat_response(cached)])
+
+        def gen() -> ChatResponseGen:
+            text = ""
+            for chunk in self._llm.stream_chat(messages, **kwargs):
+                text = chunk.message.content or ""
+                yield chunk
+            self._cache.put(key, self._model(), text)
+        return gen()
+
+    async def acomplete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponse:
+        key = self._complete_key(prompt, formatted, kwargs)
+        cached = self._cache.get(key)
+        if cached is not None:
+            return self._completion(cached)
+        response = await self._llm.acomplete(prompt, formatted=formatted, **kwargs)
+        self._cache.put(key, self._model(), response.text)
+        return response
+
+    async def achat(self, messages: Sequence[ChatMessage], **kwargs: Any) -> ChatResponse:
+        key = self._chat_key(messages, kwargs)
+        cached = self._cache.get(key)
+        if cached is not None:
+            return self._chat_response(cached)
+        response = await self._llm.achat(messages, **kwargs)
+        self._cache.put(key, self._model(), response.message.content or "")
+        return response
+
+    async def astream_complete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponseAsyncGen:
+        key = self._complete_key(prompt, formatted, kwargs)
+        cached = self._cache.get(key)
+
+        async def gen() -> CompletionResponseAsyncGen:
+            if cached is not None:
+                yield self._completion(cached)
+                return
+            text = ""
+            async for chunk in await self._llm.astream_complete(prompt, formatted=formatted, **kwargs):
+                text = chunk.text
+                yield chunk
+            self._cache.put(key, self._model(), text)
+        return gen()
+
+    async def astream_chat(self, messages: Sequence[ChatMessage], **kwargs: Any) -> ChatResponseAsyncGen:
+        key = self._chat_key(messages, kwargs)
+        cached = self._cache.get(key)
+
+        async def gen() -> ChatResponseAsyncGen:
+            if cached is not None:
+                yield self._chat_response(cached)
+                return
+            text = ""
+            async for chunk in await self._llm.astream_chat(messages, **kwargs):
+                text = chunk.message.content or ""
+                yield chunk
+            self._cache.put(key, self._model(), text)
+        return gen()
+
+_shared_cache = None
+_shared_cache_lock = threading.Lock()
+
+def get_llm_cache() -> LLMCompletionCache:
+    """Returns the process-wide LLM completion cache."""
+    global _shared_cache
+    with _shared_cache_lock:
+        if _shared_cache is None:
+            _shared_cache = LLMCompletionCache()
+        return _shared_cache
+
+def llm_cache_stats() -> Optional[Dict[str, Any]]:
+    """Stats of the shared cache, or None if it was never created."""
+    return _shared_cache.stats() if _shared_cache is not None else None
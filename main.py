@@ -2,9 +2,8 @@
 import os
 from dotenv import load_dotenv
 from llama_index.core import Settings
-from llama_index.llms.gemini import Gemini
-from llama_index.embeddings.huggingface import HuggingFaceEmbedding
 import config
+from resources import get_embed_model, get_llm, llm_configured
 
 # Load environment variables FIRST
 load_dotenv()
@@ -15,13 +14,12 @@ def initialize_settings():
     print("Initializing Deep Research Agent with Gemini...")
     
     # Get API key
-    api_key = os.getenv("GOOGLE_API_KEY")
-    if not api_key:
+    if not llm_configured():
         raise ValueError("GOOGLE_API_KEY not found in environment variables")
     
     # Setup Gemini LLM
     try:
-        llm = Gemini(model=config.LLM_MODEL, api_key=api_key)
+        llm = get_llm()
         print(f"✅ Gemini LLM initialized: {config.LLM_MODEL}")
     except Exception as e:
         print(f"⚠️  Gemini not available: {e}")
@@ -29,7 +27,7 @@ def initialize_settings():
         llm = None
     
     # Setup local embeddings
-    embed_model = HuggingFaceEmbedding(model_name=config.EMBED_MODEL)
+    embed_model = get_embed_model()
     
     # Set global settings
     Settings.llm = llm
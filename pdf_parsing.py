@@ -0,0 +1,278 @@
+# /academic-rag-agent/pdf_parsing.py
+import os
+import json
+import time
+import signal
+import threading
+import hashlib
+import tempfile
+import subprocess
+import multiprocessing
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import config
+
+class PageTimeout(Exception):
+    """A single page took longer than PARSE_PAGE_TIMEOUT."""
+
+def file_sha256(path: Path) -> str:
+    """Content hash of a file, read in chunks."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+@contextmanager
+def page_deadline(seconds: float):
+    """Raises PageTimeout if the block runs longer than seconds. Only enforced on POSIX main threads."""
+    if not (hasattr(signal, "setitimer") and seconds > 0 and threading.current_thread() is threading.main_thread()):
+        yield
+        return
+
+    def _timeout(signum, frame):
+        raise PageTimeout(f"page exceeded {seconds}s")
+
+    previous = signal.signal(signal.SIGALRM, _timeout)
+    signal.setitimer(signal.ITIMER_REAL, seconds)
+    try:
+        yield
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
+def _checkpoint_path(pdf_name: str) -> Path:
+    return Path(config.PARSE_CHECKPOINT_DIR) / f"{pdf_name}.json"
+
+def markdown_path(pdf_name: str) -> Path:
+    return Path(config.MARKDOWN_DIR) / f"{Path(pdf_name).stem}.mmd"
+
+def load_checkpoint(pdf_name: str) -> Optional[Dict[str, Any]]:
+    path = _checkpoint_path(pdf_name)
+    if not path.exists():
+        return None
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except json.JSONDecodeError:
+        return None
+
+def is_checkpointed(pdf_path: Path, sha256: str) -> bool:
+    """True if this exact file was parsed completely by an earlier run."""
+    checkpoint = load_checkpoint(pdf_path.name)
+    return bool(checkpoint) and checkpoint.get("sha256") == sha256 and markdown_path(pdf_path.name).exists()
+
+def _write_checkpoint(pdf_name: str, data: Dict[str, Any]):
+    path = _checkpoint_path(pdf_name)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(".tmp")
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp_path, path)
+
+def clear_checkpoint(pdf_name: str):
+    path = _checkpoint_path(pdf_name)
+    if path.exists():
+        path.unlink()
+
+def classify_page(page) -> str:
+    """
+    "pymupdf" for pages with a usable text layer, "nougat" for pages that need
+    OCR-style parsing: little extractable text, or mostly covered by images (scans).
+    """
+    if config.PARSE_ROUTING in ("nougat", "pymupdf"):
+        return config.PARSE_ROUTING
+    chars = len(page.get_text("text").strip())
+    page_area = abs(page.rect.width * page.rect.height) or 1.0
+    image_area = sum(abs((info["bbox"][2] - info["bbox"][0]) * (info["bbox"][3] - info["bbox"][1]))
+                     for info in page.get_image_info())
+    coverage = min(image_area / page_area, 1.0)
+    if chars < config.PARSE_MIN_TEXT_CHARS or coverage >= config.PARSE_SCANNED_IMAGE_COVERAGE:
+        return "nougat"
+    return "pymupdf"
+
+def _page_ranges(pages: List[int]) -> List[Tuple[int, int]]:
+    """Contiguous (first, last) runs of 0-based page numbers."""
+    ranges = []
+    for page in sorted(pages):
+        if ranges and page == ranges[-1][1] + 1:
+            ranges[-1] = (ranges[-1][0], page)
+        else:
+            ranges.append((page, page))
+    return ranges
+
+def _run_nougat(pdf_path: Path, first: int, last: int) -> str:
+    """Nougat over a page range of one PDF; gets PARSE_PAGE_TIMEOUT per page."""
+    with tempfile.TemporaryDirectory(prefix="nougat-") as out_dir:
+        command = ["nougat", str(pdf_path), "-o", out_dir, "-p", f"{first + 1}-{last + 1}"]
+        subprocess.run(command, check=True, timeout=config.PARSE_PAGE_TIMEOUT * (last - first + 1),
+                       stdout=subprocess.DEVNULL)
+        output = Path(out_dir) / f"{pdf_path.stem}.mmd"
+        if not output.exists():
+            raise RuntimeError("nougat produced no markdown")
+        return output.read_text(encoding="utf-8")
+
+def parse_pdf(pdf_path: Path, sha256: str = None) -> Dict[str, Any]:
+    """
+    Parses one PDF into one markdown file. Each page is classified: text-layer pages
+    are converted by PyMuPDF4LLM, scanned pages go to Nougat in contiguous ranges.
+    PyMuPDF4LLM also extracts the images of every page. If Nougat fails on a range,
+    those pages keep their PyMuPDF4LLM output. Writes a checkpoint when done, so
+    later runs skip the file.
+    """
+    import pymupdf
+    import pymupdf4llm
+    pdf_path = Path(pdf_path)
+    start = time.perf_counter()
+    result = {
+        "name": pdf_path.name, "status": "failed", "pages": 0, "failed_pages": [], "error": None,
+        "routes": {"pymupdf": {"pages": 0, "seconds": 0.0}, "nougat": {"pages": 0, "seconds": 0.0}},
+    }
+    try:
+        sha256 = sha256 or file_sha256(pdf_path)
+        page_markdown: Dict[int, str] = {}
+        fallback_markdown: Dict[int, str] = {}
+        with pymupdf.open(str(pdf_path)) as doc:
+            result["pages"] = doc.page_count
+            routes = [classify_page(doc[i]) for i in range(doc.page_count)]
+            # The PyMuPDF4LLM pass covers every page, since it also extracts the images
+            fast_start = time.perf_counter()
+            for page in range(doc.page_count):
+                try:
+                    with page_deadline(config.PARSE_PAGE_TIMEOUT):
+                        markdown = pymupdf4llm.to_markdown(doc, pages=[page], write_images=True,
+                                                           image_path=config.IMAGE_DIR)
+                except Exception as e:
+                    print(f"⚠️  {pdf_path.name} page {page + 1}: PyMuPDF4LLM failed ({e})")
+                    result["failed_pages"].append(page + 1)
+                    continue
+                if routes[page] == "pymupdf":
+                    page_markdown[page] = markdown
+                else:
+                    fallback_markdown[page] = markdown
+            result["routes"]["pymupdf"]["seconds"] = round(time.perf_counter() - fast_start, 3)
+
+        nougat_pages = [i for i, route in enumerate(routes) if route == "nougat"]
+        result["routes"]["pymupdf"]["pages"] = len(routes) - len(nougat_pages)
+        result["routes"]["nougat"]["pages"] = len(nougat_pages)
+        nougat_start = time.perf_counter()
+        for first, last in _page_ranges(nougat_pages):
+            try:
+                # Keyed by the range's first page so the merge keeps page order
+                page_markdown[first] = _run_nougat(pdf_path, first, last)
+            except Exception as e:
+                reason = f"exceeded {config.PARSE_PAGE_TIMEOUT}s per page" \
+                    if isinstance(e, subprocess.TimeoutExpired) else str(e)
+                print(f"⚠️  {pdf_path.name} pages {first + 1}-{last + 1}: nougat failed ({reason}); "
+                      "using the PyMuPDF4LLM text instead")
+                for page in range(first, last + 1):
+                    if page in fallback_markdown:
+                        page_markdown[page] = fallback_markdown[page]
+                    elif page + 1 not in result["failed_pages"]:
+                        result["failed_pages"].append(page + 1)
+        result["routes"]["nougat"]["seconds"] = round(time.perf_counter() - nougat_start, 3)
+
+        if not page_markdown:
+            raise RuntimeError("no page could be parsed")
+        markdown_path(pdf_path.name).write_text(
+            "\n\n".join(page_markdown[page] for page in sorted(page_markdown)), encoding="utf-8")
+        result["failed_pages"].sort()
+        result["status"] = "done"
+    except Exception as e:
+        result["error"] = str(e)
+    result["seconds"] = round(time.perf_counter() - start, 3)
+    if result["status"] == "done":
+        _write_checkpoint(pdf_path.name, {"sha256": sha256, **result})
+    elif markdown_path(pdf_path.name).exists():
+        # Don't let ingestion pick up partial output
+        markdown_path(pdf_path.name).unlink()
+    return result
+
+def resolve_workers(workers: int = None) -> int:
+    """PARSE_WORKERS <= 0 means one worker per CPU core."""
+    workers = config.PARSE_WORKERS if workers is None else workers
+    return workers if workers > 0 else (os.cpu_count() or 1)
+
+def parse_pdfs(pdf_files: List[Path], hashes: Dict[str, str] = None, workers: int = None,
+               before_parse=None) -> Dict[str, Any]:
+    """
+    Parses PDFs across a process pool. Files checkpointed with the same content
+    hash are skipped. before_parse(pdf_path) runs in this process for each file
+    that will be parsed, e.g. to remove stale outputs.
+    Returns a summary with pages/sec and the failures.
+    """
+    hashes = dict(hashes or {})
+    start = time.perf_counter()
+    todo, skipped = [], []
+    for pdf_path in pdf_files:
+        sha256 = hashes.get(pdf_path.name) or file_sha256(pdf_path)
+        hashes[pdf_path.name] = sha256
+        if is_checkpointed(pdf_path, sha256):
+            skipped.append(pdf_path.name)
+        else:
+            clear_checkpoint(pdf_path.name)
+            if before_parse:
+                before_parse(pdf_path)
+            todo.append(pdf_path)
+    if skipped:
+        print(f"Skipping {len(skipped)} PDF(s) already parsed by an earlier run.")
+
+    results = []
+    workers = max(1, min(resolve_workers(workers), len(todo)))
+    if workers == 1:
+        for pdf_path in todo:
+            results.append(parse_pdf(pdf_path, hashes[pdf_path.name]))
+            _report(results[-1])
+    elif todo:
+        # spawn avoids forking a parent that may already hold model threads
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+            futures = {executor.submit(parse_pdf, p, hashes[p.name]): p for p in todo}
+            for future in as_completed(futures):
+                try:
+                    results.append(future.result())
+                except Exception as e:
+                    # A crashed worker (e.g. a segfault in a broken PDF) fails its files, not the batch
+                    results.append({"name": futures[future].name, "status": "failed", "pages": 0,
+                                    "failed_pages": [], "error": f"worker crashed: {e}"})
+                _report(results[-1])
+
+    elapsed = time.perf_counter() - start
+    pages = sum(r["pages"] for r in results if r["status"] == "done")
+    failed = [r for r in results if r["status"] != "done"]
+    summary = {
+        "parsed": len(results) - len(failed),
+        "skipped": len(skipped),
+        "failed": [{"name": r["name"], "error": r["error"]} for r in failed],
+        "failed_pages": {r["name"]: r["failed_pages"] for r in results if r["failed_pages"]},
+        "pages": pages,
+        "seconds": round(elapsed, 3),
+        "pages_per_sec": round(pages / elapsed, 2) if elapsed > 0 else 0.0,
+        "workers": workers,
+        "routes": {},
+    }
+    for route in ("pymupdf", "nougat"):
+        route_pages = sum(r["routes"][route]["pages"] for r in results if "routes" in r)
+        route_seconds = sum(r["routes"][route]["seconds"] for r in results if "routes" in r)
+        summary["routes"][route] = {
+            "pages": route_pages,
+            "seconds": round(route_seconds, 3),
+            "pages_per_sec": round(route_pages / route_seconds, 2) if route_seconds > 0 else 0.0,
+        }
+    print(f"Parsed {summary['parsed']} PDF(s), {pages} page(s) in {summary['seconds']}s "
+          f"({summary['pages_per_sec']} pages/sec, {workers} worker(s)); "
+          f"{len(skipped)} skipped, {len(failed)} failed.")
+    for route, stats in summary["routes"].items():
+        if stats["pages"]:
+            print(f"   {route}: {stats['pages']} page(s) in {stats['seconds']}s ({stats['pages_per_sec']} pages/sec)")
+    for failure in summary["failed"]:
+        print(f"❌ {failure['name']}: {failure['error']}")
+    return summary
+
+def _report(result: Dict[str, Any]):
+    if result["status"] == "done":
+        routes = result["routes"]
+        print(f"✅ {result['name']}: {result['pages']} page(s) in {result['seconds']}s "
+              f"({routes['pymupdf']['pages']} text layer, {routes['nougat']['pages']} via Nougat)")
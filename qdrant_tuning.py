@@ -0,0 +1,195 @@
+# /academic-rag-agent/qdrant_tuning.py
+import math
+import time
+import json
+import argparse
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from qdrant_client import models
+
+import config
+
+_QUANTIZED_BYTES_PER_DIM = {"none": 0.0, "scalar": 1.0, "binary": 1 / 8}
+
+def is_embedded() -> bool:
+    """Embedded Qdrant searches exhaustively and ignores HNSW, quantization and on-disk settings."""
+    return not config.QDRANT_URL
+
+def quantization_config() -> Optional[models.QuantizationConfig]:
+    """The quantization selected by QDRANT_QUANTIZATION, or None for full precision only."""
+    if config.QDRANT_QUANTIZATION == "scalar":
+        return models.ScalarQuantization(scalar=models.ScalarQuantizationConfig(
+            type=models.ScalarType.INT8, quantile=0.99, always_ram=config.QDRANT_QUANTIZED_ALWAYS_RAM,
+        ))
+    if config.QDRANT_QUANTIZATION == "binary":
+        return models.BinaryQuantization(binary=models.BinaryQuantizationConfig(
+            always_ram=config.QDRANT_QUANTIZED_ALWAYS_RAM,
+        ))
+    return None
+
+def hnsw_config() -> models.HnswConfigDiff:
+    return models.HnswConfigDiff(
+        m=config.QDRANT_HNSW_M, ef_construct=config.QDRANT_HNSW_EF_CONSTRUCT, on_disk=config.QDRANT_HNSW_ON_DISK,
+    )
+
+def collection_options(vector_size: int) -> Dict[str, Any]:
+    """QdrantVectorStore arguments that create a collection with the configured storage layout."""
+    return {
+        "dense_config": models.VectorParams(
+            size=vector_size,
+            distance=models.Distance.COSINE,
+            on_disk=config.QDRANT_ON_DISK,
+            hnsw_config=hnsw_config(),
+        ),
+        "quantization_config": quantization_config(),
+    }
+
+def apply_collection_config(client, collection_name: str):
+    """
+    Brings an existing collection in line with the configuration. Qdrant re-quantizes
+    and re-indexes in the background, so no vectors have to be re-embedded.
+    """
+    if is_embedded() or not client.collection_exists(collection_name):
+        return
+    client.update_collection(
+        collection_name=collection_name,
+        vectors_config={"": models.VectorParamsDiff(on_disk=config.QDRANT_ON_DISK, hnsw_config=hnsw_config())},
+        hnsw_config=hnsw_config(),
+        quantization_config=quantization_config() or models.Disabled.DISABLED,
+    )
+
+def search_params(rescore: Optional[bool] = None, oversampling: Optional[float] = None,
+                  ignore_quantization: bool = False) -> Optional[models.SearchParams]:
+    """
+    Query-time parameters: HNSW ef, and for quantized collections oversampling with
+    rescoring against the original vectors. None in embedded mode, which ignores them.
+    """
+    if is_embedded():
+        return None
+    quantization = None
+    if config.QDRANT_QUANTIZATION != "none":
+        quantization = models.QuantizationSearchParams(
+            ignore=ignore_quantization,
+            rescore=config.QDRANT_RESCORE if rescore is None else rescore,
+            oversampling=config.QDRANT_OVERSAMPLING if oversampling is None else oversampling,
+        )
+    return models.SearchParams(hnsw_ef=config.QDRANT_HNSW_EF or None, quantization=quantization)
+
+def vector_store_kwargs() -> Dict[str, Any]:
+    """Extra arguments for VectorIndexRetriever to pass to every Qdrant query."""
+    params = search_params()
+    return {"search_params": params} if params is not None else {}
+
+def estimate_memory_mb(points: int, dim: int, quantization: str, on_disk: bool,
+                       always_ram: bool = True, hnsw_m: int = None, hnsw_on_disk: bool = False) -> Dict[str, float]:
+    """
+    Approximate RAM and disk use of the vectors and HNSW graph of a collection.
+    Payloads are left out; they are the same in every layout.
+    """
+    hnsw_m = hnsw_m or config.QDRANT_HNSW_M
+    original = points * dim * 4
+    quantized = points * math.ceil(dim * _QUANTIZED_BYTES_PER_DIM[quantization])
+    # Level 0 of the graph keeps 2 * m links of 4 bytes per point
+    graph = points * hnsw_m * 2 * 4
+    ram = (0 if on_disk else original) + (quantized if always_ram or not on_disk else 0) + (0 if hnsw_on_disk else graph)
+    mb = 1024 * 1024
+    return {"ram_mb": round(ram / mb, 2), "disk_mb": round((original + quantized + graph) / mb, 2)}
+
+def _percentile(values: List[float], q: float) -> float:
+    return round(float(np.percentile(values, q)), 3) if values else 0.0
+
+def _timed_search(client, collection_name: str, queries: List[List[float]], top_k: int, params):
+    results, latencies = [], []
+    for vector in queries:
+        start = time.perf_counter()
+        response = client.query_points(collection_name, query=vector, limit=top_k,
+                                       search_params=params, with_payload=False)
+        latencies.append((time.perf_counter() - start) * 1000)
+        results.append([p.id for p in response.points])
+    return results, latencies
+
+def benchmark_collection(client, collection_name: str, num_queries: int = 100, top_k: int = 10) -> Dict[str, Any]:
+    """
+    Search latency and recall@top_k of the configured search modes against exact
+    search, using stored vectors as queries, plus memory estimates per layout.
+    """
+    info = client.get_collection(collection_name)
+    points, _ = client.scroll(collection_name, limit=num_queries, with_vectors=True, with_payload=False)
+    queries = [p.vector for p in points if p.vector is not None]
+    if not queries:
+        raise ValueError(f"Collection '{collection_name}' has no vectors to benchmark.")
+    dim = len(queries[0])
+    total = info.points_count or len(queries)
+
+    # Embedded Qdrant is always exact and warns about search params
+    modes = {"exact": None if is_embedded() else models.SearchParams(exact=True)}
+    if not is_embedded():
+        modes["hnsw"] = search_params(ignore_quantization=True)
+        if config.QDRANT_QUANTIZATION != "none":
+            modes["quantized"] = search_params(rescore=False, oversampling=1.0)
+            modes["quantized+rescore"] = search_params()
+
+    truth, _ = _timed_search(client, collection_name, queries, top_k, modes["exact"])
+    searches = {}
+    for mode, params in modes.items():
+        results, latencies = _timed_search(client, collection_name, queries, top_k, params)
+        hits = sum(len(set(r) & set(t)) for r, t in zip(results, truth))
+        searches[mode] = {
+            "recall": round(hits / max(1, sum(len(t) for t in truth)), 4),
+            "p50_ms": _percentile(latencies, 50),
+            "p95_ms": _percentile(latencies, 95),
+        }
+
+    layouts = {}
+    for quantization in ("none", "scalar", "binary"):
+        for on_disk in (False, True):
+            name = quantization + ("+on_disk" if on_disk else "")
+            layouts[name] = estimate_memory_mb(total, dim, quantization, on_disk,
+                                               hnsw_on_disk=config.QDRANT_HNSW_ON_DISK)
+    return {
+        "collection": collection_name,
+        "mode": "embedded" if is_embedded() else "server",
+        "points": total,
+        "dim": dim,
+        "queries": len(queries),
+        "top_k": top_k,
+        "configured": {
+            "quantization": config.QDRANT_QUANTIZATION,
+            "on_disk": config.QDRANT_ON_DISK,
+            "hnsw_m": config.QDRANT_HNSW_M,
+            "hnsw_ef": config.QDRANT_HNSW_EF,
+            "oversampling": config.QDRANT_OVERSAMPLING,
+            "rescore": config.QDRANT_RESCORE,
+        },
+        "search": searches,
+        "memory_estimates": layouts,
+    }
+
+def print_report(report: Dict[str, Any]):
+    print(f"\n📊 {report['collection']} ({report['mode']} Qdrant): {report['points']} points, "
+          f"dim {report['dim']}, {report['queries']} queries, recall@{report['top_k']} vs exact search")
+    if report["mode"] == "embedded":
+        print("⚠️  Embedded Qdrant always searches exactly; set QDRANT_URL to measure HNSW and quantization.")
+    print(f"{'search mode':<20}{'recall':>8}{'p50 ms':>10}{'p95 ms':>10}")
+    for mode, row in report["search"].items():
+        print(f"{mode:<20}{row['recall']:>8.3f}{row['p50_ms']:>10.2f}{row['p95_ms']:>10.2f}")
+    print(f"\n{'vector layout':<20}{'RAM MB':>10}{'disk MB':>10}")
+    for layout, row in report["memory_estimates"].items():
+        print(f"{layout:<20}{row['ram_mb']:>10.2f}{row['disk_mb']:>10.2f}")
+
+if __name__ == "__main__":
+    from resources import get_qdrant_client
+
+    parser = argparse.ArgumentParser(description="Compare Qdrant memory, latency and recall for the configured layout.")
+    parser.add_argument("--collection", default="text_collection")
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--json", help="also write the report to this path")
+    args = parser.parse_args()
+
+    report = benchmark_collection(get_qdrant_client(), args.collection, args.queries, args.top_k)
+    print_report(report)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
@@ -0,0 +1,257 @@
+# /academic-rag-agent/reranker.py
+import os
+import json
+import time
+import threading
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+from llama_index.core import Settings
+from llama_index.core.bridge.pydantic import Field, PrivateAttr
+from llama_index.core.postprocessor.types import BaseNodePostprocessor
+from llama_index.core.schema import BaseNode, ImageNode, MetadataMode, NodeWithScore, QueryBundle
+
+import config
+
+# Missing document vectors are encoded this many nodes at a time, checking the deadline between chunks
+_ONLINE_ENCODE_CHUNK = 4
+
+def get_sentence_transformer(embed_model=None):
+    """
+    The SentenceTransformer behind the configured embedding model, so token vectors
+    come from the already-loaded bge weights. Loads a CPU copy if it isn't reachable.
+    """
+    embed_model = embed_model or Settings.embed_model
+    # Unwrap CachedEmbedding and similar wrappers
+    embed_model = getattr(embed_model, "inner", embed_model)
+    model = getattr(embed_model, "_model", None)
+    if model is not None and hasattr(model, "encode"):
+        return model
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(config.EMBED_MODEL, device="cpu")
+
+def encode_token_vectors(model, texts: List[str]) -> List[np.ndarray]:
+    """L2-normalised per-token vectors (tokens x dim) for each text."""
+    if not texts:
+        return []
+    outputs = model.encode(texts, output_value="token_embeddings", convert_to_numpy=False,
+                           batch_size=config.EMBED_BATCH_SIZE, show_progress_bar=False)
+    vectors = []
+    for tokens in outputs:
+        matrix = tokens.float().cpu().numpy() if hasattr(tokens, "cpu") else np.asarray(tokens, dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        vectors.append(matrix / np.maximum(norms, 1e-12))
+    return vectors
+
+def quantize_int8(matrix: np.ndarray):
+    """Symmetric per-token int8 quantisation. Returns (int8 matrix, float32 scales)."""
+    scales = np.maximum(np.abs(matrix).max(axis=1), 1e-12) / 127.0
+    quantized = np.clip(np.rint(matrix / scales[:, None]), -127, 127).astype(np.int8)
+    return quantized, scales.astype(np.float32)
+
+class TokenVectorStore:
+    """
+    Document-side token vectors for late-interaction reranking, stored int8.
+
+    All tokens are concatenated in one memory-mapped (tokens x dim) int8 matrix with
+    a per-token float32 scale; index.json maps node_id -> [first token, token count].
+    """
+
+    def __init__(self, persist_dir: str = None):
+        self.persist_dir = persist_dir or config.TOKEN_VECTORS_DIR
+        self._vectors_path = os.path.join(self.persist_dir, "vectors.i8")
+        self._scales_path = os.path.join(self.persist_dir, "scales.f32")
+        self._index_path = os.path.join(self.persist_dir, "index.json")
+        self._lock = threading.Lock()
+        self.dim = None
+        self.spans: Dict[str, List[int]] = {}
+        self._vectors = None
+        self._scales = None
+        # Set when the files were written for another embedding model; only ingestion resets them
+        self.stale = False
+        self._load()
+
+    def __len__(self) -> int:
+        return len(self.spans)
+
+    def _load(self):
+        if not os.path.exists(self._index_path):
+            return
+        with open(self._index_path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        if data.get("model") != config.EMBED_MODEL:
+            # Token vectors of another model are useless; readers treat the store as empty
+            self.stale = True
+            return
+        self.dim = data["dim"]
+        self.spans = data["spans"]
+        self._map()
+
+    def _map(self):
+        total = os.path.getsize(self._scales_path) // 4 if os.path.exists(self._scales_path) else 0
+        if total == 0 or self.dim is None:
+            self._vectors, self._scales = None, None
+            return
+        self._vectors = np.memmap(self._vectors_path, dtype=np.int8, mode='r', shape=(total, self.dim))
+        self._scales = np.memmap(self._scales_path, dtype=np.float32, mode='r', shape=(total,))
+
+    def get(self, node_id: str) -> Optional[np.ndarray]:
+        """Dequantised token vectors of a node, or None if not stored."""
+        span = self.spans.get(node_id)
+        if span is None or self._vectors is None:
+            return None
+        start, length = span
+        return self._vectors[start:start + length].astype(np.float32) * self._scales[start:start + length, None]
+
+    def add(self, node_ids: Sequence[str], token_vectors: Sequence[np.ndarray]):
+        """Appends token vectors for nodes that aren't stored yet. Call save() to persist the index."""
+        with self._lock:
+            os.makedirs(self.persist_dir, exist_ok=True)
+            total = os.path.getsize(self._scales_path) // 4 if os.path.exists(self._scales_path) else 0
+            with open(self._vectors_path, 'ab') as vf, open(self._scales_path, 'ab') as sf:
+                for node_id, matrix in zip(node_ids, token_vectors):
+                    if node_id in self.spans or len(matrix) == 0:
+                        continue
+                    self.dim = self.dim or int(matrix.shape[1])
+                    quantized, scales = quantize_int8(matrix)
+                    vf.write(quantized.tobytes())
+                    sf.write(scales.tobytes())
+                    self.spans[node_id] = [total, len(matrix)]
+                    total += len(matrix)
+            self._map()
+
+    def reset(self):
+        """Deletes all stored vectors, e.g. those of another embedding model. For ingestion only."""
+        with self._lock:
+            for path in (self._vectors_path, self._scales_path, self._index_path):
+                if os.path.exists(path):
+                    os.remove(path)
+            self.dim, self.spans, self.stale = None, {}, False
+            self._vectors, self._scales = None, None
+
+    def save(self):
+        """Persists the node_id -> span index."""
+        with self._lock:
+            self._write_index()
+
+    def prune(self, keep_ids: set):
+        """Rewrites the store without nodes that are no longer in the index."""
+        with self._lock:
+            stale = [node_id for node_id in self.spans if node_id not in keep_ids]
+            if not stale or self._vectors is None:
+                return
+            spans, chunks, scales, total = {}, [], [], 0
+            for node_id, (start, length) in self.spans.items():
+                if node_id in keep_ids:
+                    chunks.append(np.array(self._vectors[start:start + length]))
+                    scales.append(np.array(self._scales[start:start + length]))
+                    spans[node_id] = [total, length]
+                    total += length
+            # Write new files and swap them in, so readers' memory maps stay valid
+            with open(self._vectors_path + ".tmp", 'wb') as vf, open(self._scales_path + ".tmp", 'wb') as sf:
+                for chunk, scale in zip(chunks, scales):
+                    vf.write(chunk.tobytes())
+                    sf.write(scale.tobytes())
+            os.replace(self._vectors_path + ".tmp", self._vectors_path)
+            os.replace(self._scales_path + ".tmp", self._scales_path)
+            self.spans = spans
+            self._write_index()
+            self._map()
+            print(f"Pruned token vectors of {len(stale)} removed node(s).")
+
+    def _write_index(self):
+        tmp_path = self._index_path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"model": config.EMBED_MODEL, "dim": self.dim, "spans": self.spans}, f)
+        os.replace(tmp_path, self._index_path)
+
+def precompute_token_vectors(nodes: Sequence[BaseNode], store: TokenVectorStore = None, model=None,
+                             save: bool = True, verbose: bool = True):
+    """
+    Computes and stores document-side token vectors for text nodes at ingestion time.
+    Streaming callers pass save=False per batch and call store.save() once at the end.
+    """
+    # An empty store is falsy (__len__), so test for None explicitly
+    store = store if store is not None else TokenVectorStore()
+    if store.stale:
+        store.reset()
+    pending = [n for n in nodes if not isinstance(n, ImageNode) and n.node_id not in store.spans]
+    if not pending:
+        return store
+    model = model or get_sentence_transformer()
+    start = time.perf_counter()
+    batch_size = config.EMBED_BATCH_SIZE
+    for i in range(0, len(pending), batch_size):
+        batch = pending[i:i + batch_size]
+        texts = [n.get_content(metadata_mode=MetadataMode.NONE) for n in batch]
+        store.add([n.node_id for n in batch], encode_token_vectors(model, texts))
+    if save:
+        store.save()
+    if verbose:
+        print(f"Stored token vectors for {len(pending)} node(s) in {time.perf_counter() - start:.2f}s.")
+    return store
+
+class LateInteractionReranker(BaseNodePostprocessor):
+    """
+    ColBERT-style MaxSim reranker over token vectors of the embedding model.
+    Document token vectors come from the int8 TokenVectorStore filled at ingestion;
+    missing ones are computed on the fly. If the latency budget runs out, the
+    retrieval order is kept.
+    """
+
+    top_n: int = Field(description="Number of nodes to return after reranking.")
+    latency_budget_ms: float = Field(description="Give up and keep retrieval order after this long.")
+    _store: Any = PrivateAttr()
+    _model: Any = PrivateAttr()
+
+    def __init__(self, top_n: int = None, latency_budget_ms: float = None,
+                 store: TokenVectorStore = None, model=None):
+        super().__init__(
+            top_n=top_n or config.RERANKER_TOP_N,
+            latency_budget_ms=config.RERANKER_LATENCY_BUDGET_MS if latency_budget_ms is None else latency_budget_ms,
+        )
+        self._store = store if store is not None else TokenVectorStore()
+        self._model = model or get_sentence_transformer()
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "LateInteractionReranker"
+
+    def _postprocess_nodes(self, nodes: List[NodeWithScore],
+                           query_bundle: Optional[QueryBundle] = None) -> List[NodeWithScore]:
+        if query_bundle is None or len(nodes) <= 1:
+            return nodes[:self.top_n]
+
+        deadline = time.perf_counter() + self.latency_budget_ms / 1000.0
+        query_vectors = encode_token_vectors(self._model, [query_bundle.query_str])[0]
+
+        doc_vectors = [self._store.get(n.node.node_id) for n in nodes]
+        missing = [i for i, v in enumerate(doc_vectors) if v is None]
+        # Encoding in small chunks bounds the overrun to one chunk instead of every missing node
+        for start in range(0, len(missing), _ONLINE_ENCODE_CHUNK):
+            if time.perf_counter() > deadline:
+                return nodes[:self.top_n]
+            chunk = missing[start:start + _ONLINE_ENCODE_CHUNK]
+            texts = [nodes[i].node.get_content(metadata_mode=MetadataMode.NONE) for i in chunk]
+            for i, vectors in zip(chunk, encode_token_vectors(self._model, texts)):
+                doc_vectors[i] = vectors
+
+        if time.perf_counter() > deadline:
+            return nodes[:self.top_n]
+
+        scored = []
+        for n, vectors in zip(nodes, doc_vectors):
+            # MaxSim: each query token takes its best-matching document token
+            score = float((query_vectors @ vectors.T).max(axis=1).sum()) if len(vectors) else 0.0
+            scored.append(NodeWithScore(node=n.node, score=score))
+        scored.sort(key=lambda n: n.score, reverse=True)
+        return scored[:self.top_n]
+
+def build_reranker() -> Optional[BaseNodePostprocessor]:
+    """Creates the reranking stage selected by RERANKER_TYPE, or None if disabled."""
+    if config.RERANKER_TYPE == "none":
+        return None
+    if config.RERANKER_TYPE == "cross_encoder":
+        from llama_index.core.postprocessor import SentenceTransformerRerank
+        return SentenceTransformerRerank(top_n=config.RERANKER_TOP_N, model=config.RERANKER_MODEL, device="cpu")
+    return LateInteractionReranker()
@@ -0,0 +1,63 @@
+# /academic-rag-agent/research_events.py
+import json
+import queue
+import contextvars
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+# Sink of the research request running in the current thread, if anyone is listening
+_current_sink = contextvars.ContextVar("research_event_sink", default=None)
+
+_CLOSED = object()
+
+class EventSink:
+    """Thread-safe queue of progress events produced while one research request runs."""
+
+    def __init__(self):
+        self._queue = queue.Queue()
+
+    def emit(self, event: str, data: Dict[str, Any]):
+        self._queue.put((event, data))
+
+    def close(self):
+        self._queue.put(_CLOSED)
+
+    def events(self, keepalive: float = 15.0) -> Iterator[Optional[Tuple[str, Dict[str, Any]]]]:
+        """Yields (event, data) until closed; yields None every keepalive seconds of silence."""
+        while True:
+            try:
+                item = self._queue.get(timeout=keepalive)
+            except queue.Empty:
+                yield None
+                continue
+            if item is _CLOSED:
+                return
+            yield item
+
+def emit(event: str, **data):
+    """Publishes a progress event to the current request's sink. No-op when nobody listens."""
+    sink = _current_sink.get()
+    if sink is not None:
+        sink.emit(event, data)
+
+def current_sink():
+    return _current_sink.get()
+
+def checkpoint():
+    """Lets the current request's sink stop the work (e.g. a cancelled job) before it continues."""
+    sink = _current_sink.get()
+    if sink is not None and hasattr(sink, "checkpoint"):
+        sink.checkpoint()
+
+@contextmanager
+def bind_sink(sink):
+    """Routes emit() calls made in this context to sink."""
+    token = _current_sink.set(sink)
+    try:
+        yield sink
+    finally:
+        _current_sink.reset(token)
+
+def format_sse(event: str, data: Dict[str, Any]) -> str:
+    """Encodes one Server-Sent Events message."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
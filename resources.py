@@ -0,0 +1,112 @@
+# /academic-rag-agent/resources.py
+import os
+import time
+import threading
+from typing import Any, Callable, Dict, Optional
+
+import config
+
+class _Resource:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.loaded = False
+        self.instance = None
+        self.load_seconds = None
+        self.memory_mb = None
+
+_resources: Dict[str, _Resource] = {}
+_registry_lock = threading.Lock()
+
+def rss_mb() -> Optional[float]:
+    """Resident memory of this process in MB, or None if it can't be read."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss / (1024 * 1024)
+    except ImportError:
+        return None
+
+def get_resource(name: str, loader: Callable[[], Any]) -> Any:
+    """
+    The shared instance of a heavyweight resource, created by loader on first use.
+    Concurrent first calls wait for one load. Failed loads aren't cached.
+    """
+    with _registry_lock:
+        resource = _resources.setdefault(name, _Resource())
+    if resource.loaded:
+        return resource.instance
+    with resource.lock:
+        if not resource.loaded:
+            rss_before = rss_mb()
+            start = time.perf_counter()
+            resource.instance = loader()
+            resource.load_seconds = round(time.perf_counter() - start, 3)
+            rss_after = rss_mb()
+            # Approximate: other threads allocating meanwhile are counted too
+            if rss_before is not None and rss_after is not None:
+                resource.memory_mb = round(rss_after - rss_before, 1)
+            resource.loaded = True
+            print(f"✅ Loaded {name} in {resource.load_seconds}s (+{resource.memory_mb} MB)")
+    return resource.instance
+
+def resource_stats() -> Dict[str, Any]:
+    """Load time and memory growth of every resource loaded so far."""
+    with _registry_lock:
+        items = list(_resources.items())
+    stats = {name: {"load_seconds": r.load_seconds, "memory_mb": r.memory_mb}
+             for name, r in items if r.loaded}
+    return {"resources": stats, "process_rss_mb": round(rss_mb() or 0, 1)}
+
+def _load_embed_model():
+    from llama_index.embeddings.huggingface import HuggingFaceEmbedding
+    return HuggingFaceEmbedding(model_name=config.EMBED_MODEL)
+
+def llm_configured() -> bool:
+    """Whether get_llm can create an LLM: the offline mock, or Gemini with an API key."""
+    return config.LLM_TYPE == "mock" or bool(os.getenv("GOOGLE_API_KEY"))
+
+def _create_llm():
+    if config.LLM_TYPE == "mock":
+        from llama_index.core.llms import MockLLM
+        return MockLLM()
+    from llama_index.llms.gemini import Gemini
+    api_key = os.getenv("GOOGLE_API_KEY")
+    if not api_key:
+        raise ValueError("GOOGLE_API_KEY not found in environment variables")
+    return Gemini(model=config.LLM_MODEL, api_key=api_key)
+
+def _load_llm():
+    llm = _create_llm()
+    if not config.ENABLE_LLM_CACHE:
+        return llm
+    from llm_cache import CachedLLM, get_llm_cache
+    return CachedLLM(llm, get_llm_cache())
+
+def _load_qdrant_client():
+    import qdrant_client
+    if config.QDRANT_URL:
+        return qdrant_client.QdrantClient(url=config.QDRANT_URL, api_key=os.getenv("QDRANT_API_KEY"))
+    return qdrant_client.QdrantClient(path=config.QDRANT_PATH)
+
+def get_embed_model():
+    """The process-wide HuggingFace embedding model."""
+    return get_resource("embed_model", _load_embed_model)
+
+def get_llm():
+    """
+    The process-wide LLM (Gemini, or MockLLM when LLM_TYPE=mock), wrapped in the
+    persistent completion cache when ENABLE_LLM_CACHE. Raises if it can't be created.
+    """
+    return get_resource("llm", _load_llm)
+
+def get_qdrant_client():
+    """
+    The process-wide Qdrant client: a server at QDRANT_URL, else embedded Qdrant.
+    Embedded Qdrant locks its storage directory, so a second client on the same
+    path would fail or contend.
+    """
+    return get_resource("qdrant_client", _load_qdrant_client)
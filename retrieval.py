@@ -1,26 +1,33 @@
 # /academic-rag-agent/retrieval.py
 import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import List, Optional
 from dotenv import load_dotenv
 # LlamaIndex Imports
 from llama_index.core import (
     StorageContext,
+    VectorStoreIndex,
     load_index_from_storage,
     QueryBundle,
     Settings
 )
 from llama_index.core.retrievers import BaseRetriever, VectorIndexRetriever
-# Temporarily comment out BM25 due to compatibility issues
-# from llama_index.retrievers.bm25 import BM25Retriever
-# Temporarily comment out ColBERT due to size constraints
-# from llama_index.postprocessor.colbert_rerank import ColbertRerank
 from llama_index.core.query_engine import RetrieverQueryEngine
-from llama_index.llms.gemini import Gemini
-from llama_index.embeddings.huggingface import HuggingFaceEmbedding
-# Qdrant imports
-from llama_index.vector_stores.qdrant import QdrantVectorStore
-import qdrant_client
+from llama_index.core.schema import NodeWithScore
 # Configuration Import
 import config
+from semantic_cache import CachedQueryEngine, get_semantic_cache
+from bm25 import BM25Index, BM25Retriever
+from embedding_cache import CachedEmbedding
+from reranker import build_reranker
+from resources import get_embed_model, get_llm, llm_configured, get_qdrant_client
+from sqlite_docstore import docstore_is_empty, load_docstore
+from context_packing import ContextPacker
+from sentence_windows import WindowResolver
+from qdrant_tuning import vector_store_kwargs
+from vector_backends import build_vector_store, collection_exists
 
 # Load environment variables
 load_dotenv()
@@ -28,8 +35,8 @@ load_dotenv()
 def get_qdrant_collection_name():
     """Auto-detect the Qdrant collection name"""
     try:
-        client = qdrant_client.QdrantClient(path=config.QDRANT_PATH)
-        collections = client.get_collections()
+        # Reuse the shared client; embedded Qdrant locks its storage directory
+        collections = get_qdrant_client().get_collections()
         
         if len(collections.collections) == 0:
             raise ValueError("No Qdrant collections found")
@@ -56,32 +63,204 @@ def get_qdrant_collection_name():
         print(f"Error detecting collection name: {e}")
         return "text_collection"  # Default fallback
 
+_retrieval_pool = None
+_retrieval_pool_lock = threading.Lock()
+
+def get_retrieval_pool() -> ThreadPoolExecutor:
+    """Shared thread pool for running retrieval legs concurrently."""
+    global _retrieval_pool
+    with _retrieval_pool_lock:
+        if _retrieval_pool is None:
+            _retrieval_pool = ThreadPoolExecutor(
+                max_workers=config.RETRIEVAL_WORKERS, thread_name_prefix="retrieval"
+            )
+        return _retrieval_pool
+
+_collection_pool = None
+_collection_pool_lock = threading.Lock()
+
+def get_collection_pool() -> ThreadPoolExecutor:
+    """
+    Thread pool for per-collection searches. Separate from the retrieval pool, whose
+    vector leg waits on these searches and could otherwise starve it.
+    """
+    global _collection_pool
+    with _collection_pool_lock:
+        if _collection_pool is None:
+            _collection_pool = ThreadPoolExecutor(
+                max_workers=config.RETRIEVAL_WORKERS, thread_name_prefix="collection"
+            )
+        return _collection_pool
+
+def parse_collection_specs(value: str = None) -> List[dict]:
+    """
+    Parses RETRIEVAL_COLLECTIONS: comma-separated name[:top_k[:timeout_seconds]] entries.
+    Missing values default to VECTOR_TOP_K and COLLECTION_TIMEOUT.
+    """
+    value = config.RETRIEVAL_COLLECTIONS if value is None else value
+    specs = []
+    for entry in value.split(","):
+        parts = [p.strip() for p in entry.split(":")]
+        if not parts[0]:
+            continue
+        specs.append({
+            "name": parts[0],
+            "top_k": int(parts[1]) if len(parts) > 1 and parts[1] else config.VECTOR_TOP_K,
+            "timeout": float(parts[2]) if len(parts) > 2 and parts[2] else config.COLLECTION_TIMEOUT,
+        })
+    return specs
+
+def reciprocal_rank_fusion(result_lists: List[List[NodeWithScore]], weights: Optional[List[float]] = None,
+                           k: int = None, top_n: int = None) -> List[NodeWithScore]:
+    """
+    Fuses ranked lists with (weighted) reciprocal rank fusion: score = sum(w / (k + rank)).
+    Only ranks are used, so lists with incomparable score scales fuse cleanly.
+    """
+    k = config.RRF_K if k is None else k
+    weights = weights or [1.0] * len(result_lists)
+    fused, nodes = {}, {}
+    for results, weight in zip(result_lists, weights):
+        for rank, n in enumerate(results, 1):
+            node_id = n.node.node_id
+            fused[node_id] = fused.get(node_id, 0.0) + weight / (k + rank)
+            nodes.setdefault(node_id, n.node)
+    ranked = sorted(fused.items(), key=lambda item: item[1], reverse=True)[:top_n]
+    return [NodeWithScore(node=nodes[node_id], score=score) for node_id, score in ranked]
+
+def weighted_score_fusion(result_lists: List[List[NodeWithScore]], weights: Optional[List[float]] = None,
+                          top_n: int = None) -> List[NodeWithScore]:
+    """
+    Fuses lists by min-max normalising each list's scores to [0, 1] and summing
+    them with the given weights.
+    """
+    weights = weights or [1.0] * len(result_lists)
+    fused, nodes = {}, {}
+    for results, weight in zip(result_lists, weights):
+        scores = [n.score or 0.0 for n in results]
+        if not scores:
+            continue
+        low, high = min(scores), max(scores)
+        for n, score in zip(results, scores):
+            normalized = (score - low) / (high - low) if high > low else 1.0
+            node_id = n.node.node_id
+            fused[node_id] = fused.get(node_id, 0.0) + weight * normalized
+            nodes.setdefault(node_id, n.node)
+    ranked = sorted(fused.items(), key=lambda item: item[1], reverse=True)[:top_n]
+    return [NodeWithScore(node=nodes[node_id], score=score) for node_id, score in ranked]
+
+def similarity_fusion(result_lists: List[List[NodeWithScore]], top_n: int = None) -> List[NodeWithScore]:
+    """
+    Merges lists scored in one embedding space by their raw similarity, keeping each
+    node's best score. Unlike min-max normalisation, a weak list's top hit stays weak.
+    """
+    best = {}
+    for results in result_lists:
+        for n in results:
+            node_id = n.node.node_id
+            if node_id not in best or (n.score or 0.0) > (best[node_id].score or 0.0):
+                best[node_id] = n
+    ranked = sorted(best.values(), key=lambda n: n.score or 0.0, reverse=True)[:top_n]
+    return [NodeWithScore(node=n.node, score=n.score) for n in ranked]
+
+def fuse_results(result_lists: List[List[NodeWithScore]], weights: Optional[List[float]] = None,
+                 top_n: int = None) -> List[NodeWithScore]:
+    """Fuses ranked lists with the method selected by HYBRID_FUSION_MODE."""
+    if config.HYBRID_FUSION_MODE == "weighted":
+        return weighted_score_fusion(result_lists, weights, top_n=top_n)
+    return reciprocal_rank_fusion(result_lists, weights, top_n=top_n)
+
+class DocstoreVectorRetriever(VectorIndexRetriever):
+    """
+    VectorIndexRetriever for an index struct that doesn't map nodes. Ingestion uses
+    node IDs as vector IDs, so results of stores that don't keep text (the numpy
+    backend) are read from the docstore by ID.
+    """
+
+    def _determine_nodes_to_fetch(self, query_result) -> List[str]:
+        if not query_result.nodes and query_result.ids:
+            return list(query_result.ids)
+        return super()._determine_nodes_to_fetch(query_result)
+
+    def _insert_fetched_nodes_into_query_result(self, query_result, fetched_nodes):
+        if query_result.nodes or not query_result.ids:
+            return super()._insert_fetched_nodes_into_query_result(query_result, fetched_nodes)
+        by_id = {node.node_id: node for node in fetched_nodes}
+        # Vectors whose node is gone are skipped; similarities stay aligned with the nodes
+        kept = [i for i, node_id in enumerate(query_result.ids) if node_id in by_id]
+        if query_result.similarities is not None:
+            query_result.similarities = [query_result.similarities[i] for i in kept]
+        return [by_id[query_result.ids[i]] for i in kept]
+
 class HybridRetriever(BaseRetriever):
     """Custom retriever that fuses results from vector and keyword search."""
     
-    def __init__(self, vector_retriever, bm25_retriever):
+    def __init__(self, vector_retriever, bm25_retriever, top_n: int = None):
         self._vector_retriever = vector_retriever
         self._bm25_retriever = bm25_retriever
+        self._top_n = top_n or config.HYBRID_TOP_K
+        self._weights = [config.HYBRID_VECTOR_WEIGHT, 1.0 - config.HYBRID_VECTOR_WEIGHT]
         super().__init__()
     
     def _retrieve(self, query_bundle: QueryBundle):
-        vector_nodes = self._vector_retriever.retrieve(query_bundle)
-        bm25_nodes = self._bm25_retriever.retrieve(query_bundle)
+        # The vector leg (embedding + ANN search) runs in the pool while BM25 runs here
+        vector_future = get_retrieval_pool().submit(self._vector_retriever.retrieve, query_bundle)
+        try:
+            bm25_nodes = self._bm25_retriever.retrieve(query_bundle)
+        except Exception as e:
+            print(f"⚠️  BM25 retrieval failed, using vector results only: {e}")
+            bm25_nodes = []
+        try:
+            vector_nodes = vector_future.result()
+        except Exception as e:
+            if not bm25_nodes:
+                raise
+            print(f"⚠️  Vector retrieval failed, using BM25 results only: {e}")
+            vector_nodes = []
         
-        all_nodes = []
-        node_ids = set()
-        
-        for n in bm25_nodes + vector_nodes:
-            if n.node.node_id not in node_ids:
-                all_nodes.append(n)
-                node_ids.add(n.node.node_id)
-        
-        return all_nodes
+        return fuse_results([vector_nodes, bm25_nodes], self._weights, top_n=self._top_n)
+
+class MultiCollectionRetriever(BaseRetriever):
+    """
+    Searches several vector collections concurrently, each with its own top-k and
+    timeout, and merges the hits by raw similarity into one list of top_n.
+    All collections share the embedding model, so their scores are comparable.
+    Collections that fail or time out are left out of the result.
+    """
+
+    def __init__(self, legs: List[tuple], embed_model=None, top_n: int = None):
+        # (collection name, retriever, timeout seconds)
+        self._legs = legs
+        self._embed_model = embed_model or Settings.embed_model
+        self._top_n = top_n or config.VECTOR_TOP_K
+        super().__init__()
+
+    def _retrieve(self, query_bundle: QueryBundle):
+        if query_bundle.embedding is None and query_bundle.embedding_strs:
+            # Embed once here instead of once per collection
+            query_bundle.embedding = self._embed_model.get_agg_embedding_from_queries(query_bundle.embedding_strs)
+        pool = get_collection_pool()
+        start = time.monotonic()
+        futures = [(name, pool.submit(retriever.retrieve, query_bundle), timeout)
+                   for name, retriever, timeout in self._legs]
+        result_lists, errors = [], []
+        for name, future, timeout in futures:
+            try:
+                result_lists.append(future.result(timeout=max(0.0, timeout - (time.monotonic() - start))))
+            except FutureTimeoutError:
+                future.cancel()
+                errors.append(f"{name} timed out after {timeout:.1f}s")
+            except Exception as e:
+                errors.append(f"{name} failed: {e}")
+        for error in errors:
+            print(f"⚠️  Collection search {error}; using the other collections.")
+        if not result_lists:
+            raise RuntimeError(f"All collection searches failed: {'; '.join(errors)}")
+        return similarity_fusion(result_lists, top_n=self._top_n)
 
 def setup_query_engine():
     """
     Loads the persisted index and sets up the query engine with a hybrid retriever
-    and a ColBERT re-ranker.
+    and a lightweight CPU re-ranker.
     """
     if not os.path.exists(config.STORAGE_DIR):
         raise FileNotFoundError(
@@ -93,13 +272,12 @@ def setup_query_engine():
     print("Configuring Gemini LLM and embeddings...")
     
     # Get API key
-    api_key = os.getenv("GOOGLE_API_KEY")
-    if not api_key:
+    if not llm_configured():
         raise ValueError("GOOGLE_API_KEY not found in environment variables")
     
     # Setup Gemini LLM
     try:
-        llm = Gemini(model=config.LLM_MODEL, api_key=api_key)
+        llm = get_llm()
         print(f"✅ Successfully initialized Gemini model: {config.LLM_MODEL}")
     except Exception as e:
         print(f"⚠️  Gemini not available: {e}")
@@ -107,22 +285,31 @@ def setup_query_engine():
         llm = None
     
     Settings.llm = llm
-    Settings.embed_model = HuggingFaceEmbedding(model_name=config.EMBED_MODEL)
+    embed_model = get_embed_model()
+    # Query embeddings share the on-disk cache that ingestion fills
+    Settings.embed_model = CachedEmbedding(embed_model) if config.ENABLE_EMBEDDING_CACHE else embed_model
 
-    print("Setting up Qdrant vector store...")
-    # Auto-detect collection name
-    collection_name = get_qdrant_collection_name()
-    
-    # Initialize Qdrant client and vector store
-    client = qdrant_client.QdrantClient(path=config.QDRANT_PATH)
-    vector_store = QdrantVectorStore(client=client, collection_name=collection_name)
+    # Every configured collection that ingestion has written is searched
+    specs = [spec for spec in parse_collection_specs() if collection_exists(spec["name"])]
+    if not specs:
+        if config.VECTOR_BACKEND == "numpy":
+            raise FileNotFoundError(
+                f"No numpy vectors found in '{config.NUMPY_VECTOR_DIR}'. "
+                "Please run 'python ingestion.py' with VECTOR_BACKEND=numpy first."
+            )
+        # Auto-detect collection name
+        specs = [{"name": get_qdrant_collection_name(), "top_k": config.VECTOR_TOP_K,
+                  "timeout": config.COLLECTION_TIMEOUT}]
+    print(f"Setting up {config.VECTOR_BACKEND} vector store(s): {', '.join(s['name'] for s in specs)}")
+    vector_store = build_vector_store(specs[0]["name"])
 
     print("Loading index from storage...")
     try:
         # Create storage context with the vector store
         storage_context = StorageContext.from_defaults(
             persist_dir=config.STORAGE_DIR,
-            vector_store=vector_store
+            vector_store=vector_store,
+            docstore=load_docstore()
         )
         index = load_index_from_storage(storage_context)
         print("✅ Index loaded successfully.")
@@ -131,27 +318,60 @@ def setup_query_engine():
         raise
 
     # --- Initialize Retrievers ---
-    vector_retriever = VectorIndexRetriever(index=index, similarity_top_k=config.VECTOR_TOP_K)
+    legs = []
+    for spec in specs:
+        if spec is specs[0]:
+            collection_index = index
+        else:
+            # Same index struct and docstore, different vector collection
+            collection_index = VectorStoreIndex(
+                index_struct=index.index_struct,
+                storage_context=StorageContext.from_defaults(
+                    vector_store=build_vector_store(spec["name"]),
+                    docstore=storage_context.docstore,
+                    index_store=storage_context.index_store,
+                ),
+            )
+        retriever = DocstoreVectorRetriever(
+            index=collection_index, similarity_top_k=spec["top_k"], vector_store_kwargs=vector_store_kwargs()
+        )
+        legs.append((spec["name"], retriever, spec["timeout"]))
+    vector_retriever = legs[0][1] if len(legs) == 1 else MultiCollectionRetriever(legs)
     
-    # Get nodes from the docstore
-    nodes = list(storage_context.docstore.docs.values())
-    if not nodes:
+    # Check the docstore without loading its nodes
+    if docstore_is_empty(storage_context.docstore):
         raise ValueError("No documents found in the docstore. Please run 'python ingestion.py' first.")
     
-    # Temporarily disable BM25 due to compatibility issues
-    # bm25_retriever = BM25Retriever.from_defaults(nodes=nodes, similarity_top_k=config.BM25_TOP_K)
-    # hybrid_retriever = HybridRetriever(vector_retriever, bm25_retriever)
-    
-    # Use only vector retriever for now
-    hybrid_retriever = vector_retriever
+    if config.ENABLE_BM25 and BM25Index.exists(config.BM25_DIR):
+        bm25_index = BM25Index.load(config.BM25_DIR)
+        bm25_retriever = BM25Retriever(bm25_index, storage_context.docstore, similarity_top_k=config.BM25_TOP_K)
+        hybrid_retriever = HybridRetriever(vector_retriever, bm25_retriever)
+        print(f"✅ BM25 index loaded ({len(bm25_index)} nodes), using hybrid retrieval.")
+    else:
+        print("⚠️  No BM25 index found, using vector retrieval only. Re-run 'python ingestion.py' to build it.")
+        hybrid_retriever = vector_retriever
 
-    # --- Initialize ColBERT Re-ranker (disabled for deployment) ---
-    # Temporarily disabled due to package size constraints
-    print("⚠️  ColBERT reranker disabled for deployment, using basic query engine")
-    # Fallback to basic query engine without reranker
+    # --- Initialize Re-ranker ---
+    reranker = build_reranker()
+    if reranker is not None:
+        print(f"✅ Using {config.RERANKER_TYPE} reranker (top {config.RERANKER_TOP_N}).")
+    else:
+        print("⚠️  Reranker disabled, using basic query engine")
+    # Sentence windows are resolved last, so only the nodes passed to the LLM are expanded
+    postprocessors = [reranker] if reranker is not None else []
+    if config.ENABLE_CONTEXT_PACKING:
+        postprocessors.append(ContextPacker())
+        print(f"✅ Packing context into {config.CONTEXT_TOKEN_BUDGET} tokens per query.")
+    else:
+        postprocessors.append(WindowResolver())
     query_engine = RetrieverQueryEngine.from_args(
         retriever=hybrid_retriever,
+        node_postprocessors=postprocessors,
     )
     print("✅ Vector query engine is ready.")
 
+    if config.ENABLE_SEMANTIC_CACHE:
+        query_engine = CachedQueryEngine(query_engine, get_semantic_cache())
+        print("✅ Semantic answer cache enabled.")
+
     return query_engine
\ No newline at end of file
@@ -0,0 +1,292 @@
+# /academic-rag-agent/semantic_cache.py
+import os
+import json
+import time
+import uuid
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from llama_index.core import QueryBundle, Settings
+from llama_index.core.base.response.schema import Response
+from llama_index.core.schema import NodeWithScore, TextNode
+
+import config
+
+def read_index_version() -> Optional[str]:
+    """Returns the version tag written by the last index build, if any."""
+    try:
+        with open(config.INDEX_VERSION_PATH, 'r', encoding='utf-8') as f:
+            return json.load(f).get("version")
+    except (OSError, ValueError):
+        return None
+
+def write_index_version() -> str:
+    """Stamps the persisted index with a fresh version tag. Called after every rebuild."""
+    version = uuid.uuid4().hex
+    os.makedirs(os.path.dirname(config.INDEX_VERSION_PATH), exist_ok=True)
+    with open(config.INDEX_VERSION_PATH, 'w', encoding='utf-8') as f:
+        json.dump({"version": version, "built_at": time.time()}, f)
+    return version
+
+class SemanticCache:
+    """
+    Persistent cache of query responses looked up by query-embedding similarity.
+    Entries are evicted LRU once max_entries is reached, and expire after ttl seconds.
+    The whole cache is dropped when the index version changes. Entries are kept in
+    memory for lookups and written to SQLite one row at a time.
+    """
+
+    def __init__(self, cache_dir: str = None, threshold: float = None,
+                 max_entries: int = None, ttl: float = None):
+        self.cache_dir = cache_dir or config.SEMANTIC_CACHE_DIR
+        self.threshold = config.SEMANTIC_CACHE_THRESHOLD if threshold is None else threshold
+        self.max_entries = config.SEMANTIC_CACHE_MAX_ENTRIES if max_entries is None else max_entries
+        self.ttl = config.SEMANTIC_CACHE_TTL if ttl is None else ttl
+
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # entry_id -> entry dict, least recently used first
+        self._index_version = None
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._conn = sqlite3.connect(os.path.join(self.cache_dir, "semantic_cache.sqlite"), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            "id TEXT PRIMARY KEY, query TEXT NOT NULL, created_at REAL NOT NULL, last_access REAL NOT NULL, "
+            "response TEXT NOT NULL, sources TEXT NOT NULL, embedding BLOB NOT NULL)"
+        )
+        self._conn.commit()
+        self._load()
+
+    @property
+    def index_version(self) -> Optional[str]:
+        """The index version the cached entries were answered against."""
+        return self._index_version
+
+    def _meta(self, key: str) -> Optional[str]:
+        row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _reset_storage(self):
+        """Deletes every stored entry and stamps the current versions. Caller holds the lock."""
+        with self._conn:
+            self._conn.execute("DELETE FROM entries")
+            self._conn.executemany("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", [
+                ("index_version", self._index_version), ("embed_model", config.EMBED_MODEL),
+            ])
+
+    def _load(self):
+        """Loads persisted entries, discarding them if the index has been rebuilt since."""
+        self._index_version = read_index_version()
+        try:
+            stored_version, stored_model = self._meta("index_version"), self._meta("embed_model")
+            rows = self._conn.execute(
+                "SELECT id, query, created_at, response, sources, embedding FROM entries ORDER BY last_access"
+            ).fetchall()
+        except sqlite3.DatabaseError as e:
+            print(f"⚠️  Semantic cache is unreadable, starting empty: {e}")
+            return
+
+        if stored_version != self._index_version or stored_model != config.EMBED_MODEL:
+            if rows:
+                print("Index or embedding model changed since the semantic cache was written, discarding it.")
+                self.invalidations += 1
+            self._reset_storage()
+            return
+
+        now = time.time()
+        for entry_id, query, created_at, response, sources, embedding in rows:
+            if now - created_at <= self.ttl:
+                self._entries[entry_id] = {
+                    "id": entry_id,
+                    "query": query,
+                    "created_at": created_at,
+                    "response": response,
+                    "sources": json.loads(sources),
+                    "embedding": np.frombuffer(embedding, dtype=np.float32),
+                }
+        if self._entries:
+            print(f"✅ Semantic cache loaded with {len(self._entries)} entries")
+
+    def _delete(self, entry_ids: List[str]):
+        """Removes entries from memory and disk. Caller holds the lock."""
+        if not entry_ids:
+            return
+        for entry_id in entry_ids:
+            self._entries.pop(entry_id, None)
+        with self._conn:
+            self._conn.executemany("DELETE FROM entries WHERE id = ?", [(entry_id,) for entry_id in entry_ids])
+
+    def _check_index_version(self) -> bool:
+        """Clears the cache if the index was rebuilt; True if it was. Caller holds the lock."""
+        version = read_index_version()
+        if version == self._index_version:
+            return False
+        self._entries.clear()
+        self._index_version = version
+        self.invalidations += 1
+        self._reset_storage()
+        return True
+
+    def _expire(self):
+        """Drops entries older than the TTL. Caller holds the lock."""
+        now = time.time()
+        self._delete([k for k, e in self._entries.items() if now - e["created_at"] > self.ttl])
+
+    def lookup(self, embedding: List[float]) -> Optional[Response]:
+        """Returns the cached response of the most similar past query above the threshold."""
+        query = _normalize(embedding)
+        with self._lock:
+            self._check_index_version()
+            self._expire()
+            if not self._entries:
+                self.misses += 1
+                return None
+
+            ids = list(self._entries.keys())
+            matrix = np.stack([self._entries[k]["embedding"] for k in ids])
+            scores = matrix @ query
+            best = int(np.argmax(scores))
+            if scores[best] < self.threshold:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self._entries.move_to_end(ids[best])
+            with self._conn:
+                self._conn.execute("UPDATE entries SET last_access = ? WHERE id = ?", (time.time(), ids[best]))
+            return _to_response(self._entries[ids[best]])
+
+    def add(self, query: str, embedding: List[float], response, index_version: Optional[str] = None) -> None:
+        """
+        Stores a query engine response, evicting the least recently used entries.
+        index_version is the version the response was answered against; a response
+        from before the latest rebuild is not stored.
+        """
+        text = getattr(response, 'response', None)
+        if not text:
+            return
+
+        entry = {
+            "id": uuid.uuid4().hex,
+            "query": query,
+            "created_at": time.time(),
+            "response": text,
+            "sources": [
+                {
+                    "text": n.node.get_content(),
+                    "metadata": n.node.metadata,
+                    "score": n.score,
+                }
+                for n in (getattr(response, 'source_nodes', None) or [])
+            ],
+            "embedding": _normalize(embedding),
+        }
+        with self._lock:
+            rebuilt = self._check_index_version()
+            if rebuilt or (index_version is not None and index_version != self._index_version):
+                return
+            try:
+                with self._conn:
+                    self._conn.execute(
+                        "INSERT INTO entries (id, query, created_at, last_access, response, sources, embedding) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        (entry["id"], query, entry["created_at"], entry["created_at"], text,
+                         json.dumps(entry["sources"], ensure_ascii=False, default=str),
+                         entry["embedding"].astype(np.float32).tobytes()),
+                    )
+            except (sqlite3.Error, TypeError) as e:
+                print(f"⚠️  Failed to persist semantic cache entry: {e}")
+                return
+            self._entries[entry["id"]] = entry
+            overflow = len(self._entries) - self.max_entries
+            if overflow > 0:
+                self._delete(list(self._entries)[:overflow])
+
+    def clear(self) -> None:
+        """Drops every cached entry."""
+        with self._lock:
+            self._entries.clear()
+            self._reset_storage()
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters for diagnostics."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "invalidations": self.invalidations,
+                "threshold": self.threshold,
+            }
+
+class CachedQueryEngine:
+    """Wraps a query engine so near-duplicate queries are answered from a SemanticCache."""
+
+    def __init__(self, query_engine, cache: SemanticCache, embed_model=None):
+        self._query_engine = query_engine
+        self._cache = cache
+        self._embed_model = embed_model
+
+    @property
+    def cache(self) -> SemanticCache:
+        return self._cache
+
+    def query(self, query):
+        query_str = query.query_str if isinstance(query, QueryBundle) else str(query)
+        embed_model = self._embed_model or Settings.embed_model
+        embedding = embed_model.get_query_embedding(query_str)
+
+        cached = self._cache.lookup(embedding)
+        if cached is not None:
+            return cached
+        # The answer is only cached if the index isn't rebuilt while it is computed
+        index_version = self._cache.index_version
+
+        # Hand the embedding on so the retriever doesn't compute it again
+        response = self._query_engine.query(QueryBundle(query_str=query_str, embedding=embedding))
+        self._cache.add(query_str, embedding, response, index_version=index_version)
+        return response
+
+    def __getattr__(self, name):
+        return getattr(self._query_engine, name)
+
+_shared_cache = None
+_shared_cache_lock = threading.Lock()
+
+def get_semantic_cache() -> SemanticCache:
+    """Returns the process-wide semantic cache for STORAGE_DIR."""
+    global _shared_cache
+    with _shared_cache_lock:
+        if _shared_cache is None:
+            _shared_cache = SemanticCache()
+        return _shared_cache
+
+def cache_stats() -> Optional[Dict[str, Any]]:
+    """Stats of the shared cache, or None if it was never created."""
+    return _shared_cache.stats() if _shared_cache is not None else None
+
+def _normalize(embedding) -> np.ndarray:
+    vector = np.asarray(embedding, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm > 0 else vector
+
+def _to_response(entry: Dict[str, Any]) -> Response:
+    source_nodes = [
+        NodeWithScore(node=TextNode(text=s["text"], metadata=s["metadata"]), score=s["score"])
+        for s in entry["sources"]
+    ]
+    return Response(
+        response=entry["response"],
+        source_nodes=source_nodes,
+        metadata={"semantic_cache_hit": True, "cached_query": entry["query"]},
+    )
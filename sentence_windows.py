@@ -0,0 +1,223 @@
+# /academic-rag-agent/sentence_windows.py
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, List, Optional, Sequence, Tuple
+
+from llama_index.core.bridge.pydantic import Field, PrivateAttr
+from llama_index.core.node_parser.interface import NodeParser
+from llama_index.core.postprocessor.types import BaseNodePostprocessor
+from llama_index.core.schema import BaseNode, NodeRelationship, NodeWithScore, QueryBundle, TextNode
+from llama_index.core.utils import get_tqdm_iterable
+
+import config
+from resources import get_resource
+from sqlite_docstore import SQLiteKVStore
+
+# Bumped when the node layout changes, so ingestion rebuilds instead of mixing layouts
+NODE_FORMAT = "offset_window_v1"
+WINDOW_START_KEY = "window_start"
+WINDOW_END_KEY = "window_end"
+# Nodes built by SentenceWindowNodeParser carry the window text itself
+LEGACY_WINDOW_KEY = "window"
+_WINDOW_KEYS = [WINDOW_START_KEY, WINDOW_END_KEY]
+_TEXT_COLLECTION = "doc_texts"
+
+_BOUNDARY = re.compile(r'[.!?]+["\'”’)\]]*\s+|\n[ \t]*\n\s*')
+# Lower-cased words that end with a period without ending the sentence
+_ABBREVIATIONS = {
+    "al", "approx", "cf", "ch", "dr", "e.g", "eq", "eqs", "esp", "etc", "fig", "figs", "i.e",
+    "mr", "mrs", "ms", "no", "nos", "pp", "prof", "ref", "refs", "resp", "sec", "tab", "viz", "vol", "vs",
+}
+
+def _is_false_stop(text: str, match) -> bool:
+    """Whether a period match ends an abbreviation or initial rather than a sentence."""
+    if match.end() < len(text) and text[match.end()].islower():
+        return True
+    if text[match.start()] != ".":
+        return False
+    word = text[max(0, match.start() - 12):match.start()].rsplit(None, 1)[-1:] or [""]
+    word = word[0].lstrip("([\"'")
+    # Initials are capitals ("J. Smith"); a lower-case letter is usually a unit ("3.5 m.")
+    return word.lower() in _ABBREVIATIONS or (len(word) == 1 and word.isupper())
+
+def split_sentence_spans(text: str) -> List[Tuple[int, int]]:
+    """
+    (start, end) character spans of the sentences in text, split at sentence-ending
+    punctuation and blank lines. Trailing whitespace stays with its sentence, like
+    NLTK's punkt splitter, so consecutive spans tile the text.
+    """
+    spans, start = [], 0
+    for match in _BOUNDARY.finditer(text):
+        if match.end() >= len(text):
+            break
+        if text[match.start()] != "\n" and _is_false_stop(text, match):
+            continue
+        if text[start:match.end()].strip():
+            spans.append((start, match.end()))
+        start = match.end()
+    if text[start:].strip():
+        spans.append((start, len(text)))
+    return spans
+
+def _punkt_spans(splitter: Callable[[str], List[str]], text: str) -> List[Tuple[int, int]]:
+    """Spans of the sentences found by NLTK punkt, located in text."""
+    spans, pos = [], 0
+    for sentence in splitter(text):
+        start = text.find(sentence, pos)
+        if start < 0:
+            continue
+        spans.append((start, start + len(sentence)))
+        pos = start + len(sentence)
+    return spans
+
+def get_sentence_splitter() -> Callable[[str], List[Tuple[int, int]]]:
+    """The span splitter selected by SENTENCE_SPLITTER."""
+    if config.SENTENCE_SPLITTER == "punkt":
+        from llama_index.core.node_parser.text.utils import split_by_sentence_tokenizer
+        splitter = split_by_sentence_tokenizer()
+        return lambda text: _punkt_spans(splitter, text)
+    return split_sentence_spans
+
+class OffsetWindowNodeParser(NodeParser):
+    """
+    One node per sentence, like SentenceWindowNodeParser, but each node stores the
+    character offsets of its window into the document text instead of a copy of the
+    window and of the sentence. The document text is stored once in a DocumentTextStore
+    and WindowResolver reads the window back at synthesis time.
+    """
+
+    window_size: int = Field(
+        default=3,
+        description="The number of sentences on each side of a sentence to capture.",
+        gt=0,
+    )
+    _span_splitter: Callable[[str], List[Tuple[int, int]]] = PrivateAttr()
+
+    def __init__(self, span_splitter: Optional[Callable[[str], List[Tuple[int, int]]]] = None, **kwargs: Any):
+        super().__init__(**kwargs)
+        self._span_splitter = span_splitter or get_sentence_splitter()
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "OffsetWindowNodeParser"
+
+    def _parse_nodes(self, nodes: Sequence[BaseNode], show_progress: bool = False, **kwargs: Any) -> List[BaseNode]:
+        all_nodes: List[BaseNode] = []
+        for doc in get_tqdm_iterable(nodes, show_progress, "Parsing nodes"):
+            all_nodes.extend(self._build_window_nodes(doc))
+        return all_nodes
+
+    def _build_window_nodes(self, doc: BaseNode) -> List[TextNode]:
+        text = doc.text
+        spans = self._span_splitter(text)
+        # Computing the document hash is expensive, so the relationship is built once
+        relationships = {NodeRelationship.SOURCE: doc.as_related_node_info()}
+        nodes = []
+        for i, (start, end) in enumerate(spans):
+            metadata = {
+                WINDOW_START_KEY: spans[max(0, i - self.window_size)][0],
+                WINDOW_END_KEY: spans[min(i + self.window_size, len(spans) - 1)][1],
+            }
+            nodes.append(TextNode(
+                id_=self.id_func(i, doc),
+                text=text[start:end],
+                start_char_idx=start,
+                end_char_idx=end,
+                metadata=metadata,
+                excluded_embed_metadata_keys=list(doc.excluded_embed_metadata_keys) + _WINDOW_KEYS,
+                excluded_llm_metadata_keys=list(doc.excluded_llm_metadata_keys) + _WINDOW_KEYS,
+                metadata_seperator=doc.metadata_separator,
+                metadata_template=doc.metadata_template,
+                text_template=doc.text_template,
+                relationships=relationships,
+            ))
+        return nodes
+
+class DocumentTextStore:
+    """
+    Full text of each ingested document, keyed by doc ID and shared by all of its
+    window nodes. Recently read texts are kept in a small LRU cache.
+    """
+
+    def __init__(self, path: str = None, cache_size: int = None):
+        self._kvstore = SQLiteKVStore(path or config.DOC_TEXT_STORE_PATH)
+        self.cache_size = config.DOC_TEXT_CACHE_SIZE if cache_size is None else cache_size
+        self._cache: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def put_documents(self, documents: Sequence[BaseNode]):
+        self._kvstore.put_all([(doc.doc_id, {"text": doc.text}) for doc in documents], collection=_TEXT_COLLECTION)
+        with self._lock:
+            for doc in documents:
+                self._cache.pop(doc.doc_id, None)
+
+    def get_text(self, doc_id: str) -> Optional[str]:
+        with self._lock:
+            if doc_id in self._cache:
+                self._cache.move_to_end(doc_id)
+                return self._cache[doc_id]
+        value = self._kvstore.get(doc_id, collection=_TEXT_COLLECTION)
+        text = value["text"] if value else None
+        if text is not None and self.cache_size:
+            with self._lock:
+                self._cache[doc_id] = text
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        return text
+
+    def delete(self, doc_id: str):
+        self._kvstore.delete(doc_id, collection=_TEXT_COLLECTION)
+        with self._lock:
+            self._cache.pop(doc_id, None)
+
+    def clear(self):
+        self._kvstore.clear()
+        with self._lock:
+            self._cache.clear()
+
+def get_document_text_store() -> DocumentTextStore:
+    """The process-wide document text store."""
+    return get_resource("document_text_store", DocumentTextStore)
+
+def resolve_window(node: BaseNode, text_store: DocumentTextStore) -> Optional[str]:
+    """The sentence window of node, or None if it isn't a sentence window node."""
+    metadata = node.metadata
+    if LEGACY_WINDOW_KEY in metadata:
+        return metadata[LEGACY_WINDOW_KEY]
+    if WINDOW_START_KEY not in metadata or not node.ref_doc_id:
+        return None
+    text = text_store.get_text(node.ref_doc_id)
+    if text is None:
+        return None
+    return text[metadata[WINDOW_START_KEY]:metadata[WINDOW_END_KEY]]
+
+class WindowResolver(BaseNodePostprocessor):
+    """
+    Replaces each sentence node's text with its surrounding window before synthesis.
+    Runs after reranking, so retrieval and reranking still score the sentence alone.
+    """
+
+    _text_store: DocumentTextStore = PrivateAttr()
+
+    def __init__(self, text_store: Optional[DocumentTextStore] = None, **kwargs: Any):
+        super().__init__(**kwargs)
+        self._text_store = text_store or get_document_text_store()
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "WindowResolver"
+
+    def _postprocess_nodes(self, nodes: List[NodeWithScore],
+                           query_bundle: Optional[QueryBundle] = None) -> List[NodeWithScore]:
+        resolved = []
+        for n in nodes:
+            window = resolve_window(n.node, self._text_store)
+            if window is None:
+                resolved.append(n)
+                continue
+            # The node may be the docstore's cached instance, so the window goes on a copy
+            node = n.node.model_copy()
+            node.set_content(window)
+            resolved.append(NodeWithScore(node=node, score=n.score))
+        return resolved
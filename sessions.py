@@ -0,0 +1,147 @@
+# /academic-rag-agent/sessions.py
+import os
+import re
+import json
+import time
+import uuid
+import threading
+from collections import OrderedDict, deque
+from typing import Any, Callable, Dict, List, Optional
+
+import config
+
+_TURN_FIELDS = ("queries", "responses", "reasoning_steps")
+_SESSION_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+def valid_session_id(session_id: Optional[str]) -> bool:
+    """Session IDs come from clients and name spill files, so only safe characters are accepted."""
+    return bool(session_id) and bool(_SESSION_ID_PATTERN.match(session_id))
+
+class ResearchSession:
+    """
+    Conversation history of one client. The newest max_turns turns stay in a ring
+    buffer; older ones are appended to a JSON-lines spill file and only read back on export.
+    """
+
+    def __init__(self, session_id: str, info: Dict[str, Any], max_turns: int, spill_path: str):
+        self.session_id = session_id
+        self.info = {k: v for k, v in info.items() if k not in _TURN_FIELDS}
+        self.info["session_id"] = session_id
+        self.max_turns = max_turns
+        self.spill_path = spill_path
+        self.spilled_turns = 0
+        self.last_access = time.time()
+        self.lock = threading.Lock()
+        self._turns = deque()
+        # The client's own agent and chat memory, built by the app on first use
+        self.agent = None
+        self.agent_lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return self.spilled_turns + len(self._turns)
+
+    def add_turn(self, query: str, response: str, reasoning_step: Dict[str, Any]):
+        with self.lock:
+            self._turns.append({"query": query, "response": response, "reasoning_step": reasoning_step})
+            self.last_access = time.time()
+            if len(self._turns) > self.max_turns:
+                self._spill(len(self._turns) - self.max_turns)
+
+    def _spill(self, count: int):
+        """Moves the oldest count turns to disk. Caller holds the lock."""
+        os.makedirs(os.path.dirname(self.spill_path), exist_ok=True)
+        with open(self.spill_path, 'a', encoding='utf-8') as f:
+            for _ in range(count):
+                f.write(json.dumps(self._turns.popleft(), ensure_ascii=False) + "\n")
+        self.spilled_turns += count
+
+    def _spilled(self) -> List[Dict[str, Any]]:
+        if not self.spilled_turns or not os.path.exists(self.spill_path):
+            return []
+        with open(self.spill_path, 'r', encoding='utf-8') as f:
+            return [json.loads(line) for line in f if line.strip()]
+
+    def to_dict(self, include_spilled: bool = True) -> Dict[str, Any]:
+        """The session in the layout of create_research_session(), for exporters."""
+        with self.lock:
+            turns = (self._spilled() if include_spilled else []) + list(self._turns)
+            data = dict(self.info)
+        data["queries"] = [t["query"] for t in turns]
+        data["responses"] = [t["response"] for t in turns]
+        data["reasoning_steps"] = [t["reasoning_step"] for t in turns]
+        data["total_turns"] = len(self)
+        return data
+
+    def discard(self):
+        """Deletes the session's spill file."""
+        with self.lock:
+            if os.path.exists(self.spill_path):
+                os.remove(self.spill_path)
+            self.spilled_turns = 0
+
+class SessionStore:
+    """
+    Research sessions keyed by session ID. At most max_sessions are kept; sessions
+    idle for longer than idle_ttl seconds, or least recently used beyond the cap,
+    are evicted together with their spill files.
+    """
+
+    def __init__(self, factory: Callable[[], Dict[str, Any]], max_sessions: int = None,
+                 idle_ttl: float = None, max_turns: int = None, spill_dir: str = None):
+        self.factory = factory
+        self.max_sessions = max_sessions or config.SESSION_MAX_SESSIONS
+        self.idle_ttl = config.SESSION_IDLE_TTL if idle_ttl is None else idle_ttl
+        self.max_turns = max_turns or config.SESSION_MAX_TURNS
+        self.spill_dir = spill_dir or config.SESSION_SPILL_DIR
+        self._sessions: "OrderedDict[str, ResearchSession]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def _evict(self):
+        """Drops idle and over-capacity sessions. Sessions are kept in access order. Caller holds the lock."""
+        cutoff = time.time() - self.idle_ttl
+        evicted = []
+        while self._sessions:
+            session_id, session = next(iter(self._sessions.items()))
+            if session.last_access >= cutoff and len(self._sessions) <= self.max_sessions:
+                break
+            del self._sessions[session_id]
+            evicted.append(session)
+        self.evictions += len(evicted)
+        return evicted
+
+    def get_or_create(self, session_id: Optional[str] = None) -> ResearchSession:
+        """The session for session_id, created if it is unknown, missing or invalid."""
+        if not valid_session_id(session_id):
+            session_id = uuid.uuid4().hex
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                spill_path = os.path.join(self.spill_dir, f"{session_id}.jsonl")
+                if os.path.exists(spill_path):
+                    # Left over from an evicted session or an earlier process
+                    os.remove(spill_path)
+                session = ResearchSession(session_id, self.factory(), self.max_turns, spill_path)
+                self._sessions[session_id] = session
+            session.last_access = time.time()
+            self._sessions.move_to_end(session_id)
+            evicted = self._evict()
+        for stale in evicted:
+            stale.discard()
+        return session
+
+    def get(self, session_id: str) -> Optional[ResearchSession]:
+        with self._lock:
+            return self._sessions.get(session_id)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "sessions": len(self._sessions),
+                "max_sessions": self.max_sessions,
+                "max_turns_in_memory": self.max_turns,
+                "evictions": self.evictions,
+            }
@@ -0,0 +1,202 @@
+# /academic-rag-agent/sqlite_docstore.py
+import os
+import json
+import sqlite3
+import threading
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from llama_index.core.schema import BaseNode
+from llama_index.core.storage.docstore import SimpleDocumentStore
+from llama_index.core.storage.docstore.keyval_docstore import KVDocumentStore
+from llama_index.core.storage.docstore.utils import json_to_doc
+from llama_index.core.storage.kvstore.types import DEFAULT_BATCH_SIZE, DEFAULT_COLLECTION, BaseKVStore
+
+import config
+
+class SQLiteKVStore(BaseKVStore):
+    """
+    Key-value store in one SQLite table. Values are read on demand by key, so
+    opening the store costs the same however many nodes it holds.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        # One connection shared by the retrieval threads, serialised by the lock
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS kv ("
+            "collection TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, "
+            "PRIMARY KEY (collection, key)) WITHOUT ROWID"
+        )
+        self._conn.commit()
+
+    def put(self, key: str, val: dict, collection: str = DEFAULT_COLLECTION) -> None:
+        self.put_all([(key, val)], collection=collection)
+
+    async def aput(self, key: str, val: dict, collection: str = DEFAULT_COLLECTION) -> None:
+        self.put(key, val, collection)
+
+    def put_all(self, kv_pairs: List[Tuple[str, dict]], collection: str = DEFAULT_COLLECTION,
+                batch_size: int = DEFAULT_BATCH_SIZE) -> None:
+        """Writes all pairs in one transaction."""
+        rows = [(collection, key, json.dumps(val)) for key, val in kv_pairs]
+        with self._lock, self._conn:
+            self._conn.executemany("INSERT OR REPLACE INTO kv (collection, key, value) VALUES (?, ?, ?)", rows)
+
+    async def aput_all(self, kv_pairs: List[Tuple[str, dict]], collection: str = DEFAULT_COLLECTION,
+                       batch_size: int = DEFAULT_BATCH_SIZE) -> None:
+        self.put_all(kv_pairs, collection, batch_size)
+
+    def get(self, key: str, collection: str = DEFAULT_COLLECTION) -> Optional[dict]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM kv WHERE collection = ? AND key = ?", (collection, key)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    async def aget(self, key: str, collection: str = DEFAULT_COLLECTION) -> Optional[dict]:
+        return self.get(key, collection)
+
+    def get_all(self, collection: str = DEFAULT_COLLECTION) -> Dict[str, dict]:
+        return dict(self.iter_items(collection))
+
+    async def aget_all(self, collection: str = DEFAULT_COLLECTION) -> Dict[str, dict]:
+        return self.get_all(collection)
+
+    def iter_items(self, collection: str = DEFAULT_COLLECTION, batch_size: int = 1000) -> Iterator[Tuple[str, dict]]:
+        """Yields (key, value) pairs in key order, holding at most batch_size in memory."""
+        last_key = ""
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT key, value FROM kv WHERE collection = ? AND key > ? ORDER BY key LIMIT ?",
+                    (collection, last_key, batch_size),
+                ).fetchall()
+            if not rows:
+                return
+            for key, value in rows:
+                yield key, json.loads(value)
+            last_key = rows[-1][0]
+
+    def iter_keys(self, collection: str = DEFAULT_COLLECTION, batch_size: int = 10000) -> Iterator[str]:
+        """Yields the keys of a collection in order without decoding their values."""
+        last_key = ""
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT key FROM kv WHERE collection = ? AND key > ? ORDER BY key LIMIT ?",
+                    (collection, last_key, batch_size),
+                ).fetchall()
+            if not rows:
+                return
+            for (key,) in rows:
+                yield key
+            last_key = rows[-1][0]
+
+    def delete(self, key: str, collection: str = DEFAULT_COLLECTION) -> bool:
+        with self._lock, self._conn:
+            cursor = self._conn.execute("DELETE FROM kv WHERE collection = ? AND key = ?", (collection, key))
+        return cursor.rowcount > 0
+
+    async def adelete(self, key: str, collection: str = DEFAULT_COLLECTION) -> bool:
+        return self.delete(key, collection)
+
+    def has_any(self, collection: str = DEFAULT_COLLECTION) -> bool:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT 1 FROM kv WHERE collection = ? LIMIT 1", (collection,)
+            ).fetchone() is not None
+
+    def clear(self):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM kv")
+
+class SQLiteDocumentStore(KVDocumentStore):
+    """Docstore on SQLite. Nodes are loaded lazily by ID; writes are committed immediately."""
+
+    def __init__(self, path: str = None, namespace: Optional[str] = None):
+        self._sqlite_kvstore = SQLiteKVStore(path or config.DOCSTORE_SQLITE_PATH)
+        super().__init__(self._sqlite_kvstore, namespace=namespace)
+
+    def persist(self, persist_path: str = None, fs=None) -> None:
+        """Nothing to do: every write is already on disk. Keeps StorageContext.persist from writing docstore.json."""
+
+    def is_empty(self) -> bool:
+        return not self._sqlite_kvstore.has_any(self._node_collection)
+
+    def iter_nodes(self) -> Iterator[BaseNode]:
+        """Streams every stored node without building the full docs dict."""
+        for _, node_json in self._sqlite_kvstore.iter_items(self._node_collection):
+            yield json_to_doc(node_json)
+
+    def iter_node_ids(self) -> Iterator[str]:
+        return self._sqlite_kvstore.iter_keys(self._node_collection)
+
+    def clear(self):
+        self._sqlite_kvstore.clear()
+
+def migrate_json_docstore(json_path: str = None, sqlite_path: str = None) -> bool:
+    """
+    Copies a docstore.json written by SimpleDocumentStore into SQLite, once.
+    The JSON file is renamed to docstore.json.migrated afterwards.
+    """
+    json_path = json_path or config.DOCSTORE_PATH
+    sqlite_path = sqlite_path or config.DOCSTORE_SQLITE_PATH
+    if not os.path.exists(json_path) or os.path.exists(sqlite_path):
+        return False
+    print(f"Migrating {json_path} to {sqlite_path}...")
+    with open(json_path, 'r', encoding='utf-8') as f:
+        # SimpleKVStore persists {collection: {key: value}}
+        data = json.load(f)
+    tmp_path = sqlite_path + ".tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    kvstore = SQLiteKVStore(tmp_path)
+    count = 0
+    for collection, items in data.items():
+        kvstore.put_all(list(items.items()), collection=collection)
+        count += len(items)
+    kvstore._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    kvstore._conn.close()
+    os.replace(tmp_path, sqlite_path)
+    os.replace(json_path, json_path + ".migrated")
+    print(f"✅ Migrated {count} docstore entries to SQLite.")
+    return True
+
+def load_docstore(fresh: bool = False):
+    """
+    The docstore backend selected by DOCSTORE_BACKEND. fresh=True starts an
+    empty store (full rebuild). The JSON backend loads everything into memory.
+    """
+    if config.DOCSTORE_BACKEND == "json":
+        if fresh or not os.path.exists(config.DOCSTORE_PATH):
+            return SimpleDocumentStore()
+        return SimpleDocumentStore.from_persist_path(config.DOCSTORE_PATH)
+    if fresh:
+        if os.path.exists(config.DOCSTORE_PATH):
+            os.replace(config.DOCSTORE_PATH, config.DOCSTORE_PATH + ".migrated")
+        docstore = SQLiteDocumentStore(config.DOCSTORE_SQLITE_PATH)
+        docstore.clear()
+        return docstore
+    migrate_json_docstore()
+    return SQLiteDocumentStore(config.DOCSTORE_SQLITE_PATH)
+
+def docstore_exists() -> bool:
+    """Whether ingestion has written a docstore in either format."""
+    return os.path.exists(config.DOCSTORE_SQLITE_PATH) or os.path.exists(config.DOCSTORE_PATH)
+
+def docstore_node_ids(docstore) -> set:
+    """IDs of every node in the docstore, read without loading the nodes where possible."""
+    if hasattr(docstore, "iter_node_ids"):
+        return set(docstore.iter_node_ids())
+    return set(docstore.docs)
+
+def docstore_is_empty(docstore) -> bool:
+    """Emptiness check that doesn't load every node."""
+    if hasattr(docstore, "is_empty"):
+        return docstore.is_empty()
+    return not docstore.docs
@@ -20,8 +20,8 @@ if [ ! -d "./data" ] || [ -z "$(ls -A ./data)" ]; then
 else
     echo "📄 Data files found. Proceeding with ingestion..."
     
-    # Run data ingestion if storage directory is empty or doesn't exist
-    if [ ! -f "./storage/docstore.json" ]; then
+    # Run data ingestion unless a previous run completed; the manifest is written last
+    if [ ! -f "${STORAGE_DIR:-./storage}/ingestion_manifest.json" ]; then
         echo "🔄 Running data ingestion process..."
         python ingestion.py
         echo "✅ Data ingestion completed"
@@ -0,0 +1,56 @@
+# /academic-rag-agent/startup.py
+import time
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, List
+
+class StartupTracker:
+    """Status and timing of each warm-up stage, for the health and readiness endpoints."""
+
+    def __init__(self, stages: List[str]):
+        self._lock = threading.Lock()
+        self._stages: Dict[str, Dict[str, Any]] = {name: {"status": "pending"} for name in stages}
+        self.started_at = time.time()
+        self.finished = False
+        self.ready = False
+        self.total_seconds = None
+
+    @contextmanager
+    def stage(self, name: str):
+        """Marks a stage running for the duration of the block; failures are recorded and re-raised."""
+        start = time.perf_counter()
+        with self._lock:
+            self._stages.setdefault(name, {})
+            self._stages[name].update(status="running", started_at=time.time())
+        try:
+            yield
+        except Exception as e:
+            self._finish(name, "failed", start, error=str(e))
+            raise
+        self._finish(name, "done", start)
+
+    def _finish(self, name: str, status: str, start: float, **extra):
+        with self._lock:
+            self._stages[name].update(status=status, seconds=round(time.perf_counter() - start, 3), **extra)
+
+    def complete(self, ready: bool):
+        """Ends warm-up. ready is False when the full agent could not be built."""
+        with self._lock:
+            for info in self._stages.values():
+                if info["status"] == "pending":
+                    info.update(status="skipped", reason="not needed in fallback mode")
+            self.finished = True
+            self.ready = ready
+            self.total_seconds = round(time.time() - self.started_at, 3)
+
+    def report(self) -> Dict[str, Any]:
+        with self._lock:
+            stages = {name: dict(info) for name, info in self._stages.items()}
+            done = sum(info["status"] in ("done", "skipped", "failed") for info in stages.values())
+            return {
+                "finished": self.finished,
+                "ready": self.ready,
+                "progress": f"{done}/{len(stages)}",
+                "elapsed_seconds": self.total_seconds if self.finished else round(time.time() - self.started_at, 3),
+                "stages": stages,
+            }
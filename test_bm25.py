@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Tests for the BM25 keyword index: scoring, persistence and the block-spilling build
+"""
+
+import math
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from bm25 import BM25Index, tokenize
+
+CORPUS = [
+    ("n1", "Graph neural networks for molecule property prediction"),
+    ("n2", "Neural networks neural networks neural networks"),
+    ("n3", "Protein folding with attention"),
+    ("n4", "The of and"),  # only stopwords: not indexed
+    ("n5", "Attention is all you need for translation of long documents about attention"),
+]
+
+class TokenizeTest(unittest.TestCase):
+    def test_lowercases_and_drops_stopwords(self):
+        self.assertEqual(tokenize("The GNN-2 of Proteins"), ["gnn", "2", "proteins"])
+
+class BM25ScoringTest(unittest.TestCase):
+    def setUp(self):
+        self.index = BM25Index.from_texts(CORPUS)
+
+    def test_skips_nodes_without_tokens(self):
+        self.assertEqual(self.index.node_ids, ["n1", "n2", "n3", "n5"])
+
+    def test_matches_okapi_formula(self):
+        # "protein" occurs once in n3 only
+        docs = [tokenize(text) for _, text in CORPUS if tokenize(text)]
+        avgdl = sum(map(len, docs)) / len(docs)
+        idf = math.log1p((len(docs) - 1 + 0.5) / (1 + 0.5))
+        expected = idf * 1 * 2.5 / (1 + 1.5 * (1 - 0.75 + 0.75 * len(docs[2]) / avgdl))
+        [(node_id, score)] = self.index.search("protein", top_k=5)
+        self.assertEqual(node_id, "n3")
+        self.assertAlmostEqual(score, expected, places=5)
+
+    def test_term_frequency_ranks_higher(self):
+        results = self.index.search("neural networks", top_k=5)
+        self.assertEqual([node_id for node_id, _ in results], ["n2", "n1"])
+
+    def test_top_k_and_unknown_terms(self):
+        self.assertEqual(len(self.index.search("attention neural", top_k=1)), 1)
+        self.assertEqual(self.index.search("quasar", top_k=5), [])
+        self.assertEqual(self.index.search("the of", top_k=5), [])
+
+class BM25PersistenceTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def assertSameIndex(self, a, b):
+        self.assertEqual(a.node_ids, b.node_ids)
+        self.assertEqual(a.vocab, b.vocab)
+        for name in ("offsets", "doc_ids", "tfs", "doc_lens"):
+            np.testing.assert_array_equal(getattr(a, name), getattr(b, name))
+
+    def test_round_trip(self):
+        index = BM25Index.from_texts(CORPUS, k1=1.2, b=0.5)
+        self.assertFalse(BM25Index.exists(self.tmpdir))
+        index.persist(self.tmpdir)
+        self.assertTrue(BM25Index.exists(self.tmpdir))
+        loaded = BM25Index.load(self.tmpdir)
+        self.assertSameIndex(index, loaded)
+        self.assertEqual((loaded.k1, loaded.b), (1.2, 0.5))
+        self.assertEqual(loaded.search("attention", top_k=3), index.search("attention", top_k=3))
+
+    def test_spilled_build_matches_in_memory_build(self):
+        index = BM25Index.from_texts(CORPUS)
+        for block_postings in (1, 3, 1000):
+            built = BM25Index.build(CORPUS, self.tmpdir, block_postings=block_postings)
+            self.assertSameIndex(index, built)
+            self.assertEqual(built.search("neural attention", top_k=5), index.search("neural attention", top_k=5))
+
+    def test_empty_build(self):
+        index = BM25Index.build([], self.tmpdir)
+        self.assertEqual(len(index), 0)
+        self.assertEqual(index.search("anything", top_k=3), [])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Tests for the on-disk embedding cache and the CachedEmbedding wrapper
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+from llama_index.core.embeddings import MockEmbedding
+
+from embedding_cache import CachedEmbedding, EmbeddingCache, embedding_key
+
+class CountingEmbedding(MockEmbedding):
+    """MockEmbedding with distinct vectors per text, counting the texts it embeds"""
+
+    texts_embedded: int = 0
+    queries_embedded: int = 0
+
+    def _vector(self, text):
+        return [float(len(text)), float(sum(map(ord, text)) % 97), 1.0, 0.5][:self.embed_dim]
+
+    def _get_text_embeddings(self, texts):
+        self.texts_embedded += len(texts)
+        return [self._vector(t) for t in texts]
+
+    def _get_text_embedding(self, text):
+        return self._get_text_embeddings([text])[0]
+
+    def _get_query_embedding(self, query):
+        self.queries_embedded += 1
+        return self._vector(query)
+
+class EmbeddingCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def make_cache(self, model_name="model-a", dtype="float32"):
+        return EmbeddingCache(model_name, cache_dir=self.tmpdir, dtype=dtype)
+
+    def test_round_trip(self):
+        cache = self.make_cache()
+        keys = [embedding_key("alpha"), embedding_key("beta")]
+        self.assertEqual(cache.get_many(keys), [None, None])
+        cache.put_many(keys, [[1.0, 2.0, 3.0], [4.0, 5.0, 6.0]])
+        alpha, beta = cache.get_many(keys)
+        np.testing.assert_array_equal(alpha, [1.0, 2.0, 3.0])
+        np.testing.assert_array_equal(beta, [4.0, 5.0, 6.0])
+        self.assertEqual(cache.stats(), {"entries": 2, "hits": 2, "misses": 2})
+
+    def test_duplicate_keys_are_stored_once(self):
+        cache = self.make_cache()
+        key = embedding_key("alpha")
+        cache.put_many([key, key], [[1.0, 1.0], [2.0, 2.0]])
+        cache.put_many([key], [[3.0, 3.0]])
+        self.assertEqual(len(cache), 1)
+        np.testing.assert_array_equal(cache.get_many([key])[0], [1.0, 1.0])
+        self.assertEqual(os.path.getsize(os.path.join(cache.cache_dir, "keys.bin")), 16)
+
+    def test_reopen_from_disk(self):
+        self.make_cache(dtype="float16").put_many([embedding_key("alpha")], [[0.5, -0.25]])
+        reopened = self.make_cache()
+        self.assertEqual(reopened.dtype, np.float16)  # the stored dtype wins
+        np.testing.assert_array_equal(reopened.get_many([embedding_key("alpha")])[0], [0.5, -0.25])
+
+    def test_rows_appended_by_another_instance_are_picked_up(self):
+        reader, writer = self.make_cache(), self.make_cache()
+        writer.put_many([embedding_key("first")], [[1.0, 0.0]])
+        self.assertIsNotNone(reader.get_many([embedding_key("first")])[0])
+        writer.put_many([embedding_key("second")], [[0.0, 1.0]])
+        np.testing.assert_array_equal(reader.get_many([embedding_key("second")])[0], [0.0, 1.0])
+        self.assertEqual(len(reader), 2)
+
+    def test_models_are_isolated(self):
+        self.make_cache("model-a").put_many([embedding_key("alpha")], [[1.0, 2.0]])
+        other = self.make_cache("org/model-b")
+        self.assertIsNone(other.get_many([embedding_key("alpha")])[0])
+        self.assertNotEqual(other.cache_dir, self.make_cache("model-a").cache_dir)
+
+    def test_query_and_text_keys_differ(self):
+        self.assertNotEqual(embedding_key("alpha"), embedding_key("alpha", kind="query"))
+
+class CachedEmbeddingTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.inner = CountingEmbedding(embed_dim=4)
+        self.cache = EmbeddingCache("counting", cache_dir=self.tmpdir)
+        self.embed_model = CachedEmbedding(self.inner, cache=self.cache, query_cache_size=2)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_text_miss_then_hit(self):
+        first = self.embed_model.get_text_embedding_batch(["alpha", "beta"])
+        self.assertEqual(self.inner.texts_embedded, 2)
+        second = self.embed_model.get_text_embedding_batch(["beta", "alpha", "gamma"])
+        self.assertEqual(self.inner.texts_embedded, 3)  # only "gamma" was embedded
+        self.assertEqual(second[:2], [first[1], first[0]])
+        # A fresh wrapper over the same directory is served from disk
+        reopened = CachedEmbedding(CountingEmbedding(embed_dim=4), cache=EmbeddingCache("counting", cache_dir=self.tmpdir))
+        self.assertEqual(reopened.get_text_embedding("alpha"), first[0])
+        self.assertEqual(reopened.inner.texts_embedded, 0)
+
+    def test_queries_are_cached_in_memory_only(self):
+        first = self.embed_model.get_query_embedding("what is attention")
+        self.assertEqual(self.embed_model.get_query_embedding("what is attention"), first)
+        self.assertEqual(self.inner.queries_embedded, 1)
+        self.assertEqual(len(self.cache), 0)
+
+    def test_query_cache_is_bounded(self):
+        for query in ("q1", "q2", "q3"):
+            self.embed_model.get_query_embedding(query)
+        self.embed_model.get_query_embedding("q3")
+        self.assertEqual(self.inner.queries_embedded, 3)
+        self.embed_model.get_query_embedding("q1")  # evicted as least recently used
+        self.assertEqual(self.inner.queries_embedded, 4)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+Tests for the result fusion helpers used by hybrid and multi-collection retrieval
+"""
+
+import unittest
+
+from llama_index.core.schema import NodeWithScore, TextNode
+
+from retrieval import reciprocal_rank_fusion, similarity_fusion, weighted_score_fusion
+
+def ranked(*pairs):
+    return [NodeWithScore(node=TextNode(id_=node_id, text=node_id), score=score) for node_id, score in pairs]
+
+def ids(results):
+    return [n.node.node_id for n in results]
+
+class ReciprocalRankFusionTest(unittest.TestCase):
+    def test_nodes_in_both_lists_rank_first(self):
+        vector = ranked(("a", 0.9), ("b", 0.8), ("c", 0.7))
+        keyword = ranked(("c", 12.0), ("d", 9.0))
+        fused = reciprocal_rank_fusion([vector, keyword], k=60)
+        self.assertEqual(ids(fused)[:2], ["c", "a"])
+        # Second place in either list scores the same
+        self.assertEqual(set(ids(fused)[2:]), {"b", "d"})
+        self.assertEqual(fused[2].score, fused[3].score)
+        self.assertAlmostEqual(fused[0].score, 1 / 63 + 1 / 61)
+
+    def test_only_ranks_matter(self):
+        a = reciprocal_rank_fusion([ranked(("x", 100.0), ("y", 0.1))], k=1)
+        b = reciprocal_rank_fusion([ranked(("x", 0.5), ("y", 0.4))], k=1)
+        self.assertEqual([(n.node.node_id, n.score) for n in a], [(n.node.node_id, n.score) for n in b])
+
+    def test_weights_and_top_n(self):
+        first, second = ranked(("a", 1.0)), ranked(("b", 1.0))
+        self.assertEqual(ids(reciprocal_rank_fusion([first, second], weights=[0.2, 0.8])), ["b", "a"])
+        self.assertEqual(len(reciprocal_rank_fusion([first, second], top_n=1)), 1)
+
+class WeightedScoreFusionTest(unittest.TestCase):
+    def test_scores_are_min_max_normalised_per_list(self):
+        vector = ranked(("a", 0.9), ("b", 0.7), ("z", 0.5))
+        keyword = ranked(("b", 30.0), ("c", 10.0))
+        fused = weighted_score_fusion([vector, keyword], weights=[0.5, 0.5])
+        self.assertEqual(ids(fused)[:2], ["b", "a"])
+        self.assertEqual([round(n.score, 6) for n in fused], [0.75, 0.5, 0.0, 0.0])
+
+    def test_single_score_list_counts_fully(self):
+        fused = weighted_score_fusion([ranked(("a", 0.3))], top_n=5)
+        self.assertEqual(fused[0].score, 1.0)
+
+class SimilarityFusionTest(unittest.TestCase):
+    def test_weak_collection_does_not_tie_strong_one(self):
+        text = ranked(("t1", 0.82), ("t2", 0.75))
+        images = ranked(("i1", 0.21))
+        fused = similarity_fusion([text, images])
+        self.assertEqual(ids(fused), ["t1", "t2", "i1"])
+        self.assertEqual(fused[2].score, 0.21)
+
+    def test_keeps_best_score_and_top_n(self):
+        fused = similarity_fusion([ranked(("a", 0.4), ("b", 0.3)), ranked(("a", 0.6), ("c", 0.5))], top_n=2)
+        self.assertEqual([(n.node.node_id, n.score) for n in fused], [("a", 0.6), ("c", 0.5)])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Tests for the research job queue: cancellation and JOB_MAX_PENDING accounting
+"""
+
+import time
+import threading
+import unittest
+from unittest import mock
+
+import config
+from agent import run_subtasks
+from jobs import JobManager, QueueFullError
+from research_events import emit
+
+def wait_for(predicate, timeout=5.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return False
+
+class BlockingRunner:
+    """Emits progress until released, like an agent working through sub-tasks"""
+
+    def __init__(self):
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.exited = threading.Event()
+
+    def __call__(self, query):
+        self.started.set()
+        try:
+            while not self.release.wait(0.01):
+                pass
+            # The cancellation point: raises JobCancelled if the job was cancelled meanwhile
+            emit('token', text=query)
+            return f"answer to {query}"
+        finally:
+            self.exited.set()
+
+class JobCancelTest(unittest.TestCase):
+    def setUp(self):
+        self.runner = BlockingRunner()
+        self.manager = JobManager(self.runner, workers=1, max_pending=2, result_ttl=60)
+
+    def test_running_job_is_cancelling_until_worker_exits(self):
+        job = self.manager.submit("q1")
+        self.assertTrue(self.runner.started.wait(5))
+        self.manager.cancel(job.id)
+        self.assertEqual(job.status, "cancelling")
+        self.assertFalse(job.finished)
+        self.assertIsNone(job.finished_at)
+        self.runner.release.set()
+        self.assertTrue(wait_for(lambda: job.finished))
+        self.assertEqual(job.status, "cancelled")
+        self.assertIsNone(job.result)
+        self.assertIsNotNone(job.finished_at)
+
+    def test_cancelled_running_job_still_counts_toward_capacity(self):
+        running = self.manager.submit("q1")
+        self.assertTrue(self.runner.started.wait(5))
+        self.manager.submit("q2")
+        self.manager.cancel(running.id)
+        # Submit-then-cancel must not get past the bound while the worker is busy
+        with self.assertRaises(QueueFullError):
+            self.manager.submit("q3")
+        self.assertEqual(self.manager.pending_count(), 2)
+        self.runner.release.set()
+        self.assertTrue(wait_for(lambda: running.finished))
+        self.manager.submit("q3")
+
+    def test_queued_job_is_cancelled_immediately(self):
+        self.manager.submit("q1")
+        self.assertTrue(self.runner.started.wait(5))
+        queued = self.manager.submit("q2")
+        self.manager.cancel(queued.id)
+        self.assertEqual(queued.status, "cancelled")
+        self.assertTrue(queued.finished)
+        self.assertEqual(self.manager.pending_count(), 1)
+
+    def tearDown(self):
+        self.runner.release.set()
+
+class SubtaskRunner:
+    """Mimics a ReAct agent: tool errors become observations and the agent carries on"""
+
+    def __init__(self):
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.ran = []
+        self.tool_calls = 0
+
+    def subtask(self, query):
+        self.ran.append(query)
+        if query == "s1":
+            self.started.set()
+            self.release.wait(5)
+        return f"answer to {query}"
+
+    def __call__(self, query):
+        observations = []
+        for _ in range(2):  # a second tool call after the first observation
+            self.tool_calls += 1
+            try:
+                run_subtasks([{"query": q} for q in ("s1", "s2", "s3", "s4")], self.subtask)
+                observations.append("done")
+            except Exception as e:
+                observations.append(f"Error: {e}")
+        return "\n".join(observations)
+
+class SubtaskCancelTest(unittest.TestCase):
+    def cancel_during_first_subtask(self, concurrency):
+        runner = SubtaskRunner()
+        manager = JobManager(runner, workers=1, max_pending=2, result_ttl=60)
+        with mock.patch.object(config, "SUBTASK_CONCURRENCY", concurrency):
+            job = manager.submit("q")
+            self.assertTrue(runner.started.wait(5))
+            manager.cancel(job.id)
+            runner.release.set()
+            self.assertTrue(wait_for(lambda: job.finished))
+        self.assertEqual(job.status, "cancelled")
+        self.assertIsNone(job.result)
+        # The cancellation ends the run instead of becoming an observation
+        self.assertEqual(runner.tool_calls, 1)
+        return runner.ran
+
+    def test_no_further_subtasks_run_after_cancel(self):
+        self.assertEqual(self.cancel_during_first_subtask(concurrency=1), ["s1"])
+
+    def test_no_further_subtasks_start_after_cancel_when_fanned_out(self):
+        ran = self.cancel_during_first_subtask(concurrency=2)
+        # s2 may already be running alongside s1; nothing starts after the cancel
+        self.assertIn(ran, (["s1"], ["s1", "s2"], ["s2", "s1"]))
+
+if __name__ == "__main__":
+    unittest.main()
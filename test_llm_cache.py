@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Tests for the LLM completion cache: hits, TTL expiry, LRU eviction and the CachedLLM wrapper
+"""
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from llama_index.core.base.llms.types import ChatMessage, MessageRole
+from llama_index.core.llms import MockLLM
+
+from llm_cache import CachedLLM, LLMCompletionCache
+
+class CountingLLM(MockLLM):
+    """MockLLM that counts the calls reaching it"""
+
+    calls: int = 0
+
+    def complete(self, prompt, formatted=False, **kwargs):
+        self.calls += 1
+        return super().complete(prompt, formatted=formatted, **kwargs)
+
+    def stream_complete(self, prompt, formatted=False, **kwargs):
+        self.calls += 1
+        return super().stream_complete(prompt, formatted=formatted, **kwargs)
+
+class LLMCompletionCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, "llm_cache.sqlite")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_hit_and_miss(self):
+        cache = LLMCompletionCache(self.path, max_entries=10, ttl=3600)
+        key = cache.make_key("model", "complete", "prompt", {"temperature": 0.1})
+        self.assertIsNone(cache.get(key))
+        cache.put(key, "model", "answer")
+        self.assertEqual(cache.get(key), "answer")
+        self.assertNotEqual(key, cache.make_key("model", "complete", "prompt", {"temperature": 0.2}))
+        stats = cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"], stats["entries"]), (1, 1, 1))
+
+    def test_entries_expire_after_ttl(self):
+        cache = LLMCompletionCache(self.path, max_entries=10, ttl=60)
+        cache.put("k", "model", "answer")
+        with cache._conn:
+            cache._conn.execute("UPDATE completions SET created_at = ?", (time.time() - 120,))
+        self.assertIsNone(cache.get("k"))
+        self.assertEqual(cache.stats()["entries"], 0)
+
+    def test_least_recently_used_entry_is_evicted(self):
+        cache = LLMCompletionCache(self.path, max_entries=2, ttl=3600)
+        cache.put("a", "model", "A")
+        time.sleep(0.01)
+        cache.put("b", "model", "B")
+        time.sleep(0.01)
+        self.assertEqual(cache.get("a"), "A")  # "b" is now the least recently used
+        time.sleep(0.01)
+        cache.put("c", "model", "C")
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("a"), "A")
+        self.assertEqual(cache.stats()["evictions"], 1)
+
+    def test_persists_across_instances(self):
+        LLMCompletionCache(self.path).put("k", "model", "answer")
+        self.assertEqual(LLMCompletionCache(self.path).get("k"), "answer")
+
+    def test_empty_text_is_not_cached(self):
+        cache = LLMCompletionCache(self.path)
+        cache.put("k", "model", "")
+        self.assertEqual(cache.stats()["entries"], 0)
+
+class CachedLLMTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.inner = CountingLLM(max_tokens=8)
+        self.llm = CachedLLM(self.inner, LLMCompletionCache(os.path.join(self.tmpdir, "llm_cache.sqlite")))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_repeated_completion_is_served_from_cache(self):
+        first = self.llm.complete("summarise the paper")
+        second = self.llm.complete("summarise the paper")
+        self.assertEqual(first.text, second.text)
+        self.assertEqual(self.inner.calls, 1)
+        self.assertTrue(second.additional_kwargs["llm_cache_hit"])
+        self.llm.complete("a different prompt")
+        self.assertEqual(self.inner.calls, 2)
+
+    def test_stream_is_cached_once_complete(self):
+        streamed = list(self.llm.stream_complete("stream this"))[-1].text
+        replayed = list(self.llm.stream_complete("stream this"))
+        self.assertEqual(self.inner.calls, 1)
+        self.assertEqual(len(replayed), 1)
+        self.assertEqual(replayed[0].text, streamed)
+
+    def test_chat_hit(self):
+        messages = [ChatMessage(role=MessageRole.USER, content="hello")]
+        first = self.llm.chat(messages)
+        second = self.llm.chat(messages)
+        self.assertEqual(second.message.content, first.message.content)
+        self.assertTrue(second.additional_kwargs["llm_cache_hit"])
+
+if __name__ == "__main__":
+    unittest.main()
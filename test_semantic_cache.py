@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Tests for the semantic response cache: hits, TTL expiry, LRU eviction and invalidation
+"""
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from llama_index.core.base.response.schema import Response
+from llama_index.core.schema import NodeWithScore, TextNode
+
+import config
+from semantic_cache import SemanticCache, write_index_version
+
+def response(text):
+    return Response(response=text, source_nodes=[NodeWithScore(node=TextNode(text="source", metadata={"page": 1}),
+                                                               score=0.9)])
+
+class SemanticCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        patcher = mock.patch.object(config, "INDEX_VERSION_PATH", os.path.join(self.tmpdir, "index_version.json"))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        write_index_version()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def make_cache(self, **kwargs):
+        options = {"threshold": 0.95, "max_entries": 10, "ttl": 3600, **kwargs}
+        return SemanticCache(cache_dir=os.path.join(self.tmpdir, "cache"), **options)
+
+    def test_similar_query_hits_and_dissimilar_misses(self):
+        cache = self.make_cache()
+        cache.add("what is attention", [1.0, 0.0, 0.0], response("Attention weighs tokens."))
+        hit = cache.lookup([0.99, 0.05, 0.0])
+        self.assertEqual(hit.response, "Attention weighs tokens.")
+        self.assertTrue(hit.metadata["semantic_cache_hit"])
+        self.assertEqual(hit.source_nodes[0].node.metadata, {"page": 1})
+        self.assertIsNone(cache.lookup([0.0, 1.0, 0.0]))
+        self.assertEqual((cache.stats()["hits"], cache.stats()["misses"]), (1, 1))
+
+    def test_entries_expire_after_ttl(self):
+        cache = self.make_cache(ttl=60)
+        cache.add("q", [1.0, 0.0], response("old"))
+        for entry in cache._entries.values():
+            entry["created_at"] = time.time() - 120
+        self.assertIsNone(cache.lookup([1.0, 0.0]))
+        self.assertEqual(cache.stats()["entries"], 0)
+
+    def test_least_recently_used_entry_is_evicted(self):
+        cache = self.make_cache(max_entries=2)
+        cache.add("a", [1.0, 0.0, 0.0], response("A"))
+        cache.add("b", [0.0, 1.0, 0.0], response("B"))
+        self.assertIsNotNone(cache.lookup([1.0, 0.0, 0.0]))  # "a" is now the most recent
+        cache.add("c", [0.0, 0.0, 1.0], response("C"))
+        self.assertIsNone(cache.lookup([0.0, 1.0, 0.0]))
+        self.assertEqual(cache.lookup([1.0, 0.0, 0.0]).response, "A")
+
+    def test_persists_and_invalidates_on_rebuild(self):
+        cache = self.make_cache()
+        cache.add("q", [1.0, 0.0], response("persisted"))
+        self.assertEqual(self.make_cache().lookup([1.0, 0.0]).response, "persisted")
+
+        write_index_version()
+        self.assertIsNone(cache.lookup([1.0, 0.0]))
+        self.assertEqual(self.make_cache().stats()["entries"], 0)
+
+    def test_answer_from_before_a_rebuild_is_not_stored(self):
+        cache = self.make_cache()
+        version = cache.index_version
+        write_index_version()  # the index is rebuilt while the answer is computed
+        cache.add("q", [1.0, 0.0], response("stale"), index_version=version)
+        self.assertIsNone(cache.lookup([1.0, 0.0]))
+        self.assertEqual(self.make_cache().stats()["entries"], 0)
+
+    def test_rebuild_noticed_by_add_clears_old_entries(self):
+        cache = self.make_cache()
+        cache.add("old", [0.0, 1.0], response("old answer"))
+        write_index_version()
+        cache.add("q", [1.0, 0.0], response("unversioned"))
+        self.assertEqual(cache.stats()["entries"], 0)
+        self.assertIsNone(cache.lookup([0.0, 1.0]))
+
+    def test_lru_order_survives_reopen(self):
+        cache = self.make_cache(max_entries=2)
+        cache.add("a", [1.0, 0.0, 0.0], response("A"))
+        cache.add("b", [0.0, 1.0, 0.0], response("B"))
+        cache.lookup([1.0, 0.0, 0.0])
+        reopened = self.make_cache(max_entries=2)
+        reopened.add("c", [0.0, 0.0, 1.0], response("C"))
+        self.assertIsNone(reopened.lookup([0.0, 1.0, 0.0]))
+        self.assertEqual(reopened.lookup([1.0, 0.0, 0.0]).response, "A")
+
+    def test_empty_responses_are_not_cached(self):
+        cache = self.make_cache()
+        cache.add("q", [1.0, 0.0], Response(response=""))
+        self.assertEqual(cache.stats()["entries"], 0)
+
+if __name__ == "__main__":
+    unittest.main()
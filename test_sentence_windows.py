@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Tests for the regex sentence splitter and window resolution
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from llama_index.core.schema import Document, NodeRelationship, NodeWithScore, RelatedNodeInfo, TextNode
+
+from sentence_windows import (
+    WINDOW_END_KEY, WINDOW_START_KEY, DocumentTextStore, WindowResolver, split_sentence_spans,
+)
+
+def sentences(text):
+    return [text[start:end] for start, end in split_sentence_spans(text)]
+
+class SplitterTest(unittest.TestCase):
+    def test_spans_tile_the_text(self):
+        text = "First sentence. Second one!  Third?\n\nNew paragraph"
+        spans = split_sentence_spans(text)
+        self.assertEqual(spans[0][0], 0)
+        self.assertEqual(spans[-1][1], len(text))
+        for (_, end), (start, _) in zip(spans, spans[1:]):
+            self.assertEqual(end, start)
+        self.assertEqual(len(spans), 4)
+
+    def test_unit_after_number_ends_sentence(self):
+        self.assertEqual(sentences("The value is 3.5 m. Next one."), ["The value is 3.5 m. ", "Next one."])
+
+    def test_initials_do_not_end_sentence(self):
+        self.assertEqual(sentences("Proposed by J. R. Smith in 1990. It works."),
+                         ["Proposed by J. R. Smith in 1990. ", "It works."])
+
+    def test_abbreviations_do_not_end_sentence(self):
+        text = "See Fig. 3 and Eq. 2 of Smith et al. for details. Results follow."
+        self.assertEqual(sentences(text), ["See Fig. 3 and Eq. 2 of Smith et al. for details. ", "Results follow."])
+
+    def test_lowercase_continuation_is_not_a_boundary(self):
+        self.assertEqual(len(sentences("Values rose approx. ten percent. Then they fell.")), 2)
+
+    def test_decimals_and_closing_quotes(self):
+        self.assertEqual(sentences('Accuracy was 97.5 percent. He said "done." Then left.'),
+                         ["Accuracy was 97.5 percent. ", 'He said "done." ', "Then left."])
+
+    def test_blank_lines_split_without_punctuation(self):
+        self.assertEqual(len(sentences("A heading\n\nBody text follows")), 2)
+
+    def test_empty_and_whitespace_text(self):
+        self.assertEqual(split_sentence_spans(""), [])
+        self.assertEqual(split_sentence_spans("   \n\n  "), [])
+
+class WindowResolverTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.text_store = DocumentTextStore(os.path.join(self.tmpdir, "texts.sqlite"))
+        self.text = "One. Two. Three."
+        doc = Document(id_="doc", text=self.text)
+        self.text_store.put_documents([doc])
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_resolves_window_on_a_copy(self):
+        node = TextNode(text="Two. ", metadata={WINDOW_START_KEY: 0, WINDOW_END_KEY: len(self.text)})
+        node.relationships[NodeRelationship.SOURCE] = RelatedNodeInfo(node_id="doc")
+        resolved = WindowResolver(text_store=self.text_store).postprocess_nodes([NodeWithScore(node=node, score=0.5)])
+        self.assertEqual(resolved[0].node.get_content(), self.text)
+        self.assertEqual(resolved[0].score, 0.5)
+        # The original (e.g. the docstore's cached node) keeps its sentence
+        self.assertEqual(node.get_content(), "Two. ")
+
+    def test_nodes_without_window_pass_through(self):
+        node = TextNode(text="plain")
+        resolved = WindowResolver(text_store=self.text_store).postprocess_nodes([NodeWithScore(node=node, score=1.0)])
+        self.assertIs(resolved[0].node, node)
+
+if __name__ == "__main__":
+    unittest.main()
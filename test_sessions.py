@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Tests for research sessions: turn spilling and session eviction
+"""
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from sessions import SessionStore, valid_session_id
+
+def new_session_info():
+    return {"created_at": "now", "queries": [], "responses": [], "reasoning_steps": []}
+
+class SessionSpillTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.store = SessionStore(new_session_info, max_sessions=10, idle_ttl=3600, max_turns=2,
+                                  spill_dir=self.tmpdir)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_old_turns_spill_to_disk(self):
+        session = self.store.get_or_create("s1")
+        for i in range(5):
+            session.add_turn(f"q{i}", f"r{i}", {"step": i})
+        self.assertEqual(len(session), 5)
+        self.assertEqual(session.spilled_turns, 3)
+        self.assertTrue(os.path.exists(session.spill_path))
+
+        data = session.to_dict()
+        self.assertEqual(data["queries"], ["q0", "q1", "q2", "q3", "q4"])
+        self.assertEqual(data["reasoning_steps"][0], {"step": 0})
+        self.assertEqual(data["total_turns"], 5)
+        self.assertEqual(data["created_at"], "now")
+        self.assertEqual(session.to_dict(include_spilled=False)["responses"], ["r3", "r4"])
+
+    def test_invalid_ids_get_a_fresh_session(self):
+        self.assertFalse(valid_session_id("../etc/passwd"))
+        session = self.store.get_or_create("../etc/passwd")
+        self.assertTrue(valid_session_id(session.session_id))
+        self.assertNotEqual(session.session_id, "../etc/passwd")
+
+    def test_same_id_returns_same_session(self):
+        self.assertIs(self.store.get_or_create("s1"), self.store.get_or_create("s1"))
+
+class SessionEvictionTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_least_recently_used_is_evicted_beyond_cap(self):
+        store = SessionStore(new_session_info, max_sessions=2, idle_ttl=3600, max_turns=1, spill_dir=self.tmpdir)
+        first = store.get_or_create("a")
+        first.add_turn("q0", "r0", {})
+        first.add_turn("q1", "r1", {})
+        store.get_or_create("b")
+        store.get_or_create("a")  # "b" is now the least recently used
+        store.get_or_create("c")
+        self.assertIsNone(store.get("b"))
+        self.assertIsNotNone(store.get("a"))
+        self.assertEqual(store.stats()["evictions"], 1)
+
+        store.get_or_create("d")
+        self.assertIsNone(store.get("a"))
+        # Evicted sessions take their spill file with them
+        self.assertFalse(os.path.exists(first.spill_path))
+
+    def test_idle_sessions_are_evicted(self):
+        store = SessionStore(new_session_info, max_sessions=10, idle_ttl=60, spill_dir=self.tmpdir)
+        idle = store.get_or_create("idle")
+        idle.last_access = time.time() - 120
+        store.get_or_create("active")
+        self.assertIsNone(store.get("idle"))
+        self.assertEqual(len(store), 1)
+
+    def test_recreated_session_does_not_inherit_spilled_turns(self):
+        store = SessionStore(new_session_info, max_sessions=1, idle_ttl=3600, max_turns=1, spill_dir=self.tmpdir)
+        session = store.get_or_create("a")
+        session.add_turn("old0", "r", {})
+        session.add_turn("old1", "r", {})
+        store.get_or_create("b")
+        self.assertEqual(store.get_or_create("a").to_dict()["queries"], [])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,280 @@
+# /academic-rag-agent/vector_backends.py
+import os
+import json
+import shutil
+import threading
+from typing import Any, List, Optional
+
+import numpy as np
+from llama_index.core.bridge.pydantic import PrivateAttr
+from llama_index.core.schema import BaseNode
+from llama_index.core.vector_stores.types import BasePydanticVectorStore, VectorStoreQuery, VectorStoreQueryResult
+
+import config
+
+# Rows scored per step when dequantizing, so a query never materialises the full matrix
+_SCORE_CHUNK_ROWS = 65536
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1.0, norms)
+
+def quantize_int8(vectors: np.ndarray):
+    """Symmetric per-row int8 quantization. Returns the codes and the per-row scales."""
+    scales = np.abs(vectors).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    codes = np.round(vectors / scales[:, None]).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+def _top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the k highest scores, best first."""
+    if k >= len(scores):
+        return np.argsort(-scores)
+    top = np.argpartition(-scores, k - 1)[:k]
+    return top[np.argsort(-scores[top])]
+
+class NumpyVectorStore(BasePydanticVectorStore):
+    """
+    In-process vector store for small corpora: a normalized float32 matrix saved as .npy
+    and memory-mapped read-only at query time, searched with one matrix-vector product.
+    Worker processes mapping the same files share their pages through the OS cache.
+
+    With int8 enabled, queries scan an int8 copy (a quarter of the memory) and rescore
+    the best candidates against the float32 rows. Nodes live in the docstore, so only
+    IDs are kept here. Writes are buffered in memory until persist(), which publishes
+    a new generation of files atomically; once flush_rows rows are buffered, add()
+    persists on its own so ingestion memory doesn't grow with the corpus.
+    """
+
+    stores_text: bool = False
+    is_embedding_query: bool = True
+
+    collection_name: str
+    path: str
+    int8: bool = False
+    oversampling: float = 4.0
+    flush_rows: int = 0
+
+    _lock: threading.Lock = PrivateAttr()
+    _loaded: bool = PrivateAttr(default=False)
+    _vectors: Optional[np.ndarray] = PrivateAttr(default=None)
+    _codes: Optional[np.ndarray] = PrivateAttr(default=None)
+    _scales: Optional[np.ndarray] = PrivateAttr(default=None)
+    _ids: List[str] = PrivateAttr(default_factory=list)
+    _ref_doc_ids: List[Optional[str]] = PrivateAttr(default_factory=list)
+    _pending: List[np.ndarray] = PrivateAttr(default_factory=list)
+    _removed: set = PrivateAttr(default_factory=set)
+
+    def __init__(self, collection_name: str, path: str = None, int8: bool = None,
+                 oversampling: float = None, flush_rows: int = None, **kwargs: Any):
+        super().__init__(
+            collection_name=collection_name,
+            path=path or os.path.join(config.NUMPY_VECTOR_DIR, collection_name),
+            int8=config.NUMPY_VECTOR_INT8 if int8 is None else int8,
+            oversampling=oversampling or config.NUMPY_VECTOR_OVERSAMPLING,
+            flush_rows=config.NUMPY_VECTOR_FLUSH_ROWS if flush_rows is None else flush_rows,
+            **kwargs,
+        )
+        self._lock = threading.Lock()
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "NumpyVectorStore"
+
+    @property
+    def client(self) -> Any:
+        return None
+
+    @staticmethod
+    def exists(collection_name: str, path: str = None) -> bool:
+        path = path or os.path.join(config.NUMPY_VECTOR_DIR, collection_name)
+        return os.path.exists(os.path.join(path, "meta.json"))
+
+    def _file(self, generation: int, suffix: str) -> str:
+        return os.path.join(self.path, f"{generation}.{suffix}")
+
+    def _read_meta(self) -> Optional[dict]:
+        meta_path = os.path.join(self.path, "meta.json")
+        if not os.path.exists(meta_path):
+            return None
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def _load(self):
+        """Memory-maps the current generation. Caller holds the lock."""
+        if self._loaded:
+            return
+        self._vectors = self._codes = self._scales = None
+        meta = self._read_meta()
+        if meta:
+            generation = meta["generation"]
+            self._vectors = np.load(self._file(generation, "f32.npy"), mmap_mode="r")
+            if meta.get("int8"):
+                self._codes = np.load(self._file(generation, "i8.npy"), mmap_mode="r")
+                self._scales = np.load(self._file(generation, "scale.npy"))
+            with open(self._file(generation, "ids.json"), 'r', encoding='utf-8') as f:
+                ids = json.load(f)
+            self._ids, self._ref_doc_ids = ids["ids"], ids["ref_doc_ids"]
+        self._loaded = True
+
+    def add(self, nodes: List[BaseNode], **add_kwargs: Any) -> List[str]:
+        if not nodes:
+            return []
+        vectors = _normalize(np.asarray([node.get_embedding() for node in nodes], dtype=np.float32))
+        with self._lock:
+            self._load()
+            self._pending.append(vectors)
+            self._ids.extend(node.node_id for node in nodes)
+            self._ref_doc_ids.extend(node.ref_doc_id for node in nodes)
+            flush = self.flush_rows and sum(len(p) for p in self._pending) >= self.flush_rows
+        if flush:
+            self.persist()
+        return [node.node_id for node in nodes]
+
+    def delete(self, ref_doc_id: str, **delete_kwargs: Any) -> None:
+        with self._lock:
+            self._load()
+            self._removed.update(i for i, ref in enumerate(self._ref_doc_ids) if ref == ref_doc_id)
+
+    def delete_nodes(self, node_ids: Optional[List[str]] = None, filters=None, **delete_kwargs: Any) -> None:
+        targets = set(node_ids or [])
+        with self._lock:
+            self._load()
+            self._removed.update(i for i, node_id in enumerate(self._ids) if node_id in targets)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._vectors = self._codes = self._scales = None
+            self._ids, self._ref_doc_ids, self._pending, self._removed = [], [], [], set()
+            self._loaded = True
+            if os.path.exists(self.path):
+                shutil.rmtree(self.path)
+
+    def _parts(self) -> List[np.ndarray]:
+        """The stored and pending row blocks, in ID order. Caller holds the lock."""
+        stored = self._vectors is not None and len(self._vectors)
+        return ([self._vectors] if stored else []) + self._pending
+
+    def _iter_kept_rows(self, keep: np.ndarray):
+        """The kept rows, a chunk at a time, so the stored matrix is never copied whole."""
+        offset = 0
+        for part in self._parts():
+            rows = keep[(keep >= offset) & (keep < offset + len(part))] - offset
+            for start in range(0, len(rows), _SCORE_CHUNK_ROWS):
+                yield np.asarray(part[rows[start:start + _SCORE_CHUNK_ROWS]], dtype=np.float32)
+            offset += len(part)
+
+    def persist(self, persist_path: str = None, fs=None) -> None:
+        """
+        Writes buffered changes as a new generation; persist_path is ignored, the
+        store lives in its own directory. Readers holding the old files keep them.
+        """
+        with self._lock:
+            if not self._pending and not self._removed:
+                return
+            parts = self._parts()
+            keep = np.asarray([i for i in range(len(self._ids)) if i not in self._removed], dtype=np.int64)
+            dim = int(parts[0].shape[1]) if parts and len(keep) else 0
+            ids = [self._ids[i] for i in keep]
+            ref_doc_ids = [self._ref_doc_ids[i] for i in keep]
+
+            os.makedirs(self.path, exist_ok=True)
+            meta = self._read_meta()
+            previous = meta["generation"] if meta else None
+            generation = (previous or 0) + 1
+            # Rows are copied chunk by chunk into memory-mapped files
+            int8 = bool(self.int8 and len(ids))
+            vectors = np.lib.format.open_memmap(self._file(generation, "f32.npy"), mode="w+",
+                                                dtype=np.float32, shape=(len(ids), dim))
+            codes = np.lib.format.open_memmap(self._file(generation, "i8.npy"), mode="w+",
+                                              dtype=np.int8, shape=(len(ids), dim)) if int8 else None
+            scales = np.empty(len(ids), dtype=np.float32)
+            row = 0
+            for chunk in self._iter_kept_rows(keep):
+                vectors[row:row + len(chunk)] = chunk
+                if int8:
+                    codes[row:row + len(chunk)], scales[row:row + len(chunk)] = quantize_int8(chunk)
+                row += len(chunk)
+            vectors.flush()
+            del vectors
+            if int8:
+                codes.flush()
+                del codes
+                np.save(self._file(generation, "scale.npy"), scales)
+            with open(self._file(generation, "ids.json"), 'w', encoding='utf-8') as f:
+                json.dump({"ids": ids, "ref_doc_ids": ref_doc_ids}, f)
+            tmp_path = os.path.join(self.path, "meta.json.tmp")
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({"generation": generation, "count": len(ids), "dim": dim, "int8": int8}, f)
+            os.replace(tmp_path, os.path.join(self.path, "meta.json"))
+            if previous is not None:
+                for suffix in ("f32.npy", "i8.npy", "scale.npy", "ids.json"):
+                    if os.path.exists(self._file(previous, suffix)):
+                        os.remove(self._file(previous, suffix))
+
+            self._pending, self._removed = [], set()
+            self._loaded = False
+            self._load()
+
+    def _approximate_scores(self, query: np.ndarray) -> np.ndarray:
+        """Dot products of the query with the int8 rows, dequantized chunk by chunk."""
+        scores = np.empty(len(self._codes), dtype=np.float32)
+        for start in range(0, len(self._codes), _SCORE_CHUNK_ROWS):
+            chunk = self._codes[start:start + _SCORE_CHUNK_ROWS]
+            scores[start:start + len(chunk)] = (chunk.astype(np.float32) @ query) * self._scales[start:start + len(chunk)]
+        return scores
+
+    def query(self, query: VectorStoreQuery, **kwargs: Any) -> VectorStoreQueryResult:
+        """Cosine top-k; extra keyword arguments meant for other backends are ignored."""
+        if query.filters is not None:
+            raise ValueError("Metadata filters are not supported by the numpy vector store.")
+        vector = _normalize(np.asarray(query.query_embedding, dtype=np.float32))
+        k = query.similarity_top_k
+        with self._lock:
+            self._load()
+            # Buffered writes are only searchable once persisted
+            vectors, codes, ids, removed = self._vectors, self._codes, self._ids, self._removed
+            if vectors is None or not len(vectors) or not k:
+                return VectorStoreQueryResult(nodes=None, similarities=[], ids=[])
+            rows = len(vectors)
+            candidates = k + len(removed)
+            if codes is not None:
+                approx = self._approximate_scores(vector)
+                shortlist = _top_k(approx, min(rows, int(candidates * self.oversampling)))
+            else:
+                shortlist = None
+        if shortlist is not None:
+            # Rescore the shortlist against the full-precision rows
+            rows_searched = np.sort(shortlist)
+            scores = np.asarray(vectors[rows_searched]) @ vector
+        else:
+            rows_searched = np.arange(rows)
+            scores = np.asarray(vectors) @ vector
+        if query.node_ids:
+            allowed = set(query.node_ids)
+            scores = np.where([ids[row] in allowed for row in rows_searched], scores, -np.inf)
+        result_ids, similarities = [], []
+        for i in _top_k(scores, min(len(scores), candidates)):
+            row = int(rows_searched[i])
+            if row in removed or not np.isfinite(scores[i]):
+                continue
+            result_ids.append(ids[row])
+            similarities.append(float(scores[i]))
+            if len(result_ids) == k:
+                break
+        return VectorStoreQueryResult(nodes=None, similarities=similarities, ids=result_ids)
+
+def collection_exists(collection_name: str) -> bool:
+    """Whether ingestion has written collection_name on the selected backend."""
+    if config.VECTOR_BACKEND == "numpy":
+        return NumpyVectorStore.exists(collection_name)
+    from resources import get_qdrant_client
+    return get_qdrant_client().collection_exists(collection_name)
+
+def build_vector_store(collection_name: str, **qdrant_options: Any) -> BasePydanticVectorStore:
+    """The vector store for collection_name on the backend selected by VECTOR_BACKEND."""
+    if config.VECTOR_BACKEND == "numpy":
+        return NumpyVectorStore(collection_name)
+    from llama_index.vector_stores.qdrant import QdrantVectorStore
+    from resources import get_qdrant_client
+    return QdrantVectorStore(client=get_qdrant_client(), collection_name=collection_name, **qdrant_options)